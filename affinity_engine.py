@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+商品關聯引擎：以稀疏 發票×SKU 矩陣計算共現、支持度、置信度和提升度
+
+用法:
+    python affinity_engine.py "Online Retail.xlsx" --sku-file 彙總表.xlsx --top-skus 500
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from invoice_data import read_invoice_lines
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+# 預設索引文件
+AFFINITY_INDEX_FILE = 'affinity_index.npz'
+# 每個 SKU 保留的鄰居數
+DEFAULT_TOP_N = 10
+# 單個 SKU 最少出現的發票數（支持度剪枝）
+DEFAULT_MIN_ITEM_COUNT = 5
+# 一對 SKU 最少共同出現的發票數
+DEFAULT_MIN_PAIR_COUNT = 3
+# 每批計算的目標 SKU 數，控制 X[:, block].T @ X 的內存
+BLOCK_SIZE = 2048
+
+INDEX_COLUMNS = ['StockCode', 'Neighbor', 'Rank', 'Co_Count', 'Support', 'Confidence', 'Lift']
+# 保存索引時各列的類型（npz 以 allow_pickle=False 讀取，不能包含 object 數組）
+INDEX_DTYPES = {
+    'StockCode': str,
+    'Neighbor': str,
+    'Rank': np.int64,
+    'Co_Count': np.int64,
+    'Support': np.float64,
+    'Confidence': np.float64,
+    'Lift': np.float64
+}
+
+
+# 讀取發票明細
+def read_transactions(path, invoice_col='InvoiceNo', stock_code_col='StockCode', quantity_col='Quantity'):
+    """讀取發票明細，只保留需要的列並排除退貨（C 開頭發票或數量 <= 0）"""
+    df = read_invoice_lines(path, [invoice_col, stock_code_col, quantity_col])
+    df = df.dropna(subset=[invoice_col, stock_code_col])
+    invoice = df[invoice_col].astype(str)
+    is_sale = ~invoice.str.upper().str.startswith('C') & (pd.to_numeric(df[quantity_col], errors='coerce') > 0)
+    return pd.DataFrame({
+        'InvoiceNo': invoice[is_sale].to_numpy(),
+        'StockCode': df.loc[is_sale, stock_code_col].astype(str).str.strip().to_numpy()
+    })
+
+
+# 構建稀疏發票×SKU矩陣
+def build_basket_matrix(transactions, min_item_count=DEFAULT_MIN_ITEM_COUNT):
+    """構建二值矩陣（行=發票，列=SKU），並剪去低支持度的 SKU；保留所有發票（包括單品發票），
+    支持度、置信度和提升度的分母以全部發票計算"""
+    if sparse is None:
+        raise ImportError("商品關聯分析需要 scipy，請運行: pip install scipy")
+
+    invoice_codes, _ = pd.factorize(transactions['InvoiceNo'])
+    sku_codes, skus = pd.factorize(transactions['StockCode'])
+
+    # 整數矩陣：共現次數 X.T @ X 保持精確（float32 超過 2**24 後不再精確）
+    matrix = sparse.csr_matrix(
+        (np.ones(len(sku_codes), dtype=np.int32), (invoice_codes, sku_codes)),
+        shape=(invoice_codes.max() + 1 if len(invoice_codes) else 0, len(skus))
+    )
+    # 同一發票重複的 SKU 只計一次
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+
+    # 支持度剪枝
+    item_counts = np.asarray(matrix.sum(axis=0)).ravel()
+    keep_items = np.flatnonzero(item_counts >= min_item_count)
+    matrix = matrix[:, keep_items]
+
+    return matrix.tocsc(), np.asarray(skus)[keep_items].astype(str)
+
+
+# 統計發票總數和每個 SKU 的發票數
+def basket_statistics(basket_matrix):
+    """返回 (發票總數, 每個 SKU 出現的發票數)，以全部發票計算"""
+    item_counts = np.asarray(basket_matrix.sum(axis=0)).ravel().astype(np.int64)
+    return basket_matrix.shape[0], item_counts
+
+
+# 對每行取前 N 個元素
+def _top_n_per_row(rows, scores, top_n):
+    """向量化地在每行內按分數排序並保留前 N 個，返回被保留元素的位置"""
+    order = np.lexsort((-scores, rows))
+    sorted_rows = rows[order]
+    row_starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+    run_lengths = np.diff(np.r_[row_starts, len(sorted_rows)])
+    rank = np.arange(len(sorted_rows)) - np.repeat(row_starts, run_lengths)
+    keep = rank < top_n
+    return order[keep], rank[keep] + 1
+
+
+# 計算商品關聯
+def compute_affinity(basket_matrix, skus, target_skus=None, top_n=DEFAULT_TOP_N,
+                     min_pair_count=DEFAULT_MIN_PAIR_COUNT):
+    """以稀疏矩陣乘積計算目標 SKU 的共現、支持度、置信度和提升度，按提升度保留前 N 個鄰居"""
+    n_invoices, item_counts = basket_statistics(basket_matrix)
+    if n_invoices == 0 or len(skus) == 0:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    item_counts = item_counts.astype(np.float64)
+    if target_skus is None:
+        target_idx = np.arange(len(skus))
+    else:
+        target_idx = np.flatnonzero(np.isin(skus, np.asarray(target_skus, dtype=str)))
+
+    # 單品發票沒有共現，只在計算共現次數前剪去（分母仍包括這些發票）
+    basket_csr = basket_matrix.tocsr()
+    basket_csr = basket_csr[np.diff(basket_csr.indptr) >= 2]
+    basket_csc = basket_csr.tocsc()
+    results = []
+    for start in range(0, len(target_idx), BLOCK_SIZE):
+        block = target_idx[start:start + BLOCK_SIZE]
+        # (block × 發票) @ (發票 × SKU) = block × SKU 共現次數
+        co_counts = (basket_csc[:, block].T.tocsr() @ basket_csr).tocoo()
+
+        rows = co_counts.row
+        cols = co_counts.col
+        counts = co_counts.data
+        source = block[rows]
+        keep = (cols != source) & (counts >= min_pair_count)
+        rows, cols, counts, source = rows[keep], cols[keep], counts[keep], source[keep]
+        if len(rows) == 0:
+            continue
+
+        # 比率以 float64 計算，避免整數相乘溢出
+        ratio_counts = counts.astype(np.float64)
+        confidence = ratio_counts / item_counts[source]
+        lift = ratio_counts * n_invoices / (item_counts[source] * item_counts[cols])
+        kept, rank = _top_n_per_row(rows, lift, top_n)
+
+        results.append(pd.DataFrame({
+            'StockCode': skus[source[kept]],
+            'Neighbor': skus[cols[kept]],
+            'Rank': rank,
+            'Co_Count': counts[kept].astype(np.int64),
+            'Support': ratio_counts[kept] / n_invoices,
+            'Confidence': confidence[kept],
+            'Lift': lift[kept]
+        }))
+
+    if not results:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    return pd.concat(results, ignore_index=True).sort_values(['StockCode', 'Rank'], ignore_index=True)
+
+
+# 保存關聯索引
+def save_affinity_index(affinity_df, path=AFFINITY_INDEX_FILE, skus=None, n_invoices=None, item_counts=None):
+    """按 StockCode 排序後以 npz 保存，讀取時可直接二分查找；
+    同時保存計算比率所用的發票總數和每個 SKU 的發票數（Items / Item_Count / N_Invoices）"""
+    affinity_df = affinity_df.sort_values(['StockCode', 'Rank'], ignore_index=True)
+    arrays = {col: affinity_df[col].to_numpy(dtype=INDEX_DTYPES[col]) for col in INDEX_COLUMNS}
+    if skus is not None:
+        order = np.argsort(np.asarray(skus, dtype=str), kind='stable')
+        arrays['Items'] = np.asarray(skus, dtype=str)[order]
+        arrays['Item_Count'] = np.asarray(item_counts, dtype=np.int64)[order]
+        arrays['N_Invoices'] = np.int64(n_invoices)
+    np.savez_compressed(path, **arrays)
+
+
+# 讀取關聯索引
+def load_affinity_index(path=AFFINITY_INDEX_FILE):
+    """讀取 npz 關聯索引，文件不存在時返回 None"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as index:
+        return {col: index[col] for col in index.files}
+
+
+# 查詢某個 SKU 的鄰居
+def query_affinity(index, stock_code):
+    """以二分查找定位 SKU 的鄰居，返回按 Rank 排序的 DataFrame"""
+    if index is None:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    stock_codes = index['StockCode']
+    stock_code = str(stock_code).strip()
+    start = np.searchsorted(stock_codes, stock_code, side='left')
+    end = np.searchsorted(stock_codes, stock_code, side='right')
+    return pd.DataFrame({col: index[col][start:end] for col in INDEX_COLUMNS})
+
+
+# 從SKU表獲取熱門SKU
+def top_skus_from_sheet(sku_df, top_k, stock_code_col='StockCode', rank_cols=('Revenue', 'Quantity')):
+    """按 Revenue（或 Quantity）取 SKU 表中前 K 個 SKU"""
+    if sku_df is None or len(sku_df) == 0 or stock_code_col not in sku_df.columns:
+        return None
+    rank_col = next((col for col in rank_cols if col in sku_df.columns), None)
+    ranked = sku_df.nlargest(top_k, rank_col) if rank_col else sku_df.head(top_k)
+    return ranked[stock_code_col].astype(str).str.strip().tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="構建商品關聯（Frequently Bought Together）索引")
+    parser.add_argument('transactions', help="發票明細文件（.xlsx / .csv / .parquet）")
+    parser.add_argument('--output', default=AFFINITY_INDEX_FILE, help="輸出索引文件")
+    parser.add_argument('--sku-file', default=None, help="包含 SKU 工作表的彙總表，用於選取熱門 SKU")
+    parser.add_argument('--top-skus', type=int, default=0, help="只為 SKU 表中前 K 個 SKU 建索引（0 表示全部）")
+    parser.add_argument('--top-n', type=int, default=DEFAULT_TOP_N)
+    parser.add_argument('--min-item-count', type=int, default=DEFAULT_MIN_ITEM_COUNT)
+    parser.add_argument('--min-pair-count', type=int, default=DEFAULT_MIN_PAIR_COUNT)
+    args = parser.parse_args(argv)
+
+    print(f"讀取發票明細: {args.transactions}")
+    transactions = read_transactions(args.transactions)
+    basket_matrix, skus = build_basket_matrix(transactions, args.min_item_count)
+    print(f"發票數: {basket_matrix.shape[0]:,}  SKU 數: {basket_matrix.shape[1]:,}  非零元素: {basket_matrix.nnz:,}")
+
+    target_skus = None
+    if args.sku_file and args.top_skus > 0:
+        sku_df = pd.read_excel(args.sku_file, sheet_name='SKU')
+        target_skus = top_skus_from_sheet(sku_df, args.top_skus)
+
+    affinity_df = compute_affinity(basket_matrix, skus, target_skus, args.top_n, args.min_pair_count)
+    n_invoices, item_counts = basket_statistics(basket_matrix)
+    save_affinity_index(affinity_df, args.output, skus, n_invoices, item_counts)
+    print(f"已保存 {affinity_df['StockCode'].nunique():,} 個 SKU 的關聯索引: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+異常檢測引擎：以穩健統計量（median / MAD z-score、季節殘差）批量評分
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 修正 z-score 的常數（0.6745 = 標準常態分佈的 MAD）
+MAD_SCALE = 0.6745
+# MAD 為 0 時改用平均絕對偏差（1.2533 = sqrt(pi/2)）
+MEAN_AD_SCALE = 1.2533
+# 預設異常門檻（Iglewicz & Hoaglin 建議值）
+ANOMALY_Z_THRESHOLD = 3.5
+# 每批處理的序列數，控制內存峰值
+CHUNK_ROWS = 200_000
+
+
+# 計算穩健 z-score
+def robust_zscores(values):
+    """對二維矩陣按行計算 median/MAD z-score（支持 NaN）"""
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return robust_zscores(values[np.newaxis, :])[0]
+
+    has_nan = np.isnan(values).any()
+    median_fn = np.nanmedian if has_nan else np.median
+    mean_fn = np.nanmean if has_nan else np.mean
+
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        # 全為 NaN 的序列會觸發 "All-NaN slice" 警告，結果保持 NaN 即可
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = median_fn(values, axis=1, keepdims=True)
+        deviation = values - median
+        mad = median_fn(np.abs(deviation), axis=1, keepdims=True)
+        mean_ad = mean_fn(np.abs(deviation), axis=1, keepdims=True)
+
+        # MAD 為 0 時退回平均絕對偏差，兩者皆為 0 時 z-score 記為 0
+        z = np.where(mad > 0, MAD_SCALE * deviation / mad,
+                     deviation / (MEAN_AD_SCALE * mean_ad))
+    z[~np.isfinite(z) & ~np.isnan(values)] = 0.0
+    return z
+
+
+# 計算季節殘差
+def seasonal_residuals(values, period=12):
+    """扣除每個季節位置的中位數；期數不足兩個週期時退回扣除整體中位數"""
+    values = np.asarray(values, dtype=np.float64)
+    n_rows, n_cols = values.shape
+
+    if period is None or period < 2 or n_cols < 2 * period:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return values - np.nanmedian(values, axis=1, keepdims=True)
+
+    # 補齊到週期的整數倍，重塑為 (序列, 週期數, 季節位置)
+    n_cycles = -(-n_cols // period)
+    padded = np.full((n_rows, n_cycles * period), np.nan)
+    padded[:, :n_cols] = values
+    cycles = padded.reshape(n_rows, n_cycles, period)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        profile = np.nanmedian(cycles, axis=1)
+    seasonal = np.tile(profile, n_cycles)[:, :n_cols]
+    return values - seasonal
+
+
+# 將長表轉為序列矩陣
+def build_series_matrix(df, key_cols, time_col, value_col):
+    """用 factorize 將 (key, time, value) 長表轉為 序列 × 期間 矩陣"""
+    if isinstance(key_cols, str):
+        key_cols = [key_cols]
+
+    frame = df[key_cols + [time_col, value_col]].dropna(subset=key_cols + [time_col])
+    frame = frame.astype({time_col: str})
+
+    if len(key_cols) == 1:
+        key_codes, key_uniques = pd.factorize(frame[key_cols[0]], sort=True)
+        keys = pd.DataFrame({key_cols[0]: np.asarray(key_uniques)})
+    else:
+        key_index = pd.MultiIndex.from_frame(frame[key_cols])
+        key_codes, key_uniques = pd.factorize(key_index, sort=True)
+        keys = key_uniques.to_frame(index=False)
+    time_codes, periods = pd.factorize(frame[time_col], sort=True)
+
+    matrix = np.full((len(keys), len(periods)), np.nan)
+    values = pd.to_numeric(frame[value_col], errors='coerce').to_numpy(dtype=np.float64)
+    # 同一 (key, time) 有多行時累加；只計入有效數值，沒有有效數值的格子保持 NaN（不當作 0）
+    flat_index = key_codes * len(periods) + time_codes
+    valid = ~np.isnan(values)
+    sums = np.bincount(flat_index[valid], weights=values[valid], minlength=matrix.size)
+    seen = np.bincount(flat_index[valid], minlength=matrix.size) > 0
+    matrix.ravel()[seen] = sums[seen]
+
+    return keys, np.asarray(periods), matrix
+
+
+# 對序列矩陣批量評分
+def score_series_matrix(matrix, period=12, threshold=ANOMALY_Z_THRESHOLD):
+    """分批計算季節殘差 z-score，返回 (z 矩陣, 最大|z|, 最新 z, 異常期數)"""
+    n_rows = matrix.shape[0]
+    z = np.empty_like(matrix, dtype=np.float64)
+
+    for start in range(0, n_rows, CHUNK_ROWS):
+        block = matrix[start:start + CHUNK_ROWS]
+        z[start:start + CHUNK_ROWS] = robust_zscores(seasonal_residuals(block, period))
+
+    abs_z = np.abs(np.nan_to_num(z))
+    max_abs_z = abs_z.max(axis=1) if z.shape[1] > 0 else np.zeros(n_rows)
+    latest_z = z[:, -1] if z.shape[1] > 0 else np.zeros(n_rows)
+    anomaly_count = (abs_z > threshold).sum(axis=1)
+    return z, max_abs_z, latest_z, anomaly_count
+
+
+# 對長表的每條序列評分
+def score_series(df, key_cols, time_col, value_col, period=12, threshold=ANOMALY_Z_THRESHOLD):
+    """對每個 key 的時間序列評分，返回按異常分數排序的結果與逐期 z 長表"""
+    if df is None or len(df) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+
+    keys, periods, matrix = build_series_matrix(df, key_cols, time_col, value_col)
+    z, max_abs_z, latest_z, anomaly_count = score_series_matrix(matrix, period, threshold)
+
+    scores = keys.copy()
+    scores['Anomaly_Score'] = max_abs_z
+    scores['Latest_Z'] = latest_z
+    scores['Anomaly_Periods'] = anomaly_count
+    if z.shape[1] > 0:
+        peak_idx = np.abs(np.nan_to_num(z)).argmax(axis=1)
+        scores['Peak_Period'] = periods[peak_idx]
+    scores = scores.sort_values('Anomaly_Score', ascending=False).reset_index(drop=True)
+
+    # 逐期 z 長表，只保留超過門檻的格子
+    row_idx, col_idx = np.nonzero(np.abs(np.nan_to_num(z)) > threshold)
+    cells = keys.iloc[row_idx].reset_index(drop=True)
+    cells[time_col] = periods[col_idx]
+    cells[value_col] = matrix[row_idx, col_idx]
+    cells['Z_Score'] = z[row_idx, col_idx]
+    cells = cells.sort_values('Z_Score', key=np.abs, ascending=False).reset_index(drop=True)
+
+    return scores, cells
+
+
+# 對產品做橫截面評分
+def score_products(product_df, key_col, metric_cols, threshold=ANOMALY_Z_THRESHOLD):
+    """以各指標的跨產品穩健 z-score 評分，Anomaly_Score 為各指標最大|z|"""
+    if product_df is None or len(product_df) == 0 or not metric_cols:
+        return pd.DataFrame()
+
+    metrics = product_df[metric_cols].apply(pd.to_numeric, errors='coerce')
+    # 轉置為 指標 × 產品，一次計算所有指標
+    z = robust_zscores(metrics.to_numpy(dtype=np.float64).T).T
+    abs_z = np.abs(np.nan_to_num(z))
+
+    scores = product_df[[key_col]].copy()
+    for i, col in enumerate(metric_cols):
+        scores[col] = metrics[col].to_numpy()
+        scores[f'{col}_Z'] = z[:, i]
+    scores['Anomaly_Score'] = abs_z.max(axis=1)
+    scores['Driver'] = np.asarray(metric_cols)[abs_z.argmax(axis=1)]
+    scores['Is_Anomaly'] = scores['Anomaly_Score'] > threshold
+    return scores.sort_values('Anomaly_Score', ascending=False).reset_index(drop=True)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+位圖索引：為每個篩選維度的每個取值預先計算行位圖，篩選組合 = 位運算 AND + 掩碼聚合
+"""
+
+import numpy as np
+import pandas as pd
+
+# 支持交叉篩選的維度
+CROSS_FILTER_DIMENSIONS = ['Category', 'Country', 'YearMonth', 'IsGuest']
+
+
+# 構建位圖索引
+def build_bitmap_index(dims_df):
+    """dims_df 的每一列為一個維度，每個取值保存一條 packbits 壓縮的行位圖，另保存行編碼供分組聚合使用"""
+    n_rows = len(dims_df)
+    index = {'n_rows': n_rows, 'dims': {}}
+    for dim in dims_df.columns:
+        codes, values = pd.factorize(dims_df[dim].astype(str), sort=True)
+        bitmaps = np.empty((len(values), (n_rows + 7) // 8), dtype=np.uint8)
+        for i in range(len(values)):
+            bitmaps[i] = np.packbits(codes == i)
+        index['dims'][dim] = {
+            'values': np.asarray(values, dtype=str),
+            'codes': codes,
+            'bitmaps': bitmaps
+        }
+    return index
+
+
+# 計算篩選位圖
+def filter_bitmap(index, selections):
+    """同一維度內的多個取值做 OR，不同維度之間做 AND；沒有生效的篩選時返回 None"""
+    if index is None:
+        return None
+    result = None
+    for dim, selected in selections.items():
+        if not selected or dim not in index['dims']:
+            continue
+        entry = index['dims'][dim]
+        positions = np.flatnonzero(np.isin(entry['values'], np.asarray(selected, dtype=str)))
+        if len(positions) > 0:
+            dim_bits = np.bitwise_or.reduce(entry['bitmaps'][positions], axis=0)
+        else:
+            dim_bits = np.zeros(entry['bitmaps'].shape[1], dtype=np.uint8)
+        result = dim_bits if result is None else result & dim_bits
+    return result
+
+
+# 計算篩選掩碼
+def filter_mask(index, selections):
+    """返回長度為 n_rows 的布爾掩碼；沒有生效的篩選時返回 None"""
+    bits = filter_bitmap(index, selections)
+    if bits is None:
+        return None
+    return np.unpackbits(bits, count=index['n_rows']).astype(bool)
+
+
+# 掩碼分組求和
+def masked_group_sum(group_codes, values, mask, n_groups):
+    """只對掩碼為 True 的行按分組編碼求和"""
+    values = np.asarray(values, dtype=np.float64)
+    if mask is None:
+        mask = np.ones(len(values), dtype=bool)
+    return np.bincount(group_codes[mask], weights=np.nan_to_num(values[mask]), minlength=n_groups)
+
+
+# 獲取某個維度的所有取值
+def dimension_values(indexes, dim):
+    """合併多個索引中某個維度的所有取值（排序後去重）"""
+    values = [index['dims'][dim]['values'] for index in indexes if index is not None and dim in index['dims']]
+    if not values:
+        return []
+    return np.unique(np.concatenate(values)).tolist()
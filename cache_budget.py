@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+緩存內存預算：替代 st.cache_data 的函數結果緩存，限制全局和每個會話佔用的內存
+
+- 每個條目記錄估算的字節數、計算耗時、命中次數和引用它的會話
+- 淘汰順序為按重算成本加權的 LRU（GreedyDual-Size）：優先級 = 時鐘 + 計算耗時 / 字節數，
+  命中時刷新；淘汰優先級最低的條目，並把時鐘推進到該優先級，久未使用的條目優先級相對下降
+- 總字節數超過全局預算時淘汰條目；單個會話引用的字節數超過會話預算時，先解除該會話對低優先級條目的引用，
+  沒有會話引用的條目直接刪除（其他會話仍在使用的條目保留）。會話當前訪問的條目不會被解除，
+  因此超過會話預算的大結果（如大型 load_data()）仍會緩存，只是該會話不再保留其他條目
+- 只有超過全局預算的單個結果不緩存
+- 超過 SESSION_IDLE_SECONDS 沒有訪問的會話自動解除引用
+- 相同參數的並發調用只計算一次
+
+結果以淺拷貝返回（pandas >= 3 始終 Copy-on-Write，修改返回的 DataFrame 不會影響緩存中的數據）。
+與 st.cache_data 不同，函數內的 st.success 等元素只在實際計算時顯示，命中緩存時不會重放；
+需要每次 rerun 都顯示的提示應由函數返回，在緩存函數外顯示。
+"""
+
+import functools
+import hashlib
+import pickle
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    get_script_run_ctx = None
+
+# 全局內存預算（字節）
+GLOBAL_BUDGET_BYTES = 1024 * 1024 ** 2
+# 每個會話的內存預算（字節）
+SESSION_BUDGET_BYTES = 256 * 1024 ** 2
+# 會話超過此時間沒有訪問緩存時解除其引用
+SESSION_IDLE_SECONDS = 30 * 60
+# 計算耗時的下限（秒），避免極快的函數優先級為 0
+MIN_COST_SECONDS = 1e-3
+# 不在 Streamlit 會話中調用時（如命令行、測試）使用的會話 ID
+LOCAL_SESSION = 'local'
+# pandas >= 3 始終 Copy-on-Write，淺拷貝即可隔離調用方的修改
+_SHALLOW_COPY = int(pd.__version__.split('.')[0]) >= 3
+
+_LOCK = threading.RLock()
+_ENTRIES = {}
+_IN_FLIGHT = {}
+_SESSIONS = {}
+_STATS = {}
+_STATE = {
+    'clock': 0.0,
+    'bytes': 0,
+    'global_budget': GLOBAL_BUDGET_BYTES,
+    'session_budget': SESSION_BUDGET_BYTES
+}
+
+
+# 設置內存預算
+def set_budgets(global_bytes=None, session_bytes=None):
+    """修改全局 / 每個會話的預算（字節），並立即按新預算淘汰"""
+    with _LOCK:
+        if global_bytes is not None:
+            _STATE['global_budget'] = int(global_bytes)
+        if session_bytes is not None:
+            _STATE['session_budget'] = int(session_bytes)
+        for session_id in list(_SESSIONS):
+            _enforce_session_budget(session_id)
+        _enforce_global_budget()
+
+
+# 估算對象佔用的內存
+def estimate_bytes(value):
+    """DataFrame / Series 按 memory_usage(deep=True)，數組按 nbytes，容器遞歸累加"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(key) + estimate_bytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _update_hash(hasher, value):
+    """按內容更新哈希；DataFrame 按列名、類型和逐行哈希，無法識別的對象用 pickle"""
+    hasher.update(type(value).__name__.encode())
+    if isinstance(value, pd.DataFrame):
+        hasher.update(repr((list(value.columns), [str(dtype) for dtype in value.dtypes], value.shape)).encode())
+        try:
+            hasher.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        except TypeError:
+            hasher.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    elif isinstance(value, pd.Series):
+        hasher.update(repr((value.name, str(value.dtype), len(value))).encode())
+        try:
+            hasher.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        except TypeError:
+            hasher.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    elif isinstance(value, np.ndarray) and value.dtype.kind != 'O':
+        hasher.update(repr((value.dtype.str, value.shape)).encode())
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        hasher.update(str(len(value)).encode())
+        for key, item in value.items():
+            _update_hash(hasher, key)
+            _update_hash(hasher, item)
+    elif isinstance(value, (list, tuple)):
+        hasher.update(str(len(value)).encode())
+        for item in value:
+            _update_hash(hasher, item)
+    elif value is None or isinstance(value, (bool, int, float, str, bytes)):
+        hasher.update(repr(value).encode())
+    else:
+        hasher.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _copy_value(value):
+    """返回給調用方的副本，容器遞歸拷貝"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=not _SHALLOW_COPY)
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, dict):
+        return {key: _copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_value(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_copy_value(item) for item in value)
+    return value
+
+
+# 當前會話 ID
+def current_session_id():
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx is not None else None
+    return ctx.session_id if ctx is not None else LOCAL_SESSION
+
+
+def _function_stats(name):
+    return _STATS.setdefault(name, {
+        'hits': 0, 'misses': 0, 'evictions': 0, 'oversized': 0, 'compute_seconds': 0.0
+    })
+
+
+def _session_bytes(session_id):
+    return sum(entry['bytes'] for entry in _ENTRIES.values() if session_id in entry['sessions'])
+
+
+def _remove_entry(key):
+    entry = _ENTRIES.pop(key)
+    _STATE['bytes'] -= entry['bytes']
+    _function_stats(entry['function'])['evictions'] += 1
+
+
+def _enforce_session_budget(session_id, keep=None):
+    """會話引用的字節數超過預算時，按優先級從低到高解除引用；keep 為會話當前訪問的條目，不解除"""
+    used = _session_bytes(session_id)
+    if used <= _STATE['session_budget']:
+        return
+    owned = sorted(
+        (entry for entry in _ENTRIES.values() if session_id in entry['sessions'] and entry['key'] != keep),
+        key=lambda entry: entry['priority']
+    )
+    for entry in owned:
+        if used <= _STATE['session_budget']:
+            break
+        entry['sessions'].discard(session_id)
+        used -= entry['bytes']
+        if not entry['sessions']:
+            _remove_entry(entry['key'])
+
+
+def _enforce_global_budget():
+    """總字節數超過預算時淘汰優先級最低的條目，並把時鐘推進到其優先級"""
+    if _STATE['bytes'] <= _STATE['global_budget']:
+        return
+    for entry in sorted(_ENTRIES.values(), key=lambda entry: entry['priority']):
+        if _STATE['bytes'] <= _STATE['global_budget']:
+            break
+        _STATE['clock'] = max(_STATE['clock'], entry['priority'])
+        _remove_entry(entry['key'])
+
+
+def _release_idle_sessions(now):
+    idle = [session_id for session_id, last_seen in _SESSIONS.items() if now - last_seen > SESSION_IDLE_SECONDS]
+    for session_id in idle:
+        del _SESSIONS[session_id]
+        for entry in _ENTRIES.values():
+            entry['sessions'].discard(session_id)
+
+
+def _touch(entry, session_id, now):
+    entry['priority'] = _STATE['clock'] + entry['cost'] / max(entry['bytes'], 1)
+    entry['last_access'] = now
+    entry['sessions'].add(session_id)
+
+
+def _lookup(key, session_id):
+    """命中時刷新優先級和會話引用並返回條目，未命中返回 None"""
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        _SESSIONS[session_id] = now
+        _touch(entry, session_id, now)
+        _function_stats(entry['function'])['hits'] += 1
+        _enforce_session_budget(session_id, keep=key)
+        return entry
+
+
+def _store(key, name, value, cost, session_id):
+    with _LOCK:
+        now = time.time()
+        _SESSIONS[session_id] = now
+        _release_idle_sessions(now)
+        stats = _function_stats(name)
+        stats['misses'] += 1
+        stats['compute_seconds'] += cost
+        size = estimate_bytes(value)
+        # 單個結果超過全局預算時不緩存
+        if size > _STATE['global_budget']:
+            stats['oversized'] += 1
+            return
+        entry = {
+            'key': key, 'function': name, 'value': value, 'bytes': size,
+            'cost': max(cost, MIN_COST_SECONDS), 'created': now, 'sessions': set()
+        }
+        _touch(entry, session_id, now)
+        _ENTRIES[key] = entry
+        _STATE['bytes'] += size
+        _enforce_session_budget(session_id, keep=key)
+        _enforce_global_budget()
+
+
+# 帶內存預算的緩存裝飾器
+def budgeted_cache(func):
+    """用法與 @st.cache_data 相同；緩存鍵為函數名、函數代碼和參數內容的哈希"""
+    name = func.__qualname__
+    code_digest = hashlib.sha1(func.__code__.co_code).hexdigest()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        hasher = hashlib.sha1(f'{name}:{code_digest}'.encode())
+        _update_hash(hasher, args)
+        _update_hash(hasher, sorted(kwargs.items()))
+        key = hasher.hexdigest()
+        session_id = current_session_id()
+
+        entry = _lookup(key, session_id)
+        if entry is not None:
+            return _copy_value(entry['value'])
+        # 同一鍵只允許一個線程計算，其他線程等待後直接讀取結果
+        with _LOCK:
+            key_lock = _IN_FLIGHT.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = _lookup(key, session_id)
+            if entry is not None:
+                return _copy_value(entry['value'])
+            try:
+                start = time.perf_counter()
+                value = func(*args, **kwargs)
+                _store(key, name, value, time.perf_counter() - start, session_id)
+            finally:
+                with _LOCK:
+                    _IN_FLIGHT.pop(key, None)
+        return _copy_value(value)
+
+    wrapper.clear = functools.partial(clear_cache, name)
+    return wrapper
+
+
+# 清空緩存
+def clear_cache(function=None):
+    """清空全部或指定函數（__qualname__）的條目，統計數據保留"""
+    with _LOCK:
+        for key in [key for key, entry in _ENTRIES.items() if function is None or entry['function'] == function]:
+            entry = _ENTRIES.pop(key)
+            _STATE['bytes'] -= entry['bytes']
+
+
+# 緩存統計
+def cache_stats():
+    """返回 {'bytes', 'global_budget', 'session_budget', 'entries', 'hits', 'misses', 'hit_rate', 'evictions',
+    'functions': 每個函數的統計 DataFrame, 'sessions': 每個會話的統計 DataFrame}"""
+    with _LOCK:
+        now = time.time()
+        functions = []
+        for name, stats in sorted(_STATS.items()):
+            entries = [entry for entry in _ENTRIES.values() if entry['function'] == name]
+            calls = stats['hits'] + stats['misses']
+            functions.append({
+                'Function': name,
+                'Entries': len(entries),
+                'Bytes': sum(entry['bytes'] for entry in entries),
+                'Hits': stats['hits'],
+                'Misses': stats['misses'],
+                'Hit_Rate': stats['hits'] / calls if calls else np.nan,
+                'Avg_Compute_Seconds': stats['compute_seconds'] / stats['misses'] if stats['misses'] else np.nan,
+                'Evictions': stats['evictions'],
+                'Oversized': stats['oversized']
+            })
+        sessions = [
+            {
+                'Session': session_id,
+                'Entries': sum(1 for entry in _ENTRIES.values() if session_id in entry['sessions']),
+                'Bytes': _session_bytes(session_id),
+                'Idle_Seconds': now - last_seen
+            }
+            for session_id, last_seen in sorted(_SESSIONS.items(), key=lambda item: -item[1])
+        ]
+        hits = sum(stats['hits'] for stats in _STATS.values())
+        misses = sum(stats['misses'] for stats in _STATS.values())
+        return {
+            'bytes': _STATE['bytes'],
+            'global_budget': _STATE['global_budget'],
+            'session_budget': _STATE['session_budget'],
+            'entries': len(_ENTRIES),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else np.nan,
+            'evictions': sum(stats['evictions'] for stats in _STATS.values()),
+            'functions': pd.DataFrame(functions, columns=[
+                'Function', 'Entries', 'Bytes', 'Hits', 'Misses', 'Hit_Rate',
+                'Avg_Compute_Seconds', 'Evictions', 'Oversized'
+            ]),
+            'sessions': pd.DataFrame(sessions, columns=['Session', 'Entries', 'Bytes', 'Idle_Seconds'])
+        }
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+明細查詢索引：按 CustomerID / StockCode 排序的 Parquet 快照 + 偏移量索引
+
+每個 key 的所有行在快照中連續存放，查詢時只讀取覆蓋這些行的 row group。
+
+用法:
+    python drilldown_index.py "Online Retail.xlsx" --output-dir drilldown
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from invoice_data import normalize_customer_id, read_invoice_lines, require_pyarrow
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# 預設快照目錄
+DRILLDOWN_DIR = 'drilldown'
+# 每個 row group 的行數：越小則單次查詢讀取越少，文件元數據越大
+ROW_GROUP_SIZE = 16_384
+# 支持的查詢維度：名稱 -> 排序列
+DRILLDOWN_KEYS = {
+    'customer': 'CustomerID',
+    'product': 'StockCode'
+}
+
+
+def _snapshot_paths(output_dir, name):
+    return (os.path.join(output_dir, f'{name}.parquet'),
+            os.path.join(output_dir, f'{name}_index.npz'))
+
+
+# 構建單個維度的快照和索引
+def build_drilldown_snapshot(lines, key_col, output_dir=DRILLDOWN_DIR, name=None):
+    """按 key 排序寫出 Parquet 快照，並保存 key -> (起始行, 行數) 偏移量索引"""
+    require_pyarrow("明細查詢")
+    name = name or key_col
+    os.makedirs(output_dir, exist_ok=True)
+    snapshot_path, index_path = _snapshot_paths(output_dir, name)
+
+    # factorize(sort=True) 得到按 key 排序的整數編碼，對整數做穩定排序比直接排序字符串快
+    codes, keys = pd.factorize(lines[key_col].astype(str), sort=True)
+    order = np.argsort(codes, kind='stable')
+    sorted_lines = lines.iloc[order].reset_index(drop=True)
+
+    pq.write_table(
+        pa.Table.from_pandas(sorted_lines, preserve_index=False),
+        snapshot_path,
+        row_group_size=ROW_GROUP_SIZE
+    )
+
+    counts = np.bincount(codes, minlength=len(keys)).astype(np.int64)
+    starts = np.cumsum(counts) - counts
+    np.savez(index_path, keys=np.asarray(keys, dtype=str), starts=starts, counts=counts)
+    return snapshot_path, index_path
+
+
+# 構建所有維度的快照
+def build_drilldown_index(lines, output_dir=DRILLDOWN_DIR):
+    """為 DRILLDOWN_KEYS 中的每個維度構建快照，返回已構建的維度名稱"""
+    if 'CustomerID' in lines.columns:
+        lines = lines.assign(CustomerID=normalize_customer_id(lines['CustomerID']))
+    built = []
+    for name, key_col in DRILLDOWN_KEYS.items():
+        if key_col in lines.columns:
+            build_drilldown_snapshot(lines, key_col, output_dir, name)
+            built.append(name)
+    return built
+
+
+# 快照版本
+def drilldown_index_mtime(name, output_dir=DRILLDOWN_DIR):
+    """返回快照和索引文件中較新的修改時間，任一文件不存在時返回 None（供緩存鍵使用）"""
+    try:
+        return max(os.path.getmtime(path) for path in _snapshot_paths(output_dir, name))
+    except OSError:
+        return None
+
+
+# 打開快照
+def open_drilldown_index(name, output_dir=DRILLDOWN_DIR):
+    """加載偏移量索引並打開 Parquet 快照，文件不存在時返回 None"""
+    snapshot_path, index_path = _snapshot_paths(output_dir, name)
+    if not (os.path.exists(snapshot_path) and os.path.exists(index_path)):
+        return None
+    require_pyarrow("明細查詢")
+
+    parquet_file = pq.ParquetFile(snapshot_path)
+    metadata = parquet_file.metadata
+    row_group_rows = np.array([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+    with np.load(index_path, allow_pickle=False) as index:
+        return {
+            'keys': index['keys'],
+            'starts': index['starts'],
+            'counts': index['counts'],
+            'file': parquet_file,
+            # 每個 row group 的起始行號
+            'row_group_starts': np.r_[0, np.cumsum(row_group_rows)[:-1]] if len(row_group_rows) else np.array([0])
+        }
+
+
+# 查詢單個 key 的明細
+def lookup(index, key):
+    """二分查找 key 的偏移量，只讀取覆蓋這些行的 row group 並切出對應行"""
+    if index is None:
+        return pd.DataFrame()
+    key = str(key).strip()
+    pos = np.searchsorted(index['keys'], key)
+    if pos >= len(index['keys']) or index['keys'][pos] != key:
+        return pd.DataFrame(columns=index['file'].schema_arrow.names)
+
+    start = int(index['starts'][pos])
+    count = int(index['counts'][pos])
+    first_group = int(np.searchsorted(index['row_group_starts'], start, side='right') - 1)
+    last_group = int(np.searchsorted(index['row_group_starts'], start + count - 1, side='right') - 1)
+
+    table = index['file'].read_row_groups(list(range(first_group, last_group + 1)))
+    offset = start - int(index['row_group_starts'][first_group])
+    return table.slice(offset, count).to_pandas()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="構建 CustomerID / StockCode 明細查詢索引")
+    parser.add_argument('transactions', help="發票明細文件（.xlsx / .csv / .parquet）")
+    parser.add_argument('--output-dir', default=DRILLDOWN_DIR, help="快照輸出目錄")
+    args = parser.parse_args(argv)
+
+    print(f"讀取發票明細: {args.transactions}")
+    lines = read_invoice_lines(args.transactions)
+    built = build_drilldown_index(lines, args.output_dir)
+    print(f"已構建 {len(lines):,} 行的明細索引: {', '.join(built)} -> {args.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+圖表傳輸壓縮：把 Plotly 圖表中的數值數組轉為可以按二進制（base64 typed array）編碼的緊湊 NumPy 數組
+
+- 數值列表、object 數組轉為 NumPy 數組，由 plotly.io.to_json 以 typed array 編碼，不再逐個寫成文本
+- 整數用能容納取值範圍的最小整數類型，浮點數只在轉為 float32 後數值完全不變時降精度
+- hover 數據（customdata / text / hovertext）先四捨五入
+- 只保留圖表實際使用的 trace 類型和子圖類型的模板設置
+
+相同內容的圖表每次 rerun 生成的 JSON 完全相同，Streamlit 會按消息哈希只發送引用，瀏覽器直接使用已緩存的圖表。
+"""
+
+import numpy as np
+import pandas as pd
+
+# hover 數值保留的小數位數
+HOVER_DECIMALS = 2
+# 少於此長度的數組以文本發送更短
+MIN_TYPED_ARRAY_SIZE = 8
+# hover 顯示用的屬性
+HOVER_KEYS = {'customdata', 'text', 'hovertext'}
+# 不轉換的屬性
+SKIPPED_KEYS = {'geojson', 'range', 'ids'}
+# plotly.js typed array 支持的整數類型（按大小排列）
+INT_DTYPES = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32]
+# 模板中只對特定子圖類型生效的佈局設置
+SUBPLOT_TEMPLATE_KEYS = ['geo', 'mapbox', 'polar', 'scene', 'ternary']
+
+
+def _numeric_array(key, value):
+    """轉為數值數組；不是純數值時返回 None。只有 customdata 中的整數字符串（如 CustomerID）會轉為數字"""
+    array = np.asarray(value)
+    if array.dtype.kind in 'iuf':
+        return array
+    if array.dtype.kind not in 'OU' or array.size == 0:
+        return None
+
+    flat = pd.Series(array.ravel(), dtype=object)
+    is_text = flat.map(lambda item: isinstance(item, str))
+    if is_text.any():
+        if key != 'customdata' or not flat[is_text].str.fullmatch(r'-?[1-9]\d{0,8}|0').all():
+            return None
+    numeric = pd.to_numeric(flat, errors='coerce')
+    if numeric.isna().any():
+        return None
+    return numeric.to_numpy().reshape(array.shape)
+
+
+# 數組降精度
+def downcast_array(array):
+    """整數（含取值全為整數的浮點數）用最小的整數類型，其他浮點數只在 float32 能精確表示所有值時轉換"""
+    array = np.asarray(array)
+    if array.dtype.kind == 'f':
+        finite = np.isfinite(array)
+        if finite.all() and np.array_equal(array, np.round(array)) and np.abs(array).max(initial=0) <= np.iinfo(np.uint32).max:
+            array = array.astype(np.int64)
+        else:
+            with np.errstate(over='ignore'):
+                single = array.astype(np.float32)
+            if np.array_equal(single.astype(np.float64), array, equal_nan=True):
+                return single
+            return array
+
+    if array.dtype.kind in 'iu' and array.size > 0:
+        low, high = array.min(), array.max()
+        for dtype in INT_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return array.astype(dtype)
+    return array
+
+
+def _compact_props(props, hover_decimals):
+    """遞歸遍歷 trace 屬性，返回需要更新的屬性（無需更新時返回 None）"""
+    changes = {}
+    for key, value in props.items():
+        if key in SKIPPED_KEYS:
+            continue
+        if isinstance(value, dict):
+            nested = _compact_props(value, hover_decimals)
+            if nested:
+                changes[key] = nested
+            continue
+        if not isinstance(value, (list, tuple, np.ndarray)) or len(value) < MIN_TYPED_ARRAY_SIZE:
+            continue
+        array = _numeric_array(key, value)
+        if array is None:
+            continue
+        if key in HOVER_KEYS and array.dtype.kind == 'f':
+            array = np.round(array, hover_decimals)
+        compact = downcast_array(array)
+        if not isinstance(value, np.ndarray) or compact.dtype != value.dtype:
+            changes[key] = compact
+    return changes or None
+
+
+def _prune_template(fig):
+    """刪除模板中圖表沒有用到的 trace 類型和子圖類型設置"""
+    template = fig.layout.template.to_plotly_json()
+    if not template:
+        return
+    used_types = {trace.type for trace in fig.data}
+    template_data = template.get('data', {})
+    template['data'] = {trace_type: value for trace_type, value in template_data.items() if trace_type in used_types}
+    template_layout = template.get('layout', {})
+    for key in SUBPLOT_TEMPLATE_KEYS:
+        if key in template_layout and not any(key in trace for trace in fig.data):
+            del template_layout[key]
+    fig.layout.template = template
+
+
+def _cleared(changes):
+    return {key: _cleared(value) if isinstance(value, dict) else None for key, value in changes.items()}
+
+
+# 壓縮圖表
+def compact_figure(fig, hover_decimals=HOVER_DECIMALS):
+    """就地壓縮圖表的數值數組和模板，返回同一個圖表對象"""
+    for trace in fig.data:
+        changes = _compact_props(trace.to_plotly_json(), hover_decimals)
+        if changes:
+            # 新舊數值相等時 plotly 不會替換數組，需先清空再設置
+            trace.update(_cleared(changes))
+            trace.update(changes)
+    _prune_template(fig)
+    return fig
+
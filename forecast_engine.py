@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+預測引擎：批量擬合加法阻尼趨勢 ETS / Holt-Winters 模型並生成預測區間
+
+所有序列 × 所有參數組合在同一組 NumPy 數組上同時遞推，只在時間維度上循環；
+序列很多時按塊分發到進程池。擬合結果按數據版本（內容哈希）緩存到磁盤。
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+# 預設預測期數（月）
+FORECAST_HORIZON = 3
+# 季節週期；序列長度不足兩個週期時退回非季節模型
+SEASONAL_PERIOD = 12
+# 預測區間的 z 值（95%）
+INTERVAL_Z = 1.96
+# 緩存目錄
+FORECAST_CACHE_DIR = '.forecast_cache'
+# 緩存目錄最多保留的結果文件數（按最近使用時間保留最新的）
+FORECAST_CACHE_MAX_FILES = 64
+# 寫入中斷後殘留的臨時文件超過此時間（秒）時刪除
+STALE_TEMP_SECONDS = 3600
+# 緩存文件必須包含的數組
+CACHE_KEYS = ['forecast', 'lower', 'upper']
+# 序列數超過此值時使用進程池
+PARALLEL_MIN_SERIES = 512
+# 每塊的序列數（季節模型的狀態為 序列 × 參數組合 × 週期，需限制塊大小）
+CHUNK_SERIES = 512
+# 模型或參數網格變更時遞增，使舊緩存失效
+MODEL_VERSION = 1
+
+# 參數網格：alpha（水平）、beta（趨勢）、phi（阻尼）、gamma（季節）
+ALPHA_GRID = np.array([0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9])
+BETA_GRID = np.array([0.0, 0.05, 0.1, 0.2, 0.3])
+PHI_GRID = np.array([0.8, 0.9, 0.98, 1.0])
+GAMMA_GRID = np.array([0.05, 0.1, 0.2, 0.3])
+
+
+def _parameter_grid(seasonal):
+    grids = [ALPHA_GRID, BETA_GRID, PHI_GRID, GAMMA_GRID if seasonal else np.array([0.0])]
+    return [axis.ravel() for axis in np.meshgrid(*grids, indexing='ij')]
+
+
+def _fill_missing(values):
+    """按行向前填充 NaN，開頭的 NaN 用第一個有效值填充，全為 NaN 的行填 0"""
+    n_rows, n_cols = values.shape
+    valid = ~np.isnan(values)
+    last_valid = np.where(valid, np.arange(n_cols), 0)
+    np.maximum.accumulate(last_valid, axis=1, out=last_valid)
+    filled = values[np.arange(n_rows)[:, None], last_valid]
+    first_valid = np.where(valid.any(axis=1), valid.argmax(axis=1), 0)
+    first_value = values[np.arange(n_rows), first_valid]
+    filled = np.where(np.isnan(filled), first_value[:, None], filled)
+    return np.nan_to_num(filled)
+
+
+# 批量擬合
+def fit_ets_batch(values, horizon=FORECAST_HORIZON, period=SEASONAL_PERIOD):
+    """對 (序列 × 期數) 矩陣批量擬合，每條序列選取 SSE 最小的參數組合"""
+    values = _fill_missing(np.asarray(values, dtype=np.float64))
+    n_series, n_obs = values.shape
+    seasonal = period is not None and period >= 2 and n_obs >= 2 * period
+    alpha, beta, phi, gamma = _parameter_grid(seasonal)
+
+    # 初始狀態，形狀 (序列, 1)，之後廣播到 (序列, 參數組合)
+    if seasonal:
+        first_cycle = values[:, :period].mean(axis=1, keepdims=True)
+        second_cycle = values[:, period:2 * period].mean(axis=1, keepdims=True)
+        trend = (second_cycle - first_cycle) / period
+        # 第一個週期的均值對應週期中點，水平推到週期末；季節項為去趨勢後的偏差
+        offsets = np.arange(period) - (period - 1) / 2
+        level = first_cycle + trend * (period - 1) / 2
+        initial_season = values[:, :period] - (first_cycle + trend * offsets)
+        season = np.repeat(initial_season[:, None, :], len(alpha), axis=1)
+        start = period
+    else:
+        level = values[:, :1]
+        trend = values[:, 1:2] - values[:, :1] if n_obs > 1 else np.zeros((n_series, 1))
+        season = None
+        start = 1
+
+    level = np.broadcast_to(level, (n_series, len(alpha))).copy()
+    trend = np.broadcast_to(trend, (n_series, len(alpha))).copy()
+    sse = np.zeros((n_series, len(alpha)))
+
+    for t in range(start, n_obs):
+        y = values[:, t:t + 1]
+        seasonal_term = season[:, :, t % period] if seasonal else 0.0
+        damped_trend = phi * trend
+        error = y - (level + damped_trend + seasonal_term)
+        sse += error ** 2
+        new_level = alpha * (y - seasonal_term) + (1 - alpha) * (level + damped_trend)
+        trend = beta * (new_level - level) + (1 - beta) * damped_trend
+        if seasonal:
+            season[:, :, t % period] = gamma * (y - new_level) + (1 - gamma) * seasonal_term
+        level = new_level
+
+    # 每條序列的最優參數組合
+    best = sse.argmin(axis=1)
+    rows = np.arange(n_series)
+    best_alpha, best_beta, best_phi, best_gamma = alpha[best], beta[best], phi[best], gamma[best]
+    best_level, best_trend = level[rows, best], trend[rows, best]
+
+    steps = np.arange(1, horizon + 1)
+    # phi + phi^2 + ... + phi^h，形狀 (序列, 期數)
+    phi_sums = np.cumsum(best_phi[:, None] ** steps, axis=1)
+    forecast = best_level[:, None] + phi_sums * best_trend[:, None]
+    if seasonal:
+        forecast += season[rows, best][:, (n_obs + steps - 1) % period]
+
+    # 預測區間：sigma^2 * (1 + sum_{j<h} c_j^2)，c_j = alpha * (1 + beta * phi_j)
+    n_params = 4 if seasonal else 3
+    sigma2 = sse[rows, best] / max(n_obs - start - n_params, 1)
+    c = best_alpha[:, None] * (1 + best_beta[:, None] * phi_sums)
+    variance = sigma2[:, None] * (1 + np.cumsum(np.c_[np.zeros(n_series), c[:, :-1] ** 2], axis=1))
+    margin = INTERVAL_Z * np.sqrt(variance)
+
+    return {
+        'forecast': forecast,
+        'lower': forecast - margin,
+        'upper': forecast + margin,
+        'alpha': best_alpha,
+        'beta': best_beta,
+        'phi': best_phi,
+        'gamma': best_gamma,
+        'sigma': np.sqrt(sigma2)
+    }
+
+
+# 並行擬合
+def forecast_series(values, horizon=FORECAST_HORIZON, period=SEASONAL_PERIOD, max_workers=None):
+    """按塊擬合；序列數較少時在當前進程內完成，否則分發到進程池"""
+    values = np.asarray(values, dtype=np.float64)
+    chunks = np.array_split(values, max(-(-len(values) // CHUNK_SERIES), 1))
+    if len(values) < PARALLEL_MIN_SERIES or max_workers == 1:
+        results = [fit_ets_batch(chunk, horizon, period) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(fit_ets_batch, chunks, repeat(horizon), repeat(period)))
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+# 計算數據版本
+def dataset_version(names, values, horizon, period):
+    """以序列名稱、數值和模型設置的哈希作為數據版本"""
+    digest = hashlib.sha1()
+    digest.update(f'{MODEL_VERSION}|{horizon}|{period}|'.encode())
+    digest.update('\x1f'.join(map(str, names)).encode())
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+# 讀取緩存文件
+def _read_cache(path, shape):
+    """讀取緩存結果；文件不存在、損壞（如寫入中斷）或形狀不符時返回 None，視為未命中"""
+    try:
+        with np.load(path, allow_pickle=False) as cached:
+            result = {key: cached[key] for key in cached.files}
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+    if any(key not in result or result[key].shape != shape for key in CACHE_KEYS):
+        return None
+    # 刷新修改時間，清理時按最近使用保留
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return result
+
+
+# 寫入緩存文件
+def _write_cache(path, result):
+    """先寫入同一目錄的臨時文件再替換，並發會話或寫入中斷不會留下不完整的緩存文件"""
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **result)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    prune_forecast_cache(cache_dir)
+
+
+# 清理緩存目錄
+def prune_forecast_cache(cache_dir=FORECAST_CACHE_DIR, max_files=None):
+    """只保留最近使用的 max_files（預設 FORECAST_CACHE_MAX_FILES）個結果文件，並刪除過期的臨時文件"""
+    max_files = FORECAST_CACHE_MAX_FILES if max_files is None else max_files
+    now = time.time()
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir, '*.npz')) + glob.glob(os.path.join(cache_dir, '*.tmp')):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    results = sorted((entry for entry in entries if entry[1].endswith('.npz')), reverse=True)
+    stale = [path for _, path in results[max_files:]]
+    stale += [path for mtime, path in entries if path.endswith('.tmp') and now - mtime > STALE_TEMP_SECONDS]
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# 帶緩存的批量預測
+def cached_forecast(names, values, horizon=FORECAST_HORIZON, period=SEASONAL_PERIOD,
+                    cache_dir=FORECAST_CACHE_DIR, max_workers=None):
+    """數據版本不變時直接讀取磁盤緩存，返回長表：Series, Step, Forecast, Lower, Upper"""
+    values = np.asarray(values, dtype=np.float64)
+    version = dataset_version(names, values, horizon, period)
+    cache_path = os.path.join(cache_dir, f'{version}.npz')
+
+    result = _read_cache(cache_path, (len(names), horizon))
+    if result is None:
+        result = forecast_series(values, horizon, period, max_workers)
+        _write_cache(cache_path, result)
+
+    n_series = len(names)
+    return pd.DataFrame({
+        'Series': np.repeat(np.asarray(names, dtype=object), horizon),
+        'Step': np.tile(np.arange(1, horizon + 1), n_series),
+        'Forecast': result['forecast'].ravel(),
+        'Lower': result['lower'].ravel(),
+        'Upper': result['upper'].ravel()
+    })
+
+
+# 生成未來月份
+def future_months(last_month, horizon=FORECAST_HORIZON):
+    """從最後一個月（如 2011-11 或 2011/11）推算之後 horizon 個月的 YearMonth"""
+    last_period = pd.Period(str(last_month).replace('/', '-')[:7], freq='M')
+    return [str(last_period + step) for step in range(1, horizon + 1)]
@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+洞察規則引擎：規則以字典登記，按 (數據表, 規則類型) 分組後對彙總表批量評估
+
+同一數據表上的所有規則共用一次指標計算，每種規則類型把所有規則、所有月份 / 國家 / 細分
+放在同一個矩陣上一次比較，不逐條規則、逐個分組掃描數據表。
+
+規則類型:
+    threshold    指標與門檻比較（>、>=、<、<=、==、!=）
+    zscore       指標的穩健 z-score 超過門檻（可按 group_by 分組）
+    share        某列取值屬於 values 的行（或 weight 加權）占比與門檻比較（可按 group_by 分組）
+    top_k        指標最大（或最小）的 k 行
+    trend_break  最後一期相對前 window 期平均的變化超過門檻（可按 group_by 分組）
+
+自定義規則寫入 insight_rules.json（規則字典的列表），與內置規則同名時覆蓋內置規則，
+"enabled": false 可停用規則。
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from anomaly_engine import ANOMALY_Z_THRESHOLD, robust_zscores
+
+# 自定義規則文件
+INSIGHT_RULES_FILE = 'insight_rules.json'
+# 消息中最多列出的項目數
+MAX_ITEMS = 5
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal
+}
+
+# 每種規則類型的必填字段
+RULE_FIELDS = {
+    'threshold': ['metric', 'op', 'threshold'],
+    'zscore': ['metric', 'threshold'],
+    'share': ['column', 'values', 'op', 'threshold'],
+    'top_k': ['metric', 'k'],
+    'trend_break': ['metric', 'time', 'threshold']
+}
+COMMON_FIELDS = ['name', 'table', 'kind', 'title', 'message']
+# 規則可用的數據表（由儀表板的 compute_insights 整理）
+RULE_TABLES = ['mom', 'rfm', 'return_product', 'return_customer', 'sales_by_country', 'product_scores', 'country_cells']
+# 計算指標表達式時可能出現的錯誤（列不存在、語法錯誤、類型不支持等）
+METRIC_ERRORS = (KeyError, NameError, SyntaxError, TypeError, ValueError, AttributeError)
+
+# 內置規則（按顯示順序）
+# message 可用的字段：items（標籤列表）、count（命中數或匹配行數）、total（指標合計的絕對值或總行數）、value / share（第一個命中的值）
+INSIGHT_RULES = [
+    {
+        'name': 'return_rate_spike',
+        'title': '異常退貨高峰月份',
+        'icon': '⚠️',
+        'table': 'mom',
+        'kind': 'zscore',
+        'metric': 'Return_Orders / (Return_Orders + Normal_Orders) * 100',
+        'threshold': ANOMALY_Z_THRESHOLD,
+        'label': 'YearMonth',
+        'message': '{items} 的退貨率明顯高於平均水平'
+    },
+    {
+        'name': 'churn_risk',
+        'title': '客戶流失風險',
+        'icon': '📉',
+        'table': 'rfm',
+        'kind': 'share',
+        'column': 'Category',
+        'values': ['At Risk', 'Lost'],
+        'op': '>',
+        'threshold': 0.3,
+        'message': "{count} 個客戶（{share:.1%}）處於'At Risk'或'Lost'狀態，需要立即採取保留措施"
+    },
+    {
+        'name': 'top_loss_products',
+        'title': '高損失產品',
+        'icon': '💰',
+        'table': 'return_product',
+        'kind': 'top_k',
+        'metric': 'Return_Amount',
+        'k': 5,
+        'label': 'StockCode',
+        'message': '產品 {items} 造成了最多的退貨損失（總計 ${total:,.0f}），建議檢查產品質量或客戶服務流程'
+    },
+    {
+        'name': 'abnormal_products',
+        'title': '異常產品',
+        'icon': '🚨',
+        'table': 'product_scores',
+        'kind': 'threshold',
+        'metric': 'Anomaly_Score',
+        'op': '>',
+        'threshold': ANOMALY_Z_THRESHOLD,
+        'sort': 'desc',
+        'label': 'StockCode',
+        'message': '{count} 個產品的指標明顯偏離整體分佈，最異常的是 {items}'
+    },
+    {
+        'name': 'country_cell_anomalies',
+        'title': '國家銷售異常',
+        'icon': '🌍',
+        'table': 'country_cells',
+        'kind': 'top_k',
+        'metric': 'abs(Z_Score)',
+        'k': 3,
+        'label': '{Country} ({YearMonth})',
+        'message': '{items} 的銷售額明顯偏離該國的正常水平'
+    },
+    {
+        'name': 'country_revenue_drop',
+        'title': '國家銷售下滑',
+        'icon': '🔻',
+        'table': 'sales_by_country',
+        'kind': 'trend_break',
+        'metric': 'Revenue',
+        'time': 'YearMonth',
+        'group_by': 'Country',
+        'window': 3,
+        'threshold': 0.3,
+        'direction': 'drop',
+        'sort': 'asc',
+        'label': 'Country',
+        'message': '{items} 最近一個月的銷售額比前 3 個月平均下降超過 30%'
+    }
+]
+
+
+# 檢查規則
+def validate_rule(rule):
+    """返回錯誤信息列表（空列表表示規則有效）"""
+    if not isinstance(rule, dict):
+        return ["規則必須是字典"]
+    name = rule.get('name', '?')
+    errors = [f"規則 {name} 缺少字段: {field}" for field in COMMON_FIELDS if field not in rule]
+    kind = rule.get('kind')
+    if kind not in RULE_FIELDS:
+        errors.append(f"規則 {name} 的類型無效: {kind}（可用: {', '.join(RULE_FIELDS)}）")
+        return errors
+    errors += [f"規則 {name} 缺少字段: {field}" for field in RULE_FIELDS[kind] if field not in rule]
+    if 'table' in rule and rule['table'] not in RULE_TABLES:
+        errors.append(f"規則 {name} 的數據表無效: {rule['table']}（可用: {', '.join(RULE_TABLES)}）")
+    if 'op' in rule and rule['op'] not in OPERATORS:
+        errors.append(f"規則 {name} 的比較運算符無效: {rule['op']}")
+    if 'threshold' in rule and not _is_number(rule['threshold']):
+        errors.append(f"規則 {name} 的 threshold 必須是數值: {rule['threshold']!r}")
+    for field in ('k', 'window', 'min_hits', 'max_items'):
+        if field in rule and not (_is_integer(rule[field]) and rule[field] >= (0 if field == 'min_hits' else 1)):
+            errors.append(f"規則 {name} 的 {field} 必須是正整數: {rule[field]!r}")
+    if 'values' in rule and not isinstance(rule['values'], list):
+        errors.append(f"規則 {name} 的 values 必須是列表: {rule['values']!r}")
+    for field in ('metric', 'weight', 'column', 'group_by', 'time', 'label'):
+        if field in rule and rule[field] is not None and not isinstance(rule[field], str):
+            errors.append(f"規則 {name} 的 {field} 必須是字符串: {rule[field]!r}")
+    return errors
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# 加載規則
+def load_rules(path=INSIGHT_RULES_FILE, rules=None):
+    """合併內置規則和自定義規則文件，返回 (有效規則列表, 錯誤信息列表)"""
+    merged = {rule['name']: rule for rule in (INSIGHT_RULES if rules is None else rules)}
+    errors = []
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                custom_rules = json.load(f)
+        except (OSError, ValueError) as e:
+            return list(merged.values()), [f"無法讀取 {path}: {e}"]
+        for rule in custom_rules if isinstance(custom_rules, list) else [custom_rules]:
+            if isinstance(rule, dict) and rule.get('enabled', True) is False:
+                merged.pop(rule.get('name'), None)
+                continue
+            rule_errors = validate_rule(rule)
+            if rule_errors:
+                errors += rule_errors
+            else:
+                merged[rule['name']] = rule
+    return [rule for rule in merged.values() if rule.get('enabled', True)], errors
+
+
+# 編譯規則
+def compile_rules(rules):
+    """按 (數據表, 規則類型) 分組，並列出每個數據表需要計算的指標表達式（去重）"""
+    groups = {}
+    metrics = {}
+    for rule in rules:
+        groups.setdefault((rule['table'], rule['kind']), []).append(rule)
+        for key in ('metric', 'weight'):
+            if key in rule:
+                metrics.setdefault(rule['table'], {})[rule[key]] = None
+    return {
+        'groups': groups,
+        'metrics': {table: list(expressions) for table, expressions in metrics.items()}
+    }
+
+
+def _evaluate_metrics(df, expressions):
+    """計算數據表上的所有指標表達式，列名直接讀取，其他用 DataFrame.eval；
+    返回 (指標字典, {無法計算的表達式: 錯誤信息})"""
+    metrics = {}
+    failures = {}
+    for expression in expressions:
+        try:
+            values = df[expression] if expression in df.columns else df.eval(expression)
+            metrics[expression] = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+        except METRIC_ERRORS as e:
+            failures[expression] = f"{type(e).__name__}: {e}"
+    return metrics, failures
+
+
+def _group_codes(df, group_by):
+    """返回 (每行的分組編碼, 分組標籤)；沒有 group_by 時所有行屬於同一組"""
+    if not group_by:
+        return np.zeros(len(df), dtype=np.int64), np.array([None], dtype=object)
+    codes, labels = pd.factorize(df[group_by].astype(str), sort=True)
+    return codes, np.asarray(labels, dtype=object)
+
+
+def _row_labels(df, label, positions):
+    """label 為列名時取該列，為 '{列名}' 模板時逐行格式化（只處理命中的行）"""
+    rows = df.iloc[positions]
+    if label is None:
+        return rows.index.astype(str).tolist()
+    if label in df.columns:
+        return rows[label].astype(str).tolist()
+    try:
+        return [label.format(**row) for row in rows.to_dict('records')]
+    except (KeyError, IndexError, ValueError):
+        return rows.index.astype(str).tolist()
+
+
+def _row_hits(df, rule, positions, values, extra=None):
+    hits = pd.DataFrame({
+        'Label': _row_labels(df, rule.get('label'), positions),
+        'Value': values
+    })
+    for column, column_values in (extra or {}).items():
+        hits[column] = column_values
+    return hits
+
+
+def _sorted_hits(hits, rule):
+    if rule.get('sort') in ('asc', 'desc') and len(hits) > 0:
+        hits = hits.sort_values('Value', ascending=rule['sort'] == 'asc', kind='stable')
+    return hits.reset_index(drop=True)
+
+
+# 門檻規則
+def _evaluate_threshold(df, metrics, rules):
+    values = np.column_stack([metrics[rule['metric']] for rule in rules])
+    limits = np.array([rule['threshold'] for rule in rules], dtype=np.float64)
+    ops = np.array([rule['op'] for rule in rules])
+    hit = np.zeros(values.shape, dtype=bool)
+    # 相同運算符的規則在同一次比較中完成
+    with np.errstate(invalid='ignore'):
+        for op, compare in OPERATORS.items():
+            columns = ops == op
+            if columns.any():
+                hit[:, columns] = compare(values[:, columns], limits[columns])
+    results = {}
+    for j, rule in enumerate(rules):
+        positions = np.flatnonzero(hit[:, j])
+        results[rule['name']] = _row_hits(df, rule, positions, values[positions, j])
+    return results
+
+
+# 穩健 z-score 規則
+def _evaluate_zscore(df, metrics, rules):
+    results = {}
+    for group_by in dict.fromkeys(rule.get('group_by') for rule in rules):
+        group_rules = [rule for rule in rules if rule.get('group_by') == group_by]
+        expressions = list(dict.fromkeys(rule['metric'] for rule in group_rules))
+        codes, labels = _group_codes(df, group_by)
+        # 每行在組內的位置；所有指標 × 所有分組組成一個 (指標*分組) × 組內行數 的矩陣一次計算
+        positions = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+        cube = np.full((len(expressions), len(labels), positions.max(initial=-1) + 1), np.nan)
+        for m, expression in enumerate(expressions):
+            cube[m, codes, positions] = metrics[expression]
+        z = robust_zscores(cube.reshape(-1, cube.shape[2])).reshape(cube.shape)[:, codes, positions]
+
+        for rule in group_rules:
+            m = expressions.index(rule['metric'])
+            direction = rule.get('direction', 'high')
+            if direction == 'low':
+                hit = z[m] < -rule['threshold']
+            elif direction == 'both':
+                hit = np.abs(z[m]) > rule['threshold']
+            else:
+                hit = z[m] > rule['threshold']
+            rows = np.flatnonzero(hit)
+            results[rule['name']] = _row_hits(df, rule, rows, metrics[rule['metric']][rows], {'Z_Score': z[m, rows]})
+    return results
+
+
+# 占比規則
+def _evaluate_share(df, metrics, rules):
+    results = {}
+    for group_by in dict.fromkeys(rule.get('group_by') for rule in rules):
+        group_rules = [rule for rule in rules if rule.get('group_by') == group_by]
+        codes, labels = _group_codes(df, group_by)
+        weights = np.column_stack([
+            np.nan_to_num(metrics[rule['weight']]) if 'weight' in rule else np.ones(len(df))
+            for rule in group_rules
+        ])
+        members = np.column_stack([
+            df[rule['column']].astype(str).isin([str(value) for value in rule['values']]).to_numpy()
+            for rule in group_rules
+        ])
+        # 所有規則 × 所有分組的匹配量和總量一次聚合
+        matched = pd.DataFrame(members * weights).groupby(codes).sum().to_numpy()
+        total = pd.DataFrame(weights).groupby(codes).sum().to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(total > 0, matched / total, np.nan)
+        limits = np.array([rule['threshold'] for rule in group_rules], dtype=np.float64)
+
+        for j, rule in enumerate(group_rules):
+            with np.errstate(invalid='ignore'):
+                hit = OPERATORS[rule['op']](share[:, j], limits[j])
+            groups = np.flatnonzero(hit)
+            results[rule['name']] = pd.DataFrame({
+                'Label': [str(label) for label in labels[groups]],
+                'Value': share[groups, j],
+                'Count': matched[groups, j],
+                'Total': total[groups, j]
+            })
+    return results
+
+
+# Top-K 規則
+def _evaluate_top_k(df, metrics, rules):
+    values = np.column_stack([metrics[rule['metric']] for rule in rules])
+    signs = np.array([-1.0 if rule.get('sort') == 'asc' else 1.0 for rule in rules])
+    # 所有規則共用一次排序，NaN 排在最後
+    keys = np.where(np.isnan(values), -np.inf, values * signs)
+    order = np.argsort(-keys, axis=0, kind='stable')
+    results = {}
+    for j, rule in enumerate(rules):
+        positions = order[:int(rule['k']), j]
+        positions = positions[~np.isnan(values[positions, j])]
+        results[rule['name']] = _row_hits(df, rule, positions, values[positions, j])
+    return results
+
+
+# 趨勢突變規則
+def _evaluate_trend_break(df, metrics, rules):
+    results = {}
+    for group_by, time_col in dict.fromkeys((rule.get('group_by'), rule['time']) for rule in rules):
+        group_rules = [rule for rule in rules if (rule.get('group_by'), rule['time']) == (group_by, time_col)]
+        expressions = list(dict.fromkeys(rule['metric'] for rule in group_rules))
+        codes, labels = _group_codes(df, group_by)
+        time_codes, periods = pd.factorize(df[time_col].astype(str), sort=True)
+        n_cells = len(labels) * len(periods)
+        cells = codes * len(periods) + time_codes
+
+        # 指標 × 分組 × 期數 的立方體，同一格有多行時求和，沒有數據的格子為 NaN
+        present = np.bincount(cells, minlength=n_cells) > 0
+        cube = np.stack([
+            np.where(present, np.bincount(cells, weights=np.nan_to_num(metrics[expression]), minlength=n_cells), np.nan)
+            for expression in expressions
+        ]).reshape(len(expressions), len(labels), len(periods))
+
+        for rule in group_rules:
+            window = int(rule.get('window', 3))
+            if len(periods) < window + 1:
+                results[rule['name']] = pd.DataFrame(columns=['Label', 'Value'])
+                continue
+            series = cube[expressions.index(rule['metric'])]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                baseline = np.nanmean(series[:, -window - 1:-1], axis=1) if window > 0 else np.nan
+                change = series[:, -1] / baseline - 1
+                change[~np.isfinite(change)] = np.nan
+                if rule.get('direction', 'drop') == 'rise':
+                    hit = change >= rule['threshold']
+                else:
+                    hit = change <= -rule['threshold']
+            groups = np.flatnonzero(hit)
+            results[rule['name']] = pd.DataFrame({
+                'Label': [str(label) for label in labels[groups]],
+                'Value': change[groups],
+                'Period': periods[-1]
+            })
+    return results
+
+
+RULE_EVALUATORS = {
+    'threshold': _evaluate_threshold,
+    'zscore': _evaluate_zscore,
+    'share': _evaluate_share,
+    'top_k': _evaluate_top_k,
+    'trend_break': _evaluate_trend_break
+}
+
+
+def _format_message(rule, hits):
+    max_items = int(rule.get('max_items', MAX_ITEMS))
+    first_value = hits['Value'].iloc[0] if len(hits) > 0 else np.nan
+    fields = {
+        'items': ', '.join(hits['Label'].astype(str).head(max_items)),
+        'count': int(round(hits['Count'].sum())) if 'Count' in hits else len(hits),
+        'total': hits['Total'].sum() if 'Total' in hits else abs(hits['Value'].sum()),
+        'value': first_value,
+        'share': first_value
+    }
+    try:
+        return rule['message'].format(**fields)
+    except (KeyError, IndexError, ValueError):
+        return rule['message']
+
+
+# 批量評估規則
+def evaluate_rules(tables, rules=None):
+    """對 {表名: DataFrame} 評估所有規則，返回 (洞察列表, 警告列表)。
+    洞察按規則順序排列：[{'name', 'title', 'icon', 'message', 'hits'}]；數據表缺失的規則跳過，
+    無效的規則、指標無法計算或缺少列的規則跳過並記錄警告"""
+    warnings = []
+    valid_rules = []
+    for rule in INSIGHT_RULES if rules is None else rules:
+        rule_errors = validate_rule(rule)
+        if rule_errors:
+            warnings += rule_errors
+        else:
+            valid_rules.append(rule)
+    rules = valid_rules
+    plan = compile_rules(rules)
+    table_metrics = {}
+    hits_by_rule = {}
+    for (table_name, kind), group_rules in plan['groups'].items():
+        df = tables.get(table_name)
+        if df is None or len(df) == 0:
+            continue
+        if table_name not in table_metrics:
+            table_metrics[table_name] = _evaluate_metrics(df, plan['metrics'].get(table_name, []))
+        metrics, failures = table_metrics[table_name]
+        runnable = []
+        for rule in group_rules:
+            failed = [rule[key] for key in ('metric', 'weight') if key in rule and rule[key] in failures]
+            missing = [rule[key] for key in ('column', 'group_by', 'time') if rule.get(key) and rule[key] not in df.columns]
+            if failed:
+                warnings += [f"規則 {rule['name']} 的指標 {expression} 無法計算: {failures[expression]}" for expression in failed]
+            elif missing:
+                warnings.append(f"規則 {rule['name']} 所需的列不在數據表 {table_name} 中: {', '.join(missing)}")
+            else:
+                runnable.append(rule)
+        if runnable:
+            hits_by_rule.update(RULE_EVALUATORS[kind](df.reset_index(drop=True), metrics, runnable))
+
+    insights = []
+    for rule in rules:
+        hits = hits_by_rule.get(rule['name'])
+        if hits is None or len(hits) < int(rule.get('min_hits', 1)):
+            continue
+        hits = _sorted_hits(hits, rule)
+        insights.append({
+            'name': rule['name'],
+            'title': rule['title'],
+            'icon': rule.get('icon', '💡'),
+            'message': _format_message(rule, hits),
+            'hits': hits
+        })
+    return insights, warnings
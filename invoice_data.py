@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+發票明細讀取工具（供關聯分析、明細查詢等離線腳本共用）
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# 明細中作為字符串讀取的列，避免 StockCode/InvoiceNo 被解析為數字
+STRING_COLUMNS = ['InvoiceNo', 'StockCode', 'CustomerID']
+# 分塊讀取時每塊的行數
+CHUNK_ROWS = 1_000_000
+
+
+def require_pyarrow(feature):
+    """沒有安裝 pyarrow 時拋出 ImportError，feature 為需要 pyarrow 的功能名稱"""
+    if pq is None:
+        raise ImportError(f"{feature}需要 pyarrow，請運行: pip install pyarrow")
+
+
+# 轉換為 pyarrow 可寫入的表
+def arrow_safe(df, columns=None):
+    """object 列中含非字符串值（如同時有數字和字符串的 StockCode）時整列轉為字符串，缺失值保持缺失；
+    columns 為 None 時檢查所有 object 列，列名統一為字符串"""
+    if columns is None:
+        columns = [col for col in df.columns if df[col].dtype == object]
+    df = df.copy()
+    for col in columns:
+        values = df[col].dropna()
+        if len(values) > 0 and not values.map(lambda item: isinstance(item, str)).all():
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    df.columns = [str(col) for col in df.columns]
+    return df
+
+
+# 讀取發票明細
+def read_invoice_lines(path, columns=None):
+    """按擴展名讀取 .csv / .parquet / .xlsx 發票明細，columns 為 None 時讀取全部列"""
+    ext = os.path.splitext(path)[1].lower()
+    dtype = {col: str for col in STRING_COLUMNS if columns is None or col in columns}
+    if ext == '.csv':
+        return pd.read_csv(path, usecols=columns, dtype=dtype)
+    if ext == '.parquet':
+        df = pd.read_parquet(path, columns=columns)
+        return df.astype({col: str for col in dtype if col in df.columns})
+    return pd.read_excel(path, usecols=columns, dtype=dtype)
+
+
+# 分塊讀取發票明細
+def iter_invoice_chunks(path, columns=None, chunk_rows=CHUNK_ROWS):
+    """逐塊返回發票明細，CSV 和 Parquet 不會一次讀入整個文件；xlsx 不支持分塊，整體作為一塊返回"""
+    ext = os.path.splitext(path)[1].lower()
+    dtype = {col: str for col in STRING_COLUMNS if columns is None or col in columns}
+    if ext == '.csv':
+        yield from pd.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunk_rows)
+    elif ext == '.parquet' and pq is not None:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            df = batch.to_pandas()
+            yield df.astype({col: str for col in dtype if col in df.columns})
+    else:
+        yield read_invoice_lines(path, columns)
+
+
+# 統一 CustomerID 格式
+def normalize_customer_id(customer_ids):
+    """將 17850.0 之類的 ID 轉為 '17850'，缺失值記為 'GUEST'（與 RFM 表一致）"""
+    ids = customer_ids.astype(str).str.strip()
+    ids = ids.str.replace(r'\.0$', '', regex=True)
+    return ids.mask(customer_ids.isna() | ids.isin(['', 'nan', 'None']), 'GUEST')
+
+
+# 識別退貨行
+def is_return_line(invoice_no, quantity):
+    """InvoiceNo 以 C 開頭（credit note）或數量為負的行視為退貨"""
+    is_credit_note = invoice_no.astype(str).str.strip().str.upper().str.startswith('C').to_numpy(dtype=bool)
+    return is_credit_note | (np.nan_to_num(pd.to_numeric(quantity, errors='coerce').to_numpy(dtype=float)) < 0)
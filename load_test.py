@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+儀表板並發負載測試
+
+在臨時目錄生成合成數據，用多個工作進程（每個進程代表一個 Streamlit 服務進程，
+進程內以線程模擬多個並發會話，共享同一份函數結果緩存）通過 AppTest 執行交互腳本，
+報告 rerun 延遲的 p50/p95/p99 以及每個進程的 CPU 時間、RSS 和緩存佔用 / 命中率。
+
+用法:
+    python load_test.py --sessions 16 --workers 4 --iterations 3 --customers 50000
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'visualization_dashboard.py')
+
+RFM_CATEGORIES = ['Champions', 'Loyal', 'Potential Loyalist', 'At Risk', 'Lost']
+COUNTRIES = ['United Kingdom', 'Germany', 'France', 'EIRE', 'Spain', 'Netherlands', 'Belgium', 'Switzerland']
+MONTHS = [f'2011-{month:02d}' for month in range(1, 13)]
+
+# 交互腳本：每一步為 (動作, 控件 key, 值)，每一步之後執行一次 rerun 並計時
+INTERACTION_SCRIPTS = {
+    'analyst': [
+        ('open', None, None),
+        ('multiselect', 'cf_Category', ['At Risk', 'Lost']),
+        ('multiselect', 'cf_YearMonth', ['2011-10', '2011-11']),
+        ('checkbox', 'show_forecast', True),
+        ('rerun', None, None),
+        ('clear_filters', None, None)
+    ],
+    'explorer': [
+        ('open', None, None),
+        ('multiselect', 'cf_Country', ['France', 'Germany']),
+        ('multiselect', 'cf_IsGuest', ['Others']),
+        ('text_input', 'drilldown_key', '12346'),
+        ('rerun', None, None),
+        ('clear_filters', None, None)
+    ]
+}
+
+
+# 生成合成數據
+def generate_synthetic_data(workdir, n_customers=20_000, n_products=2_000, seed=0):
+    """在 workdir 中生成 彙總表.xlsx 和 Return and Abnormal_2011_11.xlsx"""
+    rng = np.random.default_rng(seed)
+    n_months = len(MONTHS)
+
+    mom_df = pd.DataFrame({
+        'YearMonth': MONTHS,
+        'Revenue': rng.uniform(5e5, 1.2e6, n_months),
+        'Normal_Orders': rng.integers(1_500, 3_000, n_months),
+        'Return_Orders': rng.integers(50, 200, n_months),
+        'Return': -rng.uniform(1e4, 5e4, n_months),
+        'Customer': rng.integers(800, 1_800, n_months)
+    })
+    mom_df['Revenue_Growth'] = mom_df['Revenue'].pct_change()
+    aov_arpu_df = pd.DataFrame({
+        'YearMonth': MONTHS,
+        'AOV': mom_df['Revenue'] / mom_df['Normal_Orders'],
+        'ARPU': mom_df['Revenue'] / mom_df['Customer']
+    })
+
+    customer_ids = (12_346 + np.arange(n_customers)).astype(str)
+    customer_ids[0] = 'GUEST'
+    rfm_df = pd.DataFrame({
+        'CustomerID': customer_ids,
+        'Recency': rng.integers(1, 365, n_customers),
+        'Frequency': rng.integers(1, 50, n_customers),
+        'Monetary': rng.gamma(2.0, 600.0, n_customers),
+        'Total_Score': rng.integers(3, 16, n_customers),
+        'Category': rng.choice(RFM_CATEGORIES, n_customers)
+    })
+
+    stock_codes = np.array([f'{20_000 + i}' for i in range(n_products)])
+    sku_df = pd.DataFrame({
+        'StockCode': stock_codes,
+        'Quantity': rng.integers(10, 5_000, n_products),
+        'Revenue': rng.gamma(2.0, 2_000.0, n_products)
+    })
+    sales_by_country_df = pd.DataFrame(
+        [(country, month, rng.uniform(1e4, 2e5)) for country in COUNTRIES for month in MONTHS],
+        columns=['Country', 'YearMonth', 'Revenue']
+    )
+
+    with pd.ExcelWriter(os.path.join(workdir, '彙總表.xlsx')) as writer:
+        mom_df.to_excel(writer, sheet_name='MOM', index=False)
+        aov_arpu_df.to_excel(writer, sheet_name='AOV_ARPU', index=False)
+        rfm_df.to_excel(writer, sheet_name='RFM', index=False)
+        sku_df.to_excel(writer, sheet_name='SKU', index=False)
+        sales_by_country_df.to_excel(writer, sheet_name='Sales by Country', index=False)
+
+    n_return_customers = max(n_customers // 10, 1)
+    return_product_df = pd.DataFrame({
+        'StockCode': stock_codes,
+        'Return_Count': rng.integers(1, 100, n_products),
+        'Return_Amount': rng.gamma(2.0, 300.0, n_products),
+        'Return_Rate': rng.beta(1.0, 8.0, n_products)
+    })
+    return_customer_df = pd.DataFrame({
+        'CustomerID': customer_ids[1:n_return_customers + 1],
+        'Return_Count': rng.integers(1, 30, n_return_customers),
+        'Return_Amount': rng.gamma(2.0, 200.0, n_return_customers),
+        'Return_Rate': rng.beta(1.0, 6.0, n_return_customers)
+    })
+    abnormal_product_df = pd.DataFrame({
+        'StockCode': stock_codes,
+        'Quantity': rng.integers(10, 1_000, n_products),
+        'Return_Rate': rng.beta(1.0, 8.0, n_products)
+    })
+    with pd.ExcelWriter(os.path.join(workdir, 'Return and Abnormal_2011_11.xlsx')) as writer:
+        return_product_df.to_excel(writer, sheet_name='Return analysis product', index=False)
+        return_customer_df.to_excel(writer, sheet_name='Return analysis customer', index=False)
+        abnormal_product_df.to_excel(writer, sheet_name='Abnormal analysis product', index=False)
+
+
+# 執行一個交互步驟
+def _apply_step(app, action, key, value):
+    """修改控件狀態；控件不存在時返回 False（例如未構建明細查詢索引）"""
+    if action in ('open', 'rerun'):
+        return True
+    if action == 'clear_filters':
+        for widget in app.multiselect:
+            if widget.key and widget.key.startswith('cf_'):
+                widget.set_value([])
+        return True
+    try:
+        widget = getattr(app, action)(key=key)
+    except KeyError:
+        return False
+    widget.set_value(value)
+    return True
+
+
+# 運行單個會話
+def _run_session(session_id, script, iterations, timeout, think_time, results, lock):
+    from streamlit.testing.v1 import AppTest
+
+    records = []
+    errors = 0
+    for _ in range(iterations):
+        app = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        for action, key, value in INTERACTION_SCRIPTS[script]:
+            if action != 'open' and not _apply_step(app, action, key, value):
+                continue
+            start = time.perf_counter()
+            try:
+                app.run()
+            except Exception:
+                errors += 1
+                continue
+            records.append((action, time.perf_counter() - start))
+            # 各區塊捕獲異常後以 st.error 顯示，不會出現在 app.exception 中
+            errors += len(app.exception) + len(app.error)
+            if think_time > 0:
+                time.sleep(think_time)
+    with lock:
+        results.append({'session': session_id, 'records': records, 'errors': errors})
+
+
+def _rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    return float('nan')
+
+
+# 工作進程：在同一進程內並發運行多個會話
+def run_worker(args):
+    worker_id, session_ids, script, iterations, timeout, think_time, workdir, cache_budget_mb, session_budget_mb = args
+    warnings.filterwarnings('ignore')
+    # 屏蔽每次 rerun 都會輸出的棄用警告（AppTest 運行時會重設 streamlit 的日誌級別）
+    logging.disable(logging.WARNING)
+    os.chdir(workdir)
+    # 與儀表板導入的是同一個模塊，預算對進程內所有會話生效
+    import cache_budget
+    cache_budget.set_budgets(
+        cache_budget_mb * 2 ** 20 if cache_budget_mb else None,
+        session_budget_mb * 2 ** 20 if session_budget_mb else None
+    )
+
+    results = []
+    lock = threading.Lock()
+    wall_start = time.perf_counter()
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    threads = [
+        threading.Thread(target=_run_session, args=(session_id, script, iterations, timeout, think_time, results, lock))
+        for session_id in session_ids
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    wall = time.perf_counter() - wall_start
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    cache = cache_budget.cache_stats()
+
+    return {
+        'worker': worker_id,
+        'sessions': results,
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'cpu_utilization': cpu / wall if wall > 0 else 0.0,
+        'rss_mb': _rss_mb(),
+        # Linux 上 ru_maxrss 的單位為 KB
+        'peak_rss_mb': usage_end.ru_maxrss / 1024,
+        'cache_mb': cache['bytes'] / 2 ** 20,
+        'cache_hit_rate': cache['hit_rate'],
+        'cache_evictions': cache['evictions']
+    }
+
+
+# 匯總延遲
+def summarize(worker_results):
+    """返回 (按步驟的延遲百分位表, 每個工作進程的資源表, 總體百分位)"""
+    rows = [
+        (action, latency)
+        for worker in worker_results
+        for session in worker['sessions']
+        for action, latency in session['records']
+    ]
+    latencies = pd.DataFrame(rows, columns=['Step', 'Latency'])
+    percentiles = {'p50': 50, 'p95': 95, 'p99': 99}
+
+    by_step = latencies.groupby('Step', sort=False)['Latency'].agg(
+        Count='count',
+        **{name: (lambda values, q=q: np.percentile(values, q)) for name, q in percentiles.items()}
+    ).reset_index() if len(latencies) else pd.DataFrame()
+    overall = {name: float(np.percentile(latencies['Latency'], q)) if len(latencies) else float('nan')
+               for name, q in percentiles.items()}
+
+    workers = pd.DataFrame([{
+        'Worker': worker['worker'],
+        'Sessions': len(worker['sessions']),
+        'Reruns': sum(len(session['records']) for session in worker['sessions']),
+        'Errors': sum(session['errors'] for session in worker['sessions']),
+        'Wall_s': worker['wall_seconds'],
+        'CPU_s': worker['cpu_seconds'],
+        'CPU_util': worker['cpu_utilization'],
+        'RSS_MB': worker['rss_mb'],
+        'Peak_RSS_MB': worker['peak_rss_mb'],
+        'Cache_MB': worker['cache_mb'],
+        'Cache_Hit_Rate': worker['cache_hit_rate'],
+        'Evictions': worker['cache_evictions']
+    } for worker in worker_results])
+    return by_step, workers, overall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="儀表板並發負載測試（AppTest + 合成數據）")
+    parser.add_argument('--sessions', type=int, default=8, help="並發會話總數")
+    parser.add_argument('--workers', type=int, default=2, help="工作進程數（每個進程模擬一個服務進程）")
+    parser.add_argument('--iterations', type=int, default=2, help="每個會話重複執行腳本的次數")
+    parser.add_argument('--script', choices=sorted(INTERACTION_SCRIPTS), default='analyst')
+    parser.add_argument('--customers', type=int, default=20_000, help="合成 RFM 客戶數")
+    parser.add_argument('--products', type=int, default=2_000, help="合成 SKU 數")
+    parser.add_argument('--think-time', type=float, default=0.0, help="每步之間的等待秒數")
+    parser.add_argument('--timeout', type=float, default=300.0, help="單次 rerun 超時秒數")
+    parser.add_argument('--workdir', default=None, help="數據目錄（預設為臨時目錄，已有數據時直接使用）")
+    parser.add_argument('--json', default=None, help="把原始結果寫入 JSON 文件")
+    parser.add_argument('--cache-budget-mb', type=float, default=None, help="每個工作進程的緩存全局預算（MB，預設見 cache_budget.py）")
+    parser.add_argument('--session-budget-mb', type=float, default=None, help="每個會話的緩存預算（MB）")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='dashboard_load_test_')
+    os.makedirs(workdir, exist_ok=True)
+    if not os.path.exists(os.path.join(workdir, '彙總表.xlsx')):
+        print(f"生成合成數據: {args.customers:,} 個客戶, {args.products:,} 個 SKU -> {workdir}")
+        generate_synthetic_data(workdir, args.customers, args.products)
+
+    workers = max(min(args.workers, args.sessions), 1)
+    session_groups = np.array_split(np.arange(args.sessions), workers)
+    tasks = [
+        (worker_id, group.tolist(), args.script, args.iterations, args.timeout, args.think_time, workdir,
+         args.cache_budget_mb, args.session_budget_mb)
+        for worker_id, group in enumerate(session_groups)
+    ]
+
+    print(f"運行 {args.sessions} 個會話 / {workers} 個工作進程，腳本: {args.script}，每會話 {args.iterations} 輪")
+    start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        worker_results = pool.map(run_worker, tasks)
+    elapsed = time.perf_counter() - start
+
+    by_step, worker_table, overall = summarize(worker_results)
+    print()
+    print("=" * 60)
+    print(f"總耗時: {elapsed:.1f}s")
+    print(f"rerun 延遲  p50: {overall['p50']:.3f}s  p95: {overall['p95']:.3f}s  p99: {overall['p99']:.3f}s")
+    print("=" * 60)
+    print()
+    print("按步驟:")
+    print(by_step.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+    print()
+    print("按工作進程:")
+    print(worker_table.to_string(index=False, float_format=lambda value: f'{value:.2f}'))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'overall': overall, 'elapsed_seconds': elapsed, 'workers': worker_results}, f, indent=2)
+        print(f"\n原始結果已保存: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+分區數據集：按 store=/year=/month= 存放各門店各期間的彙總表，manifest.json 記錄所有分區
+
+- 月度表（MOM、AOV_ARPU、Sales by Country）按 YearMonth 拆分到對應月份的分區
+- 快照表（RFM、SKU、退貨和異常分析）存放在其計算期間（as-of 月份）的分區
+- 讀取時只根據 manifest 篩選所選門店和期間的分區，只打開這些分區中的文件：
+  月度表合併期間內所有月份，快照表取截至期間結束月份最新的一期
+
+目錄結構:
+    dataset/manifest.json
+    dataset/store=UK/year=2011/month=11/mom.parquet
+    dataset/store=UK/year=2011/month=11/rfm.parquet
+
+用法:
+    python partitioned_dataset.py ingest --store UK 彙總表.xlsx "Return and Abnormal_2011_11.xlsx"
+    python partitioned_dataset.py list
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import pandas as pd
+
+from invoice_data import arrow_safe, require_pyarrow
+
+# 預設數據集目錄
+DATASET_DIR = 'dataset'
+MANIFEST_FILE = 'manifest.json'
+
+# 月度表：表名 -> 工作表名稱
+MONTHLY_TABLES = {
+    'mom': 'MOM',
+    'aov_arpu': 'AOV_ARPU',
+    'sales_by_country': 'Sales by Country'
+}
+# 快照表：表名 -> 工作表名稱
+SNAPSHOT_TABLES = {
+    'rfm': 'RFM',
+    'sku': 'SKU',
+    'return_product': 'Return analysis product',
+    'return_customer': 'Return analysis customer',
+    'abnormal_product': 'Abnormal analysis product'
+}
+MONTH_COLUMN = 'YearMonth'
+
+
+# 統一月份格式
+def normalize_month(value):
+    """'2011-11'、'2011/11'、'2011_11'、Timestamp 等轉為 '2011-11'，無法解析時返回 None"""
+    match = re.search(r'(\d{4})\D?(\d{1,2})', str(value))
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return None
+    return f'{match.group(1)}-{int(match.group(2)):02d}'
+
+
+# 分區目錄
+def partition_path(store, month):
+    """('UK', '2011-11') -> 'store=UK/year=2011/month=11'"""
+    year, month_number = month.split('-')
+    return f'store={store}/year={year}/month={month_number}'
+
+
+# 讀取 manifest
+def read_manifest(dataset_dir=DATASET_DIR):
+    """返回 manifest 字典；數據集不存在時返回 None"""
+    path = os.path.join(dataset_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(dataset_dir, manifest):
+    """先寫臨時文件再替換，讀取方不會讀到寫了一半的 manifest"""
+    path = os.path.join(dataset_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+# 寫入分區
+def ingest_tables(tables, store, period, dataset_dir=DATASET_DIR):
+    """tables 為 {表名: DataFrame}；月度表按 YearMonth 寫入各月份分區，快照表寫入 period 分區。
+    同一分區的同一張表會被替換，返回寫入的 (月份, 表名, 行數) 列表"""
+    require_pyarrow("分區數據集")
+    if not store or re.search(r'[/\\=]', store):
+        raise ValueError(f"門店名稱無效: {store}")
+    period = normalize_month(period)
+    if period is None:
+        raise ValueError("無法確定快照表的期間，請用 --period 指定（如 2011-11）")
+
+    # 按月份整理要寫入的文件
+    pending = {}
+    for name, df in tables.items():
+        if df is None or len(df) == 0:
+            continue
+        if name in MONTHLY_TABLES and MONTH_COLUMN in df.columns:
+            months = df[MONTH_COLUMN].map(normalize_month)
+            for month, part in df[months.notna()].groupby(months[months.notna()], sort=True):
+                pending.setdefault(month, {})[name] = part
+        elif name in SNAPSHOT_TABLES:
+            pending.setdefault(period, {})[name] = df
+
+    manifest = read_manifest(dataset_dir) or {'version': 0, 'partitions': []}
+    partitions = {(entry['store'], entry['month']): entry for entry in manifest['partitions']}
+    written = []
+    for month, month_tables in sorted(pending.items()):
+        relative_dir = partition_path(store, month)
+        os.makedirs(os.path.join(dataset_dir, relative_dir), exist_ok=True)
+        entry = partitions.setdefault((store, month), {
+            'store': store, 'month': month, 'path': relative_dir, 'tables': {}
+        })
+        for name, df in month_tables.items():
+            file_name = f'{name}.parquet'
+            arrow_safe(df).to_parquet(os.path.join(dataset_dir, relative_dir, file_name), index=False)
+            entry['tables'][name] = {'file': file_name, 'rows': len(df)}
+            written.append((month, name, len(df)))
+
+    manifest['version'] += 1
+    manifest['partitions'] = [partitions[key] for key in sorted(partitions)]
+    _write_manifest(dataset_dir, manifest)
+    return written
+
+
+# 從 Excel 工作簿寫入分區
+def ingest_workbooks(paths, store, period=None, dataset_dir=DATASET_DIR):
+    """讀取彙總表 / Return and Abnormal 工作簿中已知的工作表；period 未指定時從文件名（如 _2011_11）
+    或 MOM 的最後一個月推斷"""
+    sheet_tables = {sheet: name for name, sheet in {**MONTHLY_TABLES, **SNAPSHOT_TABLES}.items()}
+    tables = {}
+    for path in paths:
+        sheets = pd.read_excel(path, sheet_name=None)
+        for sheet, df in sheets.items():
+            if sheet in sheet_tables:
+                tables[sheet_tables[sheet]] = df
+        if period is None:
+            match = re.search(r'_(\d{4})_(\d{1,2})(?:\D|$)', os.path.basename(path))
+            if match:
+                period = f'{match.group(1)}-{match.group(2)}'
+    if period is None and 'mom' in tables and MONTH_COLUMN in tables['mom'].columns:
+        months = tables['mom'][MONTH_COLUMN].map(normalize_month).dropna()
+        period = months.max() if len(months) > 0 else None
+    return ingest_tables(tables, store, period, dataset_dir)
+
+
+# 列出門店
+def list_stores(manifest):
+    return sorted({entry['store'] for entry in manifest['partitions']})
+
+
+# 列出門店的月份
+def list_months(manifest, store):
+    return sorted(entry['month'] for entry in manifest['partitions'] if entry['store'] == store)
+
+
+# 分區剪枝
+def select_partitions(manifest, store, start, end):
+    """只根據 manifest 選出門店和期間（含首尾月份）內的分區，按月份排序"""
+    start, end = normalize_month(start), normalize_month(end)
+    return sorted(
+        (entry for entry in manifest['partitions']
+         if entry['store'] == store and start <= entry['month'] <= end),
+        key=lambda entry: entry['month']
+    )
+
+
+# 讀取分區中的表
+def read_partition_table(dataset_dir, partition, name):
+    """讀取單個分區的一張表；分區中沒有該表時返回 None"""
+    require_pyarrow("分區數據集")
+    table = partition['tables'].get(name)
+    if table is None:
+        return None
+    return pd.read_parquet(os.path.join(dataset_dir, partition['path'], table['file']))
+
+
+# 按門店和期間加載
+def load_partitioned(store, start, end, dataset_dir=DATASET_DIR, manifest=None, reader=None):
+    """返回與 load_data() 相同結構的字典。reader(dataset_dir, partition, name) 可替換為帶緩存的讀取函數"""
+    manifest = manifest or read_manifest(dataset_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"找不到分區數據集: {os.path.join(dataset_dir, MANIFEST_FILE)}")
+    reader = reader or read_partition_table
+    partitions = select_partitions(manifest, store, start, end)
+
+    data = {}
+    for name in MONTHLY_TABLES:
+        frames = [reader(dataset_dir, partition, name) for partition in partitions if name in partition['tables']]
+        data[name] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    # 快照表取截至期間結束月份最新的一期（期間內沒有快照時使用之前最近的一期）
+    history = select_partitions(manifest, store, '0000-01', end)
+    for name in SNAPSHOT_TABLES:
+        latest = next((partition for partition in reversed(history) if name in partition['tables']), None)
+        data[name] = reader(dataset_dir, latest, name) if latest is not None else pd.DataFrame()
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="管理按門店 / 年 / 月分區的儀表板數據集")
+    parser.add_argument('--dataset-dir', default=DATASET_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help="把彙總表和 Return and Abnormal 工作簿寫入分區")
+    ingest_parser.add_argument('workbooks', nargs='+', help="Excel 工作簿")
+    ingest_parser.add_argument('--store', required=True, help="門店名稱")
+    ingest_parser.add_argument('--period', default=None, help="快照表的期間（如 2011-11，預設從文件名或 MOM 推斷）")
+
+    subparsers.add_parser('list', help="列出所有分區")
+    args = parser.parse_args(argv)
+
+    if args.command == 'ingest':
+        written = ingest_workbooks(args.workbooks, args.store, args.period, args.dataset_dir)
+        for month, name, rows in written:
+            print(f"{partition_path(args.store, month)}/{name}.parquet: {rows:,} 行")
+        print(f"已寫入 {len(written)} 個文件: {args.dataset_dir}")
+        return 0
+
+    manifest = read_manifest(args.dataset_dir)
+    if manifest is None:
+        print(f"找不到分區數據集: {args.dataset_dir}")
+        return 1
+    for entry in manifest['partitions']:
+        tables = ', '.join(f"{name}({table['rows']:,})" for name, table in sorted(entry['tables'].items()))
+        print(f"{entry['path']}: {tables}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
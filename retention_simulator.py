@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+挽留活動模擬：按 RFM 類別設定喚回概率和消費提升，對每位客戶做蒙特卡羅抽樣，得到各細分的增量收入分佈
+
+每一塊 (抽樣次數 × 客戶) 矩陣一次生成：均勻隨機數 < 喚回概率 即被喚回，被喚回客戶的消費乘以
+平均為 1 的對數正態波動，再與客戶 Monetary 做一次矩陣乘法得到每次抽樣的收入。
+抽樣次數 × 客戶數較大時按抽樣塊分發到進程池；隨機種子按塊派生，結果與進程數無關。
+
+用法:
+    python retention_simulator.py 彙總表.xlsx --draws 5000 --segment "At Risk=0.25,0.3" --segment "Lost=0.1,0.2"
+"""
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# 預設活動設置：類別 -> 喚回概率、消費提升（被喚回客戶在活動期的消費 / 歷史 Monetary）
+DEFAULT_CAMPAIGN = {
+    'At Risk': {'reactivation': 0.25, 'uplift': 0.30},
+    'Lost': {'reactivation': 0.10, 'uplift': 0.20}
+}
+# 預設抽樣次數
+N_DRAWS = 2_000
+# 被喚回客戶消費波動（對數正態的 sigma，均值固定為 1）
+SPEND_SIGMA = 0.5
+# 每塊的抽樣次數
+DRAW_CHUNK = 250
+# 每個矩陣塊最多的單元格數（抽樣 × 客戶），限制內存
+BLOCK_CELLS = 4_000_000
+# 抽樣次數 × 客戶數超過此值時使用進程池
+PARALLEL_MIN_CELLS = 50_000_000
+# 分佈分位數
+QUANTILES = [0.05, 0.5, 0.95]
+
+# 進程池工作進程中的客戶數據（由 initializer 設置，避免每個任務重複傳輸）
+_WORKER_SEGMENTS = None
+
+
+# 按類別整理客戶消費
+def prepare_segments(rfm_df, category_col='Category', monetary_col='Monetary', customer_col=None):
+    """返回 {類別: Monetary 數組}；GUEST 客戶不參與挽留活動，負值和缺失值記為 0"""
+    df = rfm_df
+    if customer_col and customer_col in df.columns:
+        df = df[df[customer_col].astype(str).str.strip().str.upper() != 'GUEST']
+    monetary = pd.to_numeric(df[monetary_col], errors='coerce').fillna(0).clip(lower=0).to_numpy(dtype=np.float64)
+    categories = df[category_col].astype(str).to_numpy()
+    return {category: monetary[categories == category] for category in pd.unique(categories)}
+
+
+def _simulate_block(rng, monetary, probability, n_draws, spend_sigma):
+    """一塊客戶的 (抽樣 × 客戶) 喚回矩陣，返回每次抽樣的收入和喚回人數"""
+    reactivated = rng.random((n_draws, len(monetary)), dtype=np.float32) < probability
+    n_hits = int(reactivated.sum())
+    weights = np.zeros(reactivated.shape, dtype=np.float32)
+    if spend_sigma > 0:
+        # 只為被喚回的客戶生成消費波動
+        weights[reactivated] = rng.lognormal(-spend_sigma ** 2 / 2, spend_sigma, n_hits)
+    else:
+        weights[reactivated] = 1.0
+    return weights @ monetary.astype(np.float32), reactivated.sum(axis=1)
+
+
+# 模擬一塊抽樣
+def simulate_chunk(segments, probabilities, uplifts, n_draws, seed, spend_sigma=SPEND_SIGMA):
+    """segments 為各細分的 Monetary 數組列表，返回 (收入矩陣, 喚回人數矩陣)，形狀均為 (抽樣次數, 細分數)"""
+    if segments is None:
+        segments = _WORKER_SEGMENTS
+    rng = np.random.default_rng(seed)
+    revenue = np.zeros((n_draws, len(segments)))
+    customers = np.zeros((n_draws, len(segments)), dtype=np.int64)
+    block_size = max(BLOCK_CELLS // max(n_draws, 1), 1)
+    for j, monetary in enumerate(segments):
+        if probabilities[j] <= 0 or len(monetary) == 0:
+            continue
+        for start in range(0, len(monetary), block_size):
+            block_revenue, block_customers = _simulate_block(
+                rng, monetary[start:start + block_size], probabilities[j], n_draws, spend_sigma
+            )
+            revenue[:, j] += block_revenue
+            customers[:, j] += block_customers
+        revenue[:, j] *= uplifts[j]
+    return revenue, customers
+
+
+def _init_worker(segments):
+    global _WORKER_SEGMENTS
+    _WORKER_SEGMENTS = segments
+
+
+# 運行挽留活動模擬
+def simulate_campaign(segments, campaign, n_draws=N_DRAWS, seed=0, spend_sigma=SPEND_SIGMA,
+                      cost_per_customer=0.0, max_workers=None):
+    """campaign 為 {類別: {'reactivation', 'uplift'}}，只模擬 campaign 中的類別；
+    返回 {'draws': 每次抽樣各細分及 Total 的增量收入, 'summary': 各細分的分佈摘要}"""
+    names = [name for name in campaign if name in segments]
+    if not names:
+        return {'draws': pd.DataFrame(), 'summary': pd.DataFrame()}
+    target_segments = [segments[name] for name in names]
+    probabilities = np.array([float(campaign[name]['reactivation']) for name in names])
+    uplifts = np.array([float(campaign[name]['uplift']) for name in names])
+
+    # 每塊抽樣使用獨立的隨機流
+    chunk_sizes = [min(DRAW_CHUNK, n_draws - start) for start in range(0, n_draws, DRAW_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    n_cells = n_draws * sum(len(monetary) for monetary in target_segments)
+    if n_cells < PARALLEL_MIN_CELLS or max_workers == 1 or len(chunk_sizes) == 1:
+        results = [
+            simulate_chunk(target_segments, probabilities, uplifts, size, chunk_seed, spend_sigma)
+            for size, chunk_seed in zip(chunk_sizes, seeds)
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(target_segments,)) as pool:
+            futures = [
+                pool.submit(simulate_chunk, None, probabilities, uplifts, size, chunk_seed, spend_sigma)
+                for size, chunk_seed in zip(chunk_sizes, seeds)
+            ]
+            results = [future.result() for future in futures]
+    revenue = np.concatenate([result[0] for result in results])
+    customers = np.concatenate([result[1] for result in results])
+
+    draws = pd.DataFrame(revenue, columns=names)
+    draws['Total'] = revenue.sum(axis=1)
+
+    contacted = np.array([len(monetary) for monetary in target_segments] + [sum(len(monetary) for monetary in target_segments)])
+    all_revenue = np.column_stack([revenue, draws['Total'].to_numpy()])
+    all_customers = np.column_stack([customers, customers.sum(axis=1)])
+    quantiles = np.quantile(all_revenue, QUANTILES, axis=0)
+    cost = contacted * cost_per_customer
+    summary = pd.DataFrame({
+        'Segment': names + ['Total'],
+        'Customers': contacted,
+        'Reactivation': np.append(probabilities, np.nan),
+        'Uplift': np.append(uplifts, np.nan),
+        'Reactivated_Mean': all_customers.mean(axis=0),
+        'Revenue_Mean': all_revenue.mean(axis=0),
+        'Revenue_P5': quantiles[0],
+        'Revenue_P50': quantiles[1],
+        'Revenue_P95': quantiles[2],
+        'Cost': cost,
+        'Net_Mean': all_revenue.mean(axis=0) - cost,
+        'Prob_Positive_Net': (all_revenue > cost).mean(axis=0)
+    })
+    return {'draws': draws, 'summary': summary}
+
+
+# 解析CLI細分參數
+def parse_segment(expression):
+    """'At Risk=0.25,0.3' -> ('At Risk', {'reactivation': 0.25, 'uplift': 0.3})"""
+    name, _, values = expression.partition('=')
+    reactivation, _, uplift = values.partition(',')
+    return name.strip(), {'reactivation': float(reactivation), 'uplift': float(uplift or 0)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RFM 挽留活動蒙特卡羅模擬")
+    parser.add_argument('summary_file', help="包含 RFM 工作表的彙總表（.xlsx）")
+    parser.add_argument('--segment', action='append', default=[],
+                        help="類別=喚回概率,消費提升，如 \"At Risk=0.25,0.3\"，可重複（預設 At Risk 和 Lost）")
+    parser.add_argument('--draws', type=int, default=N_DRAWS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spend-sigma', type=float, default=SPEND_SIGMA)
+    parser.add_argument('--cost-per-customer', type=float, default=0.0, help="每位目標客戶的活動成本")
+    parser.add_argument('--workers', type=int, default=None, help="進程數（預設為 CPU 數）")
+    args = parser.parse_args(argv)
+
+    rfm_df = pd.read_excel(args.summary_file, sheet_name='RFM')
+    customer_col = next((col for col in rfm_df.columns if 'customer' in str(col).lower()), None)
+    segments = prepare_segments(rfm_df, customer_col=customer_col)
+    campaign = dict(parse_segment(expression) for expression in args.segment) or DEFAULT_CAMPAIGN
+
+    result = simulate_campaign(segments, campaign, args.draws, args.seed, args.spend_sigma,
+                               args.cost_per_customer, args.workers)
+    if len(result['summary']) == 0:
+        print(f"RFM 表中沒有這些類別: {', '.join(campaign)}")
+        return 1
+    print(result['summary'].to_string(index=False, float_format=lambda value: f'{value:,.2f}'))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+退貨分類引擎：從原始發票明細計算產品/客戶的 Return_Count、Return_Amount、Return_Rate 及退貨類別
+
+分塊讀取明細，每塊做一次 groupby 得到部分聚合，再合併；類別用 np.select 向量化判定。
+
+用法:
+    python return_classifier.py "Online Retail.xlsx" --output "Return and Abnormal.xlsx"
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from invoice_data import CHUNK_ROWS, is_return_line, iter_invoice_chunks, normalize_customer_id
+
+# 退貨率門檻（按數量計算）
+HIGH_RETURN_RATE = 0.20
+MEDIUM_RETURN_RATE = 0.05
+
+# 類別標籤（與 Return and Abnormal 工作表一致）
+RETURN_CATEGORY_LABELS = {
+    'product': {
+        'outlier': '100% return items(outlier)',
+        'high': 'High-return items',
+        'medium': 'Medium-return items',
+        'low': 'Low-return items'
+    },
+    'customer': {
+        'outlier': '100% return customer(outlier)',
+        'high': 'High-return customer',
+        'medium': 'Medium-return customer',
+        'low': 'Low-return customer'
+    }
+}
+
+# 輸出工作表：維度 -> (鍵列, 工作表名稱)
+RETURN_SHEETS = {
+    'product': ('StockCode', 'Return analysis product'),
+    'customer': ('CustomerID', 'Return analysis customer')
+}
+
+AGGREGATE_COLUMNS = ['Sold_Quantity', 'Return_Quantity', 'Return_Count', 'Return_Amount']
+INVOICE_COLUMNS = ['InvoiceNo', 'StockCode', 'Quantity', 'UnitPrice', 'CustomerID']
+
+
+# 判定退貨類別
+def classify_returns(return_rate, kind='product'):
+    """按退貨率判定 High / Medium / Low / 100% outlier；退貨率大於 1 時視為百分比"""
+    rates = pd.to_numeric(pd.Series(return_rate), errors='coerce').to_numpy(dtype=float)
+    if np.nanmax(rates, initial=0) > 1:
+        rates = rates / 100
+    labels = RETURN_CATEGORY_LABELS[kind]
+    return np.select(
+        [rates >= 1, rates >= HIGH_RETURN_RATE, rates >= MEDIUM_RETURN_RATE, rates >= 0],
+        [labels['outlier'], labels['high'], labels['medium'], labels['low']],
+        default='Unknown'
+    )
+
+
+# 聚合單個數據塊
+def aggregate_chunk(lines, key_col):
+    """對一塊明細按 key 做一次 groupby，得到售出數量、退貨數量、退貨行數和退貨金額"""
+    quantity = pd.to_numeric(lines['Quantity'], errors='coerce').fillna(0).to_numpy()
+    price = pd.to_numeric(lines['UnitPrice'], errors='coerce').fillna(0).to_numpy()
+    is_return = is_return_line(lines['InvoiceNo'], lines['Quantity'])
+
+    keys = lines[key_col]
+    if key_col == 'CustomerID':
+        keys = normalize_customer_id(keys)
+    else:
+        keys = keys.astype(str).str.strip()
+
+    parts = pd.DataFrame({
+        'Key': keys.to_numpy(),
+        'Sold_Quantity': np.where(is_return, 0, np.clip(quantity, 0, None)),
+        'Return_Quantity': np.where(is_return, np.abs(quantity), 0),
+        'Return_Count': is_return.astype(np.int64),
+        'Return_Amount': np.where(is_return, np.abs(quantity * price), 0)
+    })
+    return parts.groupby('Key', sort=False)[AGGREGATE_COLUMNS].sum()
+
+
+# 由聚合結果計算退貨指標
+def finalize_returns(totals, key_col, kind):
+    """計算 Return_Rate（退貨數量 / 售出數量，上限 1）和類別，只保留有退貨的 key"""
+    totals = totals[totals['Return_Count'] > 0]
+    sold = totals['Sold_Quantity'].to_numpy(dtype=float)
+    returned = totals['Return_Quantity'].to_numpy(dtype=float)
+    # 沒有售出記錄（例如退回的是上一期購買的商品）時退貨率記為 100%
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(sold > 0, returned / sold, 1.0)
+
+    result = pd.DataFrame({
+        key_col: totals.index.to_numpy(),
+        'Return_Count': totals['Return_Count'].to_numpy(),
+        'Return_Amount': totals['Return_Amount'].to_numpy(),
+        'Return_Rate': np.minimum(rate, 1.0),
+        'Sold_Quantity': sold,
+        'Return_Quantity': returned
+    })
+    result['Category'] = classify_returns(result['Return_Rate'], kind)
+    return result.sort_values('Return_Amount', ascending=False, ignore_index=True)
+
+
+# 從發票明細計算產品和客戶退貨分析
+def compute_return_analysis(path, chunk_rows=CHUNK_ROWS):
+    """分塊讀取發票明細，返回 {'product': DataFrame, 'customer': DataFrame}"""
+    totals = {kind: None for kind in RETURN_SHEETS}
+    for lines in iter_invoice_chunks(path, INVOICE_COLUMNS, chunk_rows):
+        for kind, (key_col, _) in RETURN_SHEETS.items():
+            partial = aggregate_chunk(lines, key_col)
+            # 部分聚合每塊折疊一次，內存只與 key 的數量有關
+            totals[kind] = partial if totals[kind] is None else pd.concat([totals[kind], partial]).groupby(level=0).sum()
+
+    return {
+        kind: finalize_returns(totals[kind], key_col, kind) if totals[kind] is not None else pd.DataFrame()
+        for kind, (key_col, _) in RETURN_SHEETS.items()
+    }
+
+
+# 寫出退貨分析工作表
+def write_return_sheets(results, output):
+    """寫入 Return analysis product / customer 工作表；文件已存在時只替換這兩個工作表"""
+    mode_kwargs = {'mode': 'a', 'if_sheet_exists': 'replace'} if os.path.exists(output) else {'mode': 'w'}
+    with pd.ExcelWriter(output, engine='openpyxl', **mode_kwargs) as writer:
+        for kind, (_, sheet_name) in RETURN_SHEETS.items():
+            results[kind].to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="從發票明細重新計算產品/客戶退貨分析")
+    parser.add_argument('transactions', help="發票明細文件（.xlsx / .csv / .parquet）")
+    parser.add_argument('--output', default='Return and Abnormal.xlsx', help="輸出 Excel 文件")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="每塊讀取的行數")
+    args = parser.parse_args(argv)
+
+    print(f"讀取發票明細: {args.transactions}")
+    results = compute_return_analysis(args.transactions, args.chunk_rows)
+    write_return_sheets(results, args.output)
+    for kind, (_, sheet_name) in RETURN_SHEETS.items():
+        print(f"{sheet_name}: {len(results[kind]):,} 行")
+    print(f"已保存: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
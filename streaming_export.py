@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+流式導出：以生成器逐塊寫出 CSV / Parquet / xlsx，不在內存中生成第二份完整數據
+
+用法:
+    python streaming_export.py rfm --format parquet --output rfm.parquet --filter "Category=At Risk,Lost"
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from invoice_data import arrow_safe, require_pyarrow
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# 每塊轉換的行數
+EXPORT_CHUNK_ROWS = 100_000
+# 讀取文件時每次讀取的字節數
+READ_BLOCK_BYTES = 1 << 20
+# SpooledTemporaryFile 超過此大小後轉存到磁盤
+SPOOL_MAX_BYTES = 16 << 20
+# Excel 每個工作表最多 1,048,576 行（含表頭）
+XLSX_MAX_ROWS = 1_048_575
+
+EXPORT_MIME_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# CLI 可導出的區塊：名稱 -> (候選文件, 工作表)
+SUMMARY_FILE = '彙總表.xlsx'
+RETURN_FILES = ['Return and Abnormal_2011_11.xlsx', 'Return and Abnormal.xlsx']
+EXPORT_SECTIONS = {
+    'mom': ([SUMMARY_FILE], 'MOM'),
+    'rfm': ([SUMMARY_FILE], 'RFM'),
+    'sku': ([SUMMARY_FILE], 'SKU'),
+    'sales_by_country': ([SUMMARY_FILE], 'Sales by Country'),
+    'return_product': (RETURN_FILES, 'Return analysis product'),
+    'return_customer': (RETURN_FILES, 'Return analysis customer')
+}
+
+
+# 可用的導出格式
+def available_formats():
+    """CSV 總是可用；Parquet 需要 pyarrow，xlsx 需要 xlsxwriter"""
+    formats = ['csv']
+    if pq is not None:
+        formats.append('parquet')
+    if xlsxwriter is not None:
+        formats.append('xlsx')
+    return formats
+
+
+def _iter_chunks(df, chunk_rows, mask=None):
+    """逐塊切片；有篩選掩碼時在每塊內套用，不生成篩選後的完整副本"""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        if mask is not None:
+            chunk = chunk[mask[start:start + chunk_rows]]
+        yield chunk
+
+
+# CSV 生成器
+def iter_csv(df, chunk_rows=EXPORT_CHUNK_ROWS, mask=None):
+    """逐塊生成 UTF-8（帶 BOM，Excel 可直接打開中文）CSV 字節"""
+    yield df.iloc[:0].to_csv(index=False).encode('utf-8-sig')
+    for chunk in _iter_chunks(df, chunk_rows, mask):
+        yield chunk.to_csv(index=False, header=False).encode('utf-8')
+
+
+class _DrainableSink:
+    """ParquetWriter 的輸出端：寫入的字節暫存，由生成器取走後清空"""
+
+    def __init__(self):
+        self.buffers = []
+        self.closed = False
+
+    def write(self, data):
+        self.buffers.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.buffers)
+        self.buffers = []
+        return data
+
+
+def _parquet_schema(df, object_columns):
+    """空表推斷不出 object 列的類型（會得到 null），object 列統一為 string"""
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    for col in object_columns:
+        index = schema.get_field_index(str(col))
+        schema = schema.set(index, pa.field(str(col), pa.string()))
+    return schema
+
+
+# Parquet 生成器
+def iter_parquet(df, chunk_rows=EXPORT_CHUNK_ROWS, mask=None):
+    """每塊寫成一個 row group，寫完即取走字節"""
+    require_pyarrow("Parquet 導出")
+    sink = _DrainableSink()
+    object_columns = [col for col in df.columns if df[col].dtype == object]
+    schema = _parquet_schema(df, object_columns)
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in _iter_chunks(df, chunk_rows, mask):
+            chunk = arrow_safe(chunk, object_columns)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# xlsx 生成器
+def iter_xlsx(df, chunk_rows=EXPORT_CHUNK_ROWS, mask=None, sheet_name='Data'):
+    """以 xlsxwriter constant_memory 模式逐行寫出，超過 Excel 行數上限時自動分工作表"""
+    if xlsxwriter is None:
+        raise ImportError("xlsx 導出需要 xlsxwriter，請運行: pip install xlsxwriter")
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd'
+        })
+        header = [str(col) for col in df.columns]
+        worksheet = None
+        row = XLSX_MAX_ROWS
+        sheet_number = 0
+        for chunk in _iter_chunks(df, chunk_rows, mask):
+            # NaN / NaT 寫為空白單元格
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for values in chunk.itertuples(index=False, name=None):
+                if row >= XLSX_MAX_ROWS:
+                    sheet_number += 1
+                    worksheet = workbook.add_worksheet(sheet_name if sheet_number == 1 else f'{sheet_name}_{sheet_number}')
+                    worksheet.write_row(0, 0, header)
+                    row = 0
+                row += 1
+                worksheet.write_row(row, 0, values)
+        if worksheet is None:
+            workbook.add_worksheet(sheet_name).write_row(0, 0, header)
+        workbook.close()
+
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(READ_BLOCK_BYTES)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
+
+
+EXPORT_WRITERS = {
+    'csv': iter_csv,
+    'parquet': iter_parquet,
+    'xlsx': iter_xlsx
+}
+
+
+# 導出生成器
+def iter_export(df, fmt, chunk_rows=EXPORT_CHUNK_ROWS, mask=None):
+    """按格式返回字節塊生成器；mask 為與 df 等長的布爾數組"""
+    if fmt not in EXPORT_WRITERS:
+        raise ValueError(f"不支持的導出格式: {fmt}")
+    return EXPORT_WRITERS[fmt](df, chunk_rows, mask)
+
+
+# 導出到文件
+def write_export(df, output, fmt=None, chunk_rows=EXPORT_CHUNK_ROWS, mask=None):
+    """把生成器的字節塊逐塊寫入文件；fmt 為 None 時按擴展名判斷"""
+    fmt = fmt or os.path.splitext(output)[1].lstrip('.').lower()
+    with open(output, 'wb') as f:
+        for block in iter_export(df, fmt, chunk_rows, mask):
+            f.write(block)
+    return output
+
+
+# 導出到臨時文件
+def spooled_export(df, fmt, mask=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """寫入 SpooledTemporaryFile（較大時自動轉存磁盤），返回已回到開頭的文件對象"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    for block in iter_export(df, fmt, chunk_rows, mask):
+        spool.write(block)
+    spool.seek(0)
+    return spool
+
+
+# 讀取CLI導出區塊
+def load_section(section):
+    """從彙總表或 Return and Abnormal 文件讀取區塊對應的工作表"""
+    files, sheet_name = EXPORT_SECTIONS[section]
+    for path in files:
+        if os.path.exists(path):
+            return pd.read_excel(path, sheet_name=sheet_name)
+    raise FileNotFoundError(f"找不到 {section} 的數據文件: {', '.join(files)}")
+
+
+# 解析CLI篩選條件
+def column_filter_mask(df, filters):
+    """filters 形如 ['Category=At Risk,Lost', 'Country=France']，同一列內為 OR，不同列之間為 AND"""
+    mask = np.ones(len(df), dtype=bool)
+    for expression in filters or []:
+        column, _, values = expression.partition('=')
+        column = column.strip()
+        if column not in df.columns:
+            raise ValueError(f"篩選列不存在: {column}")
+        mask &= df[column].astype(str).isin([value.strip() for value in values.split(',')]).to_numpy()
+    return mask
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="導出儀表板區塊數據（流式寫出，內存佔用與數據大小無關）")
+    parser.add_argument('section', choices=sorted(EXPORT_SECTIONS), help="要導出的區塊")
+    parser.add_argument('--format', choices=sorted(EXPORT_WRITERS), default=None, help="導出格式（預設按輸出擴展名判斷）")
+    parser.add_argument('--output', required=True, help="輸出文件")
+    parser.add_argument('--filter', action='append', default=[], help="篩選條件，如 \"Category=At Risk,Lost\"，可重複")
+    parser.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    df = load_section(args.section)
+    mask = column_filter_mask(df, args.filter)
+    write_export(df, args.output, args.format, args.chunk_rows, mask)
+    print(f"已導出 {int(mask.sum()):,} 行: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
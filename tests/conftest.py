@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""測試時從倉庫根目錄導入各模塊"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
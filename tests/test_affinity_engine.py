@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('scipy')
+
+from affinity_engine import (
+    build_basket_matrix, compute_affinity, load_affinity_index, query_affinity, save_affinity_index
+)
+
+
+def _transactions(seed=0, n_invoices=400, n_skus=12):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for invoice in range(n_invoices):
+        size = rng.integers(1, 6)
+        for sku in rng.choice(n_skus, size=size, replace=False):
+            rows.append((f'INV{invoice}', f'SKU{sku}'))
+    # 重複的發票行只計一次
+    rows.append(('INV0', rows[0][1]))
+    return pd.DataFrame(rows, columns=['InvoiceNo', 'StockCode'])
+
+
+def _brute_force(transactions, min_item_count, min_pair_count):
+    baskets = transactions.groupby('InvoiceNo')['StockCode'].agg(set)
+    item_counts = pd.Series([sku for basket in baskets for sku in basket]).value_counts()
+    kept = set(item_counts[item_counts >= min_item_count].index)
+    baskets = [basket & kept for basket in baskets]
+    # 分母包括所有發票（單品發票也計入）
+    n_invoices = len(baskets)
+    counts = {sku: sum(sku in basket for basket in baskets) for sku in kept}
+    pairs = {}
+    for basket in baskets:
+        for a, b in itertools.permutations(sorted(basket), 2):
+            pairs[(a, b)] = pairs.get((a, b), 0) + 1
+    expected = {}
+    for (a, b), count in pairs.items():
+        if count >= min_pair_count:
+            expected[(a, b)] = (
+                count,
+                count / n_invoices,
+                count / counts[a],
+                count * n_invoices / (counts[a] * counts[b])
+            )
+    return expected
+
+
+def test_affinity_matches_brute_force():
+    transactions = _transactions()
+    matrix, skus = build_basket_matrix(transactions, min_item_count=5)
+    result = compute_affinity(matrix, skus, top_n=100, min_pair_count=3)
+    expected = _brute_force(transactions, min_item_count=5, min_pair_count=3)
+
+    assert len(result) == len(expected)
+    for row in result.itertuples(index=False):
+        count, support, confidence, lift = expected[(row.StockCode, row.Neighbor)]
+        assert row.Co_Count == count
+        assert row.Support == pytest.approx(support)
+        assert row.Confidence == pytest.approx(confidence)
+        assert row.Lift == pytest.approx(lift)
+
+
+def test_single_item_baskets_count_in_denominators():
+    rows = [('INV0', 'A'), ('INV0', 'B')]
+    rows += [(f'INV{i}', 'A') for i in range(1, 10)]
+    rows += [(f'INV{i}', 'B') for i in range(10, 13)]
+    matrix, skus = build_basket_matrix(pd.DataFrame(rows, columns=['InvoiceNo', 'StockCode']), min_item_count=1)
+    result = compute_affinity(matrix, skus, min_pair_count=1).set_index(['StockCode', 'Neighbor'])
+
+    # 13 張發票，A 出現 10 次，B 出現 4 次，一起出現 1 次
+    row = result.loc[('A', 'B')]
+    assert row['Co_Count'] == 1
+    assert row['Support'] == pytest.approx(1 / 13)
+    assert row['Confidence'] == pytest.approx(0.1)
+    assert row['Lift'] == pytest.approx(13 / 40)
+    assert result.loc[('B', 'A'), 'Confidence'] == pytest.approx(0.25)
+
+
+def test_top_n_keeps_highest_lift():
+    transactions = _transactions(seed=1)
+    matrix, skus = build_basket_matrix(transactions, min_item_count=5)
+    full = compute_affinity(matrix, skus, top_n=100, min_pair_count=1)
+    top = compute_affinity(matrix, skus, top_n=3, min_pair_count=1)
+
+    for stock_code, group in top.groupby('StockCode'):
+        assert list(group['Rank']) == list(range(1, len(group) + 1))
+        best = full[full['StockCode'] == stock_code]['Lift'].nlargest(3).to_numpy()
+        np.testing.assert_allclose(group['Lift'].to_numpy(), best)
+
+
+def test_basket_matrix_is_integer():
+    matrix, _ = build_basket_matrix(_transactions(), min_item_count=1)
+    assert np.issubdtype(matrix.dtype, np.integer)
+    assert matrix.max() == 1
+
+
+def test_index_round_trip(tmp_path):
+    transactions = _transactions()
+    matrix, skus = build_basket_matrix(transactions, min_item_count=5)
+    result = compute_affinity(matrix, skus, top_n=5, min_pair_count=3)
+    path = tmp_path / 'affinity_index.npz'
+    n_invoices = transactions['InvoiceNo'].nunique()
+    save_affinity_index(result, path, skus, n_invoices, np.asarray(matrix.sum(axis=0)).ravel())
+    index = load_affinity_index(path)
+    assert int(index['N_Invoices']) == n_invoices
+    assert list(index['Items']) == sorted(skus)
+    assert index['Item_Count'].dtype == np.int64
+
+    stock_code = result['StockCode'].iloc[0]
+    neighbors = query_affinity(index, stock_code)
+    expected = result[result['StockCode'] == stock_code].reset_index(drop=True)
+    assert list(neighbors['Neighbor']) == list(expected['Neighbor'])
+    np.testing.assert_allclose(neighbors['Lift'], expected['Lift'])
+    assert neighbors['Co_Count'].dtype == np.int64
+
+
+def test_empty_index_round_trip(tmp_path):
+    path = tmp_path / 'affinity_index.npz'
+    empty = compute_affinity(*build_basket_matrix(_transactions(n_invoices=3), min_item_count=100))
+    save_affinity_index(empty, path)
+    index = load_affinity_index(path)
+    assert len(query_affinity(index, 'SKU1')) == 0
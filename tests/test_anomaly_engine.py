@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomaly_engine
+from anomaly_engine import (
+    build_series_matrix, robust_zscores, score_products, score_series, score_series_matrix, seasonal_residuals
+)
+
+
+def test_robust_zscores_match_definition():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 100.0])
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    np.testing.assert_allclose(robust_zscores(values), 0.6745 * (values - median) / mad)
+
+
+def test_robust_zscores_zero_mad_and_nan():
+    z = robust_zscores(np.array([[5.0, 5.0, 5.0, 5.0, 9.0], [np.nan, 1.0, 1.0, 1.0, 1.0], [2.0, 2.0, 2.0, 2.0, 2.0]]))
+    # MAD 為 0 時退回平均絕對偏差
+    mean_ad = np.mean(np.abs([0.0, 0.0, 0.0, 0.0, 4.0]))
+    assert z[0, 4] == pytest.approx(4.0 / (1.2533 * mean_ad))
+    assert np.isnan(z[1, 0])
+    np.testing.assert_array_equal(z[1, 1:], 0.0)
+    np.testing.assert_array_equal(z[2], 0.0)
+
+
+def test_seasonal_residuals_remove_seasonal_profile():
+    profile = np.arange(12, dtype=float) * 10
+    values = np.tile(profile, 3)[np.newaxis, :30] + 5.0
+    np.testing.assert_allclose(seasonal_residuals(values, period=12), 0.0)
+    # 不足兩個週期時扣除整體中位數
+    short = np.array([[1.0, 2.0, 3.0]])
+    np.testing.assert_allclose(seasonal_residuals(short, period=12), [[-1.0, 0.0, 1.0]])
+
+
+def test_build_series_matrix_sums_duplicates():
+    df = pd.DataFrame({
+        'Country': ['UK', 'UK', 'UK', 'France', None],
+        'YearMonth': ['2011-01', '2011-01', '2011-02', '2011-02', '2011-01'],
+        'Revenue': [1.0, 2.0, 4.0, 8.0, 16.0]
+    })
+    keys, periods, matrix = build_series_matrix(df, 'Country', 'YearMonth', 'Revenue')
+    assert list(keys['Country']) == ['France', 'UK']
+    assert list(periods) == ['2011-01', '2011-02']
+    np.testing.assert_array_equal(matrix, [[np.nan, 8.0], [3.0, 4.0]])
+
+
+def test_build_series_matrix_keeps_missing_values_nan():
+    df = pd.DataFrame({
+        'Country': ['UK', 'UK', 'UK', 'France'],
+        'YearMonth': ['2011-01', '2011-02', '2011-02', '2011-01'],
+        'Revenue': [np.nan, 4.0, np.nan, 'n/a']
+    })
+    _, _, matrix = build_series_matrix(df, 'Country', 'YearMonth', 'Revenue')
+    np.testing.assert_array_equal(matrix, [[np.nan, np.nan], [np.nan, 4.0]])
+
+
+def test_missing_months_are_not_flagged_as_dips():
+    months = [f'{year}-{month:02d}' for year in (2009, 2010, 2011) for month in range(1, 13)]
+    revenue = [100.0 + i % 3 for i in range(len(months))]
+    df = pd.concat([
+        pd.DataFrame({'Country': country, 'YearMonth': months, 'Revenue': revenue}) for country in ('UK', 'France')
+    ], ignore_index=True)
+    # UK 一個月的金額為空、另一個月沒有記錄
+    df.loc[(df['Country'] == 'UK') & (df['YearMonth'] == '2010-06'), 'Revenue'] = np.nan
+    df = df[(df['Country'] != 'UK') | (df['YearMonth'] != '2011-03')]
+
+    scores, cells = score_series(df, 'Country', 'YearMonth', 'Revenue')
+    assert len(cells) == 0
+    assert (scores['Anomaly_Periods'] == 0).all()
+
+
+def test_chunked_scoring_matches_single_block(monkeypatch):
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(100, 10, size=(53, 30))
+    matrix[rng.random(matrix.shape) < 0.05] = np.nan
+    expected = score_series_matrix(matrix)
+    monkeypatch.setattr(anomaly_engine, 'CHUNK_ROWS', 7)
+    for chunked, single in zip(score_series_matrix(matrix), expected):
+        np.testing.assert_array_equal(chunked, single)
+
+
+def test_score_series_flags_spike():
+    months = [f'{year}-{month:02d}' for year in (2009, 2010, 2011) for month in range(1, 13)]
+    rows = []
+    for country, base in [('UK', 100.0), ('France', 50.0)]:
+        for i, month in enumerate(months):
+            rows.append((country, month, base + (i % 12) * 5 + (i % 3)))
+    df = pd.DataFrame(rows, columns=['Country', 'YearMonth', 'Revenue'])
+    df.loc[(df['Country'] == 'France') & (df['YearMonth'] == '2011-06'), 'Revenue'] = 500.0
+
+    scores, cells = score_series(df, 'Country', 'YearMonth', 'Revenue')
+    assert scores['Country'].iloc[0] == 'France'
+    assert scores['Peak_Period'].iloc[0] == '2011-06'
+    assert scores['Anomaly_Score'].iloc[0] > anomaly_engine.ANOMALY_Z_THRESHOLD
+    assert list(cells[['Country', 'YearMonth']].iloc[0]) == ['France', '2011-06']
+
+
+def test_score_products_driver():
+    products = pd.DataFrame({
+        'StockCode': [f'P{i}' for i in range(10)],
+        'Return_Rate': [0.1, 0.12, 0.11, 0.09, 0.1, 0.13, 0.1, 0.11, 0.12, 0.9],
+        'Quantity': [10, 12, 11, 9, 10, 13, 10, 11, 12, 10]
+    })
+    scores = score_products(products, 'StockCode', ['Return_Rate', 'Quantity'])
+    top = scores.iloc[0]
+    assert top['StockCode'] == 'P9'
+    assert top['Driver'] == 'Return_Rate'
+    assert bool(top['Is_Anomaly'])
+    assert scores['Is_Anomaly'].sum() == 1
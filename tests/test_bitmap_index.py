@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from bitmap_index import build_bitmap_index, dimension_values, filter_mask, masked_group_sum
+
+
+def _dims(n=1001, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Category': rng.choice(['Champions', 'At Risk', 'Lost', 'GUEST'], size=n),
+        'Country': rng.choice(['United Kingdom', 'France', 'Germany'], size=n),
+        'YearMonth': rng.choice(['2011-01', '2011-02', '2011-03'], size=n),
+        'IsGuest': rng.choice(['GUEST', 'Others'], size=n)
+    })
+
+
+@pytest.mark.parametrize('selections', [
+    {'Category': ['Lost']},
+    {'Category': ['Lost', 'At Risk'], 'Country': ['France']},
+    {'Category': ['Champions'], 'Country': ['France', 'Germany'], 'YearMonth': ['2011-02'], 'IsGuest': ['Others']},
+    {'Country': ['Spain']},
+    {'Country': ['France', 'Spain'], 'Unknown': ['x']}
+])
+def test_mask_matches_pandas(selections):
+    dims = _dims()
+    index = build_bitmap_index(dims)
+    expected = np.ones(len(dims), dtype=bool)
+    for dim, selected in selections.items():
+        if dim in dims.columns:
+            expected &= dims[dim].astype(str).isin(selected).to_numpy()
+    np.testing.assert_array_equal(filter_mask(index, selections), expected)
+
+
+def test_no_active_filter_returns_none():
+    index = build_bitmap_index(_dims())
+    assert filter_mask(index, {}) is None
+    assert filter_mask(index, {'Category': [], 'Unknown': ['x']}) is None
+    assert filter_mask(None, {'Category': ['Lost']}) is None
+
+
+def test_masked_group_sum_matches_groupby():
+    dims = _dims()
+    values = np.random.default_rng(1).normal(100, 20, size=len(dims))
+    values[::17] = np.nan
+    index = build_bitmap_index(dims)
+    mask = filter_mask(index, {'Category': ['Lost', 'At Risk']})
+    country = index['dims']['Country']
+
+    sums = masked_group_sum(country['codes'], values, mask, len(country['values']))
+    expected = (pd.Series(values[mask]).fillna(0)
+                .groupby(dims['Country'].to_numpy()[mask]).sum()
+                .reindex(country['values'], fill_value=0.0))
+    np.testing.assert_allclose(sums, expected.to_numpy())
+    np.testing.assert_allclose(
+        masked_group_sum(country['codes'], values, None, len(country['values'])).sum(),
+        np.nansum(values)
+    )
+
+
+def test_dimension_values_merges_indexes():
+    first = build_bitmap_index(pd.DataFrame({'Country': ['France', 'Germany']}))
+    second = build_bitmap_index(pd.DataFrame({'Country': ['Spain', 'France'], 'Category': ['Lost', 'Lost']}))
+    assert dimension_values([first, None, second], 'Country') == ['France', 'Germany', 'Spain']
+    assert dimension_values([first], 'Category') == []
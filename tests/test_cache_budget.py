@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cache_budget
+from cache_budget import budgeted_cache, cache_stats, clear_cache, estimate_bytes, set_budgets
+
+MB = 2 ** 20
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    """每個測試使用空緩存，會話 ID 由 session 控制"""
+    clear_cache()
+    cache_budget._STATS.clear()
+    cache_budget._SESSIONS.clear()
+    cache_budget._STATE['clock'] = 0.0
+    session = {'id': 'a'}
+    monkeypatch.setattr(cache_budget, 'current_session_id', lambda: session['id'])
+    set_budgets(64 * MB, 64 * MB)
+    yield session
+    clear_cache()
+    set_budgets(cache_budget.GLOBAL_BUDGET_BYTES, cache_budget.SESSION_BUDGET_BYTES)
+
+
+BLOCK_ROWS = MB // 8
+
+
+@budgeted_cache
+def block(k):
+    """每個條目 1MB，大小相同"""
+    return np.full(BLOCK_ROWS, float(k))
+
+
+def _cached_blocks():
+    return sorted(int(entry['value'][0]) for entry in cache_budget._ENTRIES.values())
+
+
+def test_hits_return_isolated_copies():
+    calls = []
+
+    @budgeted_cache
+    def load(n):
+        calls.append(n)
+        return {'frame': pd.DataFrame({'a': np.arange(n)}), 'array': np.arange(n)}
+
+    first = load(5)
+    first['frame']['a'] = 0
+    first['frame'].loc[0, 'a'] = 99
+    first['array'][:] = -1
+    second = load(5)
+
+    assert calls == [5]
+    assert list(second['frame']['a']) == [0, 1, 2, 3, 4]
+    assert list(second['array']) == [0, 1, 2, 3, 4]
+    stats = cache_stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_arguments_are_part_of_the_key():
+    @budgeted_cache
+    def total(df, window):
+        return float(df.loc[df['month'].between(*window), 'value'].sum())
+
+    df = pd.DataFrame({'month': ['2011-01', '2011-02', '2011-03'], 'value': [1.0, 2.0, 4.0]})
+    assert total(df, ('2011-01', '2011-02')) == 3.0
+    assert total(df, ('2011-02', '2011-03')) == 6.0
+    df.loc[0, 'value'] = 10.0
+    assert total(df, ('2011-01', '2011-02')) == 12.0
+
+
+def test_global_eviction_keeps_expensive_entries(monkeypatch):
+    # 計算耗時取下限值，便宜條目的成本固定
+    monkeypatch.setattr(cache_budget, 'MIN_COST_SECONDS', 0.01)
+    set_budgets(global_bytes=2 * MB + MB // 2)
+
+    @budgeted_cache
+    def expensive(k):
+        time.sleep(0.1)
+        return np.full(BLOCK_ROWS, float(k))
+
+    expensive(0)
+    block(1)
+    block(2)
+    block(3)
+
+    values = sorted(int(entry['value'][0]) for entry in cache_budget._ENTRIES.values())
+    assert values == [0, 3]
+    assert cache_stats()['bytes'] <= 2 * MB + MB // 2
+
+
+def test_eviction_is_lru_among_equal_cost(monkeypatch):
+    monkeypatch.setattr(cache_budget, 'MIN_COST_SECONDS', 1.0)
+    set_budgets(global_bytes=2 * MB + MB // 2)
+
+    block(1)
+    block(2)
+    block(3)
+    assert _cached_blocks() == [2, 3]
+    # 淘汰後時鐘前進，命中的條目優先級高於之前未訪問的條目
+    block(2)
+    block(4)
+    assert _cached_blocks() == [2, 4]
+    stats = cache_stats()
+    assert stats['evictions'] == 2
+    assert stats['hits'] == 1
+
+
+def test_result_larger_than_session_budget_is_still_cached(fresh_cache):
+    set_budgets(global_bytes=16 * MB, session_bytes=1 * MB)
+    calls = []
+
+    @budgeted_cache
+    def load():
+        calls.append(1)
+        return np.zeros(MB // 4)
+
+    load()
+    load()
+    assert len(calls) == 1
+    assert cache_stats()['entries'] == 1
+
+
+def test_result_larger_than_global_budget_is_not_cached():
+    set_budgets(global_bytes=1 * MB)
+
+    @budgeted_cache
+    def load():
+        return np.zeros(MB)
+
+    load()
+    stats = cache_stats()
+    assert stats['entries'] == 0
+    assert stats['functions']['Oversized'].iloc[0] == 1
+
+
+def test_session_budget_releases_only_that_sessions_entries(fresh_cache):
+    set_budgets(global_bytes=16 * MB, session_bytes=MB + MB // 2)
+
+    @budgeted_cache
+    def block(n):
+        return np.zeros(n)
+
+    fresh_cache['id'] = 'b'
+    block(MB // 8)
+    fresh_cache['id'] = 'a'
+    block(MB // 8)
+    block(MB // 8 + 1)
+
+    sessions = cache_stats()['sessions'].set_index('Session')
+    assert sessions.loc['a', 'Bytes'] <= MB + MB // 2
+    assert sessions.loc['a', 'Entries'] == 1
+    # 會話 b 仍在使用的共享條目保留
+    assert sessions.loc['b', 'Entries'] == 1
+    assert cache_stats()['entries'] == 2
+
+
+def test_concurrent_misses_compute_once():
+    calls = []
+
+    @budgeted_cache
+    def slow(n):
+        calls.append(n)
+        time.sleep(0.05)
+        return n * 2
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow(21))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [21]
+    assert results == [42] * 8
+
+
+def test_estimate_bytes_counts_frames_and_containers():
+    df = pd.DataFrame({'a': np.zeros(1000)})
+    assert estimate_bytes(df) >= 8000
+    assert estimate_bytes({'df': df, 'array': np.zeros(1000)}) >= 16000
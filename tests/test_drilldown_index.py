@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import drilldown_index
+from drilldown_index import build_drilldown_index, drilldown_index_mtime, lookup, open_drilldown_index
+
+
+def _lines(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    customers = rng.choice([17850.0, 13047.0, 12583.0, np.nan, 15100.0], size=n)
+    return pd.DataFrame({
+        'InvoiceNo': [f'{536365 + i // 4}' for i in range(n)],
+        'StockCode': rng.choice(['85123A', '71053', '84406B', '22752', '21730'], size=n),
+        'Quantity': rng.integers(-3, 20, size=n),
+        'CustomerID': customers
+    })
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    # row group 很小，使同一個 key 的行跨越多個 row group
+    monkeypatch.setattr(drilldown_index, 'ROW_GROUP_SIZE', 97)
+    lines = _lines()
+    assert build_drilldown_index(lines, tmp_path) == ['customer', 'product']
+    return lines, tmp_path
+
+
+def test_lookup_matches_filter(snapshot):
+    lines, output_dir = snapshot
+    index = open_drilldown_index('product', output_dir)
+    for stock_code in lines['StockCode'].unique():
+        result = lookup(index, f' {stock_code} ')
+        expected = lines[lines['StockCode'] == stock_code].reset_index(drop=True)
+        # 穩定排序：同一 key 的行保持原有順序
+        assert list(result['InvoiceNo']) == list(expected['InvoiceNo'])
+        np.testing.assert_array_equal(result['Quantity'], expected['Quantity'])
+
+
+def test_customer_ids_are_normalized(snapshot):
+    lines, output_dir = snapshot
+    index = open_drilldown_index('customer', output_dir)
+    assert list(index['keys']) == ['12583', '13047', '15100', '17850', 'GUEST']
+    assert len(lookup(index, 17850)) == (lines['CustomerID'] == 17850.0).sum()
+    assert len(lookup(index, 'GUEST')) == lines['CustomerID'].isna().sum()
+    assert int(index['counts'].sum()) == len(lines)
+
+
+def test_missing_key_and_missing_snapshot(snapshot, tmp_path):
+    _, output_dir = snapshot
+    result = lookup(open_drilldown_index('product', output_dir), 'NOPE')
+    assert len(result) == 0
+    assert 'StockCode' in result.columns
+    assert open_drilldown_index('product', tmp_path / 'missing') is None
+    assert len(lookup(None, '85123A')) == 0
+
+
+def test_index_mtime_tracks_rebuilds(tmp_path):
+    assert drilldown_index_mtime('product', tmp_path) is None
+    build_drilldown_index(_lines(n=50), tmp_path)
+    first = drilldown_index_mtime('product', tmp_path)
+    assert first is not None
+    index_path = tmp_path / 'product_index.npz'
+    os.utime(index_path, (first + 10, first + 10))
+    assert drilldown_index_mtime('product', tmp_path) == first + 10
+    (tmp_path / 'product.parquet').unlink()
+    assert drilldown_index_mtime('product', tmp_path) is None
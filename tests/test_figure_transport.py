@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from figure_transport import compact_figure, downcast_array
+
+
+def _decode(value):
+    """還原 plotly.js typed array（{'dtype', 'bdata'}）"""
+    if isinstance(value, dict) and 'bdata' in value:
+        return np.frombuffer(base64.b64decode(value['bdata']), dtype=value['dtype'])
+    return np.asarray(value)
+
+
+def test_floats_that_float32_cannot_represent_stay_float64():
+    values = np.array([1234567.891, 0.1, 2.5])
+    result = downcast_array(values)
+    assert result.dtype == np.float64
+    np.testing.assert_array_equal(result, values)
+
+
+def test_exact_float32_values_are_downcast():
+    values = np.array([0.5, 2.25, -8.125, np.nan])
+    result = downcast_array(values)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result.astype(np.float64), values)
+
+
+def test_integers_use_smallest_dtype():
+    assert downcast_array(np.array([1.0, 2.0, 3.0])).dtype == np.int8
+    assert downcast_array(np.array([0, 255])).dtype == np.uint8
+    assert downcast_array(np.array([-1, 40_000])).dtype == np.int32
+
+
+def test_compact_figure_preserves_values():
+    x = [f'2011-{month:02d}' for month in range(1, 13)]
+    revenue = [1234567.891 + month * 1000.37 for month in range(12)]
+    orders = list(range(100, 112))
+    customer_ids = [str(12346 + i) for i in range(12)]
+    fig = go.Figure([
+        go.Scatter(x=x, y=revenue, customdata=customer_ids),
+        go.Bar(x=x, y=orders)
+    ])
+    compact_figure(fig)
+
+    line, bar = json.loads(pio.to_json(fig, validate=False))['data']
+    np.testing.assert_array_equal(_decode(line['y']).astype(np.float64), revenue)
+    np.testing.assert_array_equal(_decode(bar['y']), orders)
+    np.testing.assert_array_equal(_decode(line['customdata']), [int(c) for c in customer_ids])
+    assert list(line['x']) == x
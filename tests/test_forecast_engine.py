@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+import forecast_engine
+from forecast_engine import cached_forecast, fit_ets_batch, forecast_series, future_months, prune_forecast_cache
+
+
+def _series(n_series=40, n_obs=30, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_obs)
+    base = rng.uniform(50, 500, size=(n_series, 1))
+    season = rng.uniform(0, 40, size=(n_series, 1)) * np.sin(2 * np.pi * t / 12)
+    return base + rng.uniform(-3, 3, size=(n_series, 1)) * t + season + rng.normal(0, 5, size=(n_series, n_obs))
+
+
+def test_recovers_linear_trend():
+    t = np.arange(18)
+    result = fit_ets_batch([100 + 5.0 * t, 400 - 2.0 * t], horizon=3)
+    np.testing.assert_allclose(result['forecast'][0], 100 + 5.0 * np.arange(18, 21))
+    np.testing.assert_allclose(result['forecast'][1], 400 - 2.0 * np.arange(18, 21))
+    np.testing.assert_allclose(result['sigma'], 0.0, atol=1e-9)
+
+
+def test_recovers_seasonal_series():
+    t = np.arange(36)
+    seasonal = 10 * np.sin(2 * np.pi * t / 12) + np.where(t % 12 == 11, 25.0, 0.0)
+    values = 200 + 2.0 * t + seasonal
+    result = fit_ets_batch(values[np.newaxis, :], horizon=6, period=12)
+    future = np.arange(36, 42)
+    expected = 200 + 2.0 * future + 10 * np.sin(2 * np.pi * future / 12) + np.where(future % 12 == 11, 25.0, 0.0)
+    np.testing.assert_allclose(result['forecast'][0], expected, rtol=1e-6)
+
+
+def test_intervals_contain_forecast_and_widen():
+    result = fit_ets_batch(_series(), horizon=3)
+    assert (result['lower'] <= result['forecast']).all()
+    assert (result['forecast'] <= result['upper']).all()
+    width = result['upper'] - result['lower']
+    assert (np.diff(width, axis=1) >= -1e-9).all()
+
+
+def test_missing_values_are_filled():
+    values = np.array([[np.nan, 10.0, np.nan, 12.0, 13.0, 14.0], [np.nan] * 6])
+    result = fit_ets_batch(values, horizon=2)
+    assert np.isfinite(result['forecast']).all()
+    np.testing.assert_allclose(result['forecast'][1], 0.0)
+
+
+def test_chunked_and_process_pool_match_serial(monkeypatch):
+    values = _series(n_series=23)
+    serial = fit_ets_batch(values)
+    monkeypatch.setattr(forecast_engine, 'CHUNK_SERIES', 5)
+    monkeypatch.setattr(forecast_engine, 'PARALLEL_MIN_SERIES', 2)
+    chunked = forecast_series(values, max_workers=1)
+    pooled = forecast_series(values, max_workers=2)
+    for key in serial:
+        np.testing.assert_array_equal(chunked[key], serial[key])
+        np.testing.assert_array_equal(pooled[key], serial[key])
+
+
+def test_cached_forecast_round_trip(tmp_path, monkeypatch):
+    names = [f'Country {i}' for i in range(4)]
+    values = _series(n_series=4)
+    first = cached_forecast(names, values, cache_dir=tmp_path)
+    assert len(os.listdir(tmp_path)) == 1
+    assert list(first['Series'][:3]) == [names[0]] * 3
+    assert list(first['Step'][:4]) == [1, 2, 3, 1]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("數據未變時不應重新擬合")
+
+    monkeypatch.setattr(forecast_engine, 'forecast_series', fail)
+    second = cached_forecast(names, values, cache_dir=tmp_path)
+    np.testing.assert_array_equal(second['Forecast'], first['Forecast'])
+
+    with pytest.raises(AssertionError):
+        cached_forecast(names, values + 1, cache_dir=tmp_path)
+
+
+def test_future_months():
+    assert future_months('2011/11') == ['2011-12', '2012-01', '2012-02']
+    assert future_months('2011-12-01', horizon=1) == ['2012-01']
+
+
+def test_corrupt_cache_file_is_a_miss(tmp_path):
+    names = ['UK', 'France']
+    values = _series(n_series=2)
+    expected = cached_forecast(names, values, cache_dir=tmp_path)
+    (cache_file,) = tmp_path.glob('*.npz')
+    data = cache_file.read_bytes()
+    cache_file.write_bytes(data[:len(data) // 2])
+
+    result = cached_forecast(names, values, cache_dir=tmp_path)
+    np.testing.assert_array_equal(result['Forecast'], expected['Forecast'])
+    # 重新擬合後替換為完整文件，沒有殘留臨時文件
+    assert cache_file.read_bytes() == data
+    assert [path.name for path in tmp_path.iterdir()] == [cache_file.name]
+
+
+def test_cache_directory_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(forecast_engine, 'FORECAST_CACHE_MAX_FILES', 3)
+    values = _series(n_series=2)
+    stale_temp = tmp_path / 'crashed.tmp'
+    stale_temp.write_bytes(b'partial')
+    os.utime(stale_temp, (0, 0))
+
+    versions = []
+    for i in range(5):
+        cached_forecast(['UK', 'France'], values + i, cache_dir=tmp_path)
+        versions.append(forecast_engine.dataset_version(['UK', 'France'], values + i,
+                                                        forecast_engine.FORECAST_HORIZON,
+                                                        forecast_engine.SEASONAL_PERIOD))
+        # 確保修改時間遞增
+        os.utime(tmp_path / f'{versions[-1]}.npz', (1000 + i, 1000 + i))
+
+    remaining = sorted(path.stem for path in tmp_path.iterdir())
+    assert remaining == sorted(versions[-3:])
+
+
+def test_prune_keeps_recently_used(tmp_path):
+    for i, name in enumerate(['a', 'b', 'c']):
+        path = tmp_path / f'{name}.npz'
+        path.write_bytes(b'x')
+        os.utime(path, (1000 + i, 1000 + i))
+    fresh_temp = tmp_path / 'writing.tmp'
+    fresh_temp.write_bytes(b'partial')
+    os.utime(tmp_path / 'a.npz')
+    prune_forecast_cache(tmp_path, max_files=2)
+    # 正在寫入的臨時文件不刪除
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a.npz', 'c.npz', 'writing.tmp']
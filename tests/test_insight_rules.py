@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from insight_rules import INSIGHT_RULES, evaluate_rules, load_rules, validate_rule
+
+MONTHS = [f'2011-{month:02d}' for month in range(1, 12)]
+
+
+def _tables(seed=0):
+    rng = np.random.default_rng(seed)
+    normal = rng.integers(900, 1100, size=len(MONTHS))
+    returns = rng.integers(40, 60, size=len(MONTHS))
+    returns[6] = 400
+    countries = ['France', 'Germany', 'Spain']
+    sales = pd.DataFrame({
+        'Country': [country for country in countries for _ in MONTHS],
+        'YearMonth': MONTHS * len(countries),
+        'Revenue': rng.uniform(900, 1100, size=len(countries) * len(MONTHS))
+    })
+    # Germany 最後一個月下降一半
+    sales.loc[(sales['Country'] == 'Germany') & (sales['YearMonth'] == MONTHS[-1]), 'Revenue'] = 500.0
+    return {
+        'mom': pd.DataFrame({'YearMonth': MONTHS, 'Normal_Orders': normal, 'Return_Orders': returns}),
+        'rfm': pd.DataFrame({
+            'Category': ['Lost'] * 4 + ['At Risk'] * 2 + ['Champions'] * 4,
+            'Country': ['France'] * 5 + ['Germany'] * 5,
+            'Monetary': [10.0] * 6 + [500.0] * 4
+        }),
+        'return_product': pd.DataFrame({
+            'StockCode': [f'P{i}' for i in range(8)],
+            'Return_Amount': [5.0, 80.0, np.nan, 30.0, 120.0, 1.0, 60.0, 45.0]
+        }),
+        'sales_by_country': sales
+    }
+
+
+def test_builtin_rules_are_valid():
+    for rule in INSIGHT_RULES:
+        assert validate_rule(rule) == []
+
+
+def test_validate_rule_errors():
+    assert validate_rule('x') == ["規則必須是字典"]
+    errors = validate_rule({'name': 'bad', 'table': 'mom', 'kind': 'threshold', 'title': 't', 'message': 'm',
+                            'metric': 'Revenue', 'op': '=>'})
+    assert any('threshold' in error for error in errors)
+    assert any('=>' in error for error in errors)
+    assert len(validate_rule({'name': 'bad', 'kind': 'nope'})) == 4
+
+
+RULE = {'name': 'r', 'table': 'rfm', 'kind': 'threshold', 'title': 't', 'message': '{count}',
+        'metric': 'Monetary', 'op': '>', 'threshold': 100}
+
+
+@pytest.mark.parametrize('changes, field', [
+    ({'threshold': 'abc'}, 'threshold'),
+    ({'threshold': True}, 'threshold'),
+    ({'threshold': float('nan')}, 'threshold'),
+    ({'kind': 'top_k', 'k': 'five'}, 'k'),
+    ({'kind': 'top_k', 'k': 0}, 'k'),
+    ({'kind': 'trend_break', 'time': 'YearMonth', 'window': 2.5}, 'window'),
+    ({'kind': 'share', 'column': 'Category', 'values': 'Lost'}, 'values'),
+    ({'table': 'orders'}, 'orders'),
+    ({'metric': 5}, 'metric'),
+])
+def test_validate_rule_rejects_bad_types(changes, field):
+    errors = validate_rule(dict(RULE, **changes))
+    assert len(errors) == 1
+    assert field in errors[0]
+
+
+def test_invalid_rules_are_reported_not_raised(tmp_path):
+    path = tmp_path / 'insight_rules.json'
+    path.write_text(json.dumps([
+        dict(RULE, name='bad_threshold', threshold='abc'),
+        dict(RULE, name='bad_k', kind='top_k', k='five'),
+        dict(RULE, name='bad_values', kind='share', column='Category', values='Lost')
+    ]), encoding='utf-8')
+    rules, errors = load_rules(str(path))
+    assert len(errors) == 3
+    assert [rule['name'] for rule in rules] == [rule['name'] for rule in INSIGHT_RULES]
+
+    # 直接傳入的無效規則在評估時跳過並返回警告，不拋出異常
+    insights, warnings = evaluate_rules(_tables(), [dict(RULE, threshold='abc'), dict(RULE, name='ok')])
+    assert [insight['name'] for insight in insights] == ['ok']
+    assert len(warnings) == 1 and 'threshold' in warnings[0]
+
+
+def test_metric_errors_become_warnings():
+    rules = [
+        dict(RULE, name='syntax', metric='Monetary *'),
+        dict(RULE, name='unknown', metric='Monetary / Frequency'),
+        dict(RULE, name='ok', metric='Monetary * 2')
+    ]
+    insights, warnings = evaluate_rules(_tables(), rules)
+    assert [insight['name'] for insight in insights] == ['ok']
+    assert len(warnings) == 2
+    assert 'syntax' in warnings[0] and 'unknown' in warnings[1]
+
+
+def test_load_rules_override_disable_and_errors(tmp_path):
+    path = tmp_path / 'insight_rules.json'
+    path.write_text(json.dumps([
+        {'name': 'churn_risk', 'enabled': False},
+        dict(INSIGHT_RULES[2], k=2),
+        {'name': 'broken', 'kind': 'top_k'},
+        {'name': 'custom', 'table': 'rfm', 'kind': 'threshold', 'title': 'Big', 'message': '{count}',
+         'metric': 'Monetary', 'op': '>=', 'threshold': 100}
+    ]), encoding='utf-8')
+    rules, errors = load_rules(str(path))
+    names = [rule['name'] for rule in rules]
+    assert 'churn_risk' not in names
+    assert names[-1] == 'custom'
+    assert next(rule for rule in rules if rule['name'] == 'top_loss_products')['k'] == 2
+    assert errors and all('broken' in error for error in errors)
+
+    path.write_text('{not json', encoding='utf-8')
+    rules, errors = load_rules(str(path))
+    assert len(rules) == len(INSIGHT_RULES)
+    assert len(errors) == 1
+
+
+def test_builtin_rules_on_sample_tables():
+    insights, warnings = evaluate_rules(_tables())
+    insights = {insight['name']: insight for insight in insights}
+    assert warnings == []
+
+    assert list(insights['return_rate_spike']['hits']['Label']) == [MONTHS[6]]
+    churn = insights['churn_risk']
+    assert churn['hits']['Value'].iloc[0] == pytest.approx(0.6)
+    assert churn['message'].startswith('6 個客戶（60.0%）')
+    assert list(insights['top_loss_products']['hits']['Label']) == ['P4', 'P1', 'P6', 'P7', 'P3']
+    assert '$335' in insights['top_loss_products']['message']
+    assert list(insights['country_revenue_drop']['hits']['Label']) == ['Germany']
+    # 沒有 product_scores / country_cells 表時相應規則跳過
+    assert 'abnormal_products' not in insights
+    assert 'country_cell_anomalies' not in insights
+
+
+def test_grouped_share_and_threshold_rules():
+    rules = [
+        {'name': 'lost_share', 'table': 'rfm', 'kind': 'share', 'title': 't', 'message': '{items}',
+         'column': 'Category', 'values': ['Lost'], 'op': '>=', 'threshold': 0.5, 'group_by': 'Country'},
+        {'name': 'lost_revenue', 'table': 'rfm', 'kind': 'share', 'title': 't', 'message': '{items}',
+         'column': 'Category', 'values': ['Lost', 'At Risk'], 'weight': 'Monetary', 'op': '>', 'threshold': 0.5,
+         'group_by': 'Country'},
+        {'name': 'big', 'table': 'rfm', 'kind': 'threshold', 'title': 't', 'message': '{count}',
+         'metric': 'Monetary * 2', 'op': '>', 'threshold': 500, 'label': '{Country}/{Category}'},
+        {'name': 'missing_column', 'table': 'rfm', 'kind': 'threshold', 'title': 't', 'message': '{count}',
+         'metric': 'Frequency', 'op': '>', 'threshold': 1}
+    ]
+    insights, warnings = evaluate_rules(_tables(), rules)
+    insights = {insight['name']: insight for insight in insights}
+    lost = insights['lost_share']['hits']
+    assert list(lost['Label']) == ['France']
+    assert lost['Value'].iloc[0] == pytest.approx(0.8)
+    weighted = insights['lost_revenue']['hits']
+    assert list(weighted['Label']) == ['France']
+    assert weighted['Value'].iloc[0] == pytest.approx(1.0)
+    assert insights['big']['message'] == '4'
+    assert insights['big']['hits']['Label'].iloc[0] == 'Germany/Champions'
+    assert 'missing_column' not in insights
+    assert len(warnings) == 1 and 'missing_column' in warnings[0] and 'Frequency' in warnings[0]
+
+
+def test_batched_evaluation_matches_single_rules():
+    tables = _tables(seed=3)
+    batched = {insight['name']: insight for insight in evaluate_rules(tables)[0]}
+    for rule in INSIGHT_RULES:
+        single, _ = evaluate_rules(tables, [rule])
+        if rule['name'] not in batched:
+            assert single == []
+            continue
+        assert single[0]['message'] == batched[rule['name']]['message']
+        pd.testing.assert_frame_equal(single[0]['hits'], batched[rule['name']]['hits'])
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from invoice_data import arrow_safe, is_return_line, iter_invoice_chunks, normalize_customer_id, read_invoice_lines
+
+
+def _lines():
+    return pd.DataFrame({
+        'InvoiceNo': ['536365', 'C536379', '536380', '536381', '536382'],
+        'StockCode': ['85123A', '71053', '00123', '22752', '21730'],
+        'Quantity': [6, -1, 2, -4, 3],
+        'CustomerID': [17850.0, np.nan, 13047.0, 12583.0, np.nan]
+    })
+
+
+def test_normalize_customer_id():
+    ids = pd.Series([17850.0, np.nan, '13047', ' 12583 ', '', None], dtype=object)
+    assert list(normalize_customer_id(ids)) == ['17850', 'GUEST', '13047', '12583', 'GUEST', 'GUEST']
+
+
+def test_is_return_line():
+    lines = _lines()
+    np.testing.assert_array_equal(
+        is_return_line(lines['InvoiceNo'], lines['Quantity']),
+        [False, True, False, True, False]
+    )
+    assert not is_return_line(pd.Series(['536365']), pd.Series(['abc'])).any()
+
+
+def test_arrow_safe_converts_mixed_object_columns():
+    df = pd.DataFrame({
+        'StockCode': pd.Series([85123, '71053A', None], dtype=object),
+        'Country': pd.Series(['UK', None, 'France'], dtype=object),
+        0: [1.0, 2.0, 3.0]
+    })
+    safe = arrow_safe(df)
+    assert list(safe['StockCode']) == ['85123', '71053A', None]
+    assert list(safe['Country']) == ['UK', None, 'France']
+    assert list(safe.columns) == ['StockCode', 'Country', '0']
+    assert df['StockCode'].iloc[0] == 85123
+
+
+def test_csv_keeps_codes_as_strings(tmp_path):
+    path = tmp_path / 'lines.csv'
+    _lines().to_csv(path, index=False)
+    df = read_invoice_lines(str(path), ['InvoiceNo', 'StockCode', 'Quantity'])
+    assert list(df['StockCode']) == ['85123A', '71053', '00123', '22752', '21730']
+    assert list(df.columns) == ['InvoiceNo', 'StockCode', 'Quantity']
+
+
+@pytest.mark.parametrize('ext', ['.csv', '.parquet'])
+def test_chunks_match_full_read(tmp_path, ext):
+    if ext == '.parquet':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / f'lines{ext}')
+    lines = _lines().astype({'StockCode': str})
+    if ext == '.csv':
+        lines.to_csv(path, index=False)
+    else:
+        lines.to_parquet(path, index=False)
+
+    chunks = list(iter_invoice_chunks(path, ['InvoiceNo', 'StockCode', 'Quantity'], chunk_rows=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    combined = pd.concat(chunks, ignore_index=True)
+    full = read_invoice_lines(path, ['InvoiceNo', 'StockCode', 'Quantity'])
+    pd.testing.assert_frame_equal(combined, full)
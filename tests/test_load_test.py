@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import numpy as np
+import pytest
+
+import load_test
+from load_test import INTERACTION_SCRIPTS, _apply_step, _run_session, summarize
+
+
+class _Widget:
+    def __init__(self, key, value=None):
+        self.key = key
+        self.value = value
+
+    def set_value(self, value):
+        self.value = value
+        return self
+
+
+class _Widgets(list):
+    """與 AppTest 的控件列表相同：可迭代，也可按 key 查找"""
+
+    def __call__(self, key):
+        for widget in self:
+            if widget.key == key:
+                return widget
+        raise KeyError(key)
+
+
+class _FakeApp:
+    """記錄 run 次數和每次 run 時的控件值；errors / exceptions 按 run 次序給出元素數"""
+
+    def __init__(self, keys=(), errors=None, exceptions=None, failing_runs=()):
+        self.multiselect = _Widgets(_Widget(key, []) for key in keys if key.startswith('cf_') or key == 'other')
+        self.checkbox = _Widgets([_Widget('show_forecast', False)])
+        self.text_input = _Widgets([])
+        self.runs = []
+        self.errors = errors or {}
+        self.exceptions = exceptions or {}
+        self.failing_runs = set(failing_runs)
+        self.error = []
+        self.exception = []
+
+    def run(self):
+        run = len(self.runs)
+        self.runs.append({widget.key: widget.value for widget in self.multiselect})
+        if run in self.failing_runs:
+            raise RuntimeError("timeout")
+        self.error = [object()] * self.errors.get(run, 0)
+        self.exception = [object()] * self.exceptions.get(run, 0)
+
+
+def test_apply_step_sets_and_clears_widgets():
+    app = _FakeApp(keys=['cf_Category', 'cf_YearMonth', 'other'])
+    assert _apply_step(app, 'open', None, None)
+    assert _apply_step(app, 'multiselect', 'cf_Category', ['Lost'])
+    assert _apply_step(app, 'checkbox', 'show_forecast', True)
+    assert app.multiselect('cf_Category').value == ['Lost']
+    assert app.checkbox('show_forecast').value is True
+    # 控件不存在（如未構建明細索引）時跳過該步
+    assert not _apply_step(app, 'text_input', 'drilldown_key', '12346')
+
+    app.multiselect('other').set_value(['x'])
+    assert _apply_step(app, 'clear_filters', None, None)
+    assert app.multiselect('cf_Category').value == []
+    assert app.multiselect('other').value == ['x']
+
+
+@pytest.fixture
+def fake_app(monkeypatch):
+    streamlit_testing = pytest.importorskip('streamlit.testing.v1')
+    apps = []
+
+    def from_file(path, default_timeout):
+        assert path == load_test.APP_FILE
+        app = _FakeApp(keys=['cf_Category', 'cf_YearMonth', 'cf_Country', 'cf_IsGuest'], errors={2: 1},
+                       exceptions={3: 2})
+        apps.append(app)
+        return app
+
+    monkeypatch.setattr(streamlit_testing.AppTest, 'from_file', staticmethod(from_file))
+    return apps
+
+
+def test_run_session_runs_script_and_counts_errors(fake_app):
+    results = []
+    _run_session(7, 'explorer', 2, 10, 0, results, threading.Lock())
+
+    # explorer 的 text_input 步驟沒有對應控件，每輪跳過
+    steps = [action for action, _, _ in INTERACTION_SCRIPTS['explorer'] if action != 'text_input']
+    assert len(fake_app) == 2
+    assert [len(app.runs) for app in fake_app] == [len(steps)] * 2
+    session = results[0]
+    assert session['session'] == 7
+    assert [action for action, _ in session['records']] == steps * 2
+    # 每輪第 3 次 run 有 1 個 st.error，第 4 次 run 有 2 個異常
+    assert session['errors'] == 2 * (1 + 2)
+    assert fake_app[0].runs[1]['cf_Country'] == ['France', 'Germany']
+    assert fake_app[0].runs[-1]['cf_Country'] == []
+
+
+def test_failed_run_counts_as_error(monkeypatch):
+    streamlit_testing = pytest.importorskip('streamlit.testing.v1')
+    app = _FakeApp(keys=['cf_Category', 'cf_YearMonth'], failing_runs={1})
+    monkeypatch.setattr(streamlit_testing.AppTest, 'from_file', staticmethod(lambda path, default_timeout: app))
+    results = []
+    _run_session(0, 'analyst', 1, 10, 0, results, threading.Lock())
+    assert results[0]['errors'] == 1
+    assert len(results[0]['records']) == len(INTERACTION_SCRIPTS['analyst']) - 1
+
+
+def _worker(worker_id, sessions):
+    return {
+        'worker': worker_id,
+        'sessions': sessions,
+        'wall_seconds': 10.0,
+        'cpu_seconds': 5.0,
+        'cpu_utilization': 0.5,
+        'rss_mb': 200.0,
+        'peak_rss_mb': 250.0,
+        'cache_mb': 12.0,
+        'cache_hit_rate': 0.75,
+        'cache_evictions': 3
+    }
+
+
+def test_summarize_percentiles_and_errors():
+    open_latencies = list(np.linspace(1.0, 2.0, 60))
+    rerun_latencies = list(np.linspace(0.1, 0.5, 40))
+    workers = [
+        _worker(0, [
+            {'session': 0, 'records': [('open', value) for value in open_latencies[:30]], 'errors': 1},
+            {'session': 1, 'records': [('rerun', value) for value in rerun_latencies], 'errors': 0}
+        ]),
+        _worker(1, [{'session': 2, 'records': [('open', value) for value in open_latencies[30:]], 'errors': 4}])
+    ]
+    by_step, worker_table, overall = summarize(workers)
+
+    everything = open_latencies + rerun_latencies
+    for name, q in [('p50', 50), ('p95', 95), ('p99', 99)]:
+        assert overall[name] == pytest.approx(np.percentile(everything, q))
+    by_step = by_step.set_index('Step')
+    assert list(by_step.index) == ['open', 'rerun']
+    assert by_step.loc['open', 'Count'] == 60
+    assert by_step.loc['rerun', 'p95'] == pytest.approx(np.percentile(rerun_latencies, 95))
+    assert list(worker_table['Errors']) == [1, 4]
+    assert list(worker_table['Reruns']) == [70, 30]
+    assert list(worker_table['Sessions']) == [2, 1]
+
+
+def test_summarize_without_records():
+    by_step, worker_table, overall = summarize([_worker(0, [{'session': 0, 'records': [], 'errors': 2}])])
+    assert len(by_step) == 0
+    assert np.isnan(overall['p50'])
+    assert worker_table['Errors'].iloc[0] == 2
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from partitioned_dataset import (
+    ingest_tables, list_months, list_stores, load_partitioned, normalize_month, read_manifest,
+    read_partition_table, select_partitions
+)
+
+MONTHS = [f'2011-{month:02d}' for month in range(1, 7)]
+
+
+def _tables(scale=1):
+    return {
+        'mom': pd.DataFrame({'YearMonth': MONTHS, 'Revenue': [100.0 * scale * (i + 1) for i in range(len(MONTHS))]}),
+        'sales_by_country': pd.DataFrame({
+            'Country': ['France', 'Germany'] * len(MONTHS),
+            'YearMonth': [month for month in MONTHS for _ in range(2)],
+            'Revenue': range(2 * len(MONTHS))
+        }),
+        'rfm': pd.DataFrame({
+            'CustomerID': pd.Series([12346, 'GUEST', 12347], dtype=object),
+            'Category': ['Lost', 'GUEST', 'Champions'],
+            'Monetary': [10.0 * scale, 5.0, 300.0]
+        })
+    }
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    ingest_tables(_tables(), 'UK', '2011-06', tmp_path)
+    ingest_tables(_tables(scale=2), 'UK', '2011-03', tmp_path)
+    ingest_tables(_tables(scale=3), 'DE', '2011-06', tmp_path)
+    return tmp_path
+
+
+def _recording_reader(calls):
+    def reader(dataset_dir, partition, name):
+        calls.append((partition['store'], partition['month'], name))
+        return read_partition_table(dataset_dir, partition, name)
+    return reader
+
+
+def test_normalize_month():
+    assert normalize_month('2011/3') == '2011-03'
+    assert normalize_month(pd.Timestamp('2011-11-05')) == '2011-11'
+    assert normalize_month('2011-13') is None
+
+
+def test_manifest_lists_partitions(dataset):
+    manifest = read_manifest(dataset)
+    assert manifest['version'] == 3
+    assert list_stores(manifest) == ['DE', 'UK']
+    assert list_months(manifest, 'UK') == MONTHS
+    assert [entry['month'] for entry in select_partitions(manifest, 'UK', '2011-02', '2011-04')] == MONTHS[1:4]
+
+
+def test_load_reads_only_window_partitions(dataset):
+    calls = []
+    data = load_partitioned('UK', '2011-02', '2011-04', dataset, reader=_recording_reader(calls))
+
+    assert list(data['mom']['YearMonth']) == MONTHS[1:4]
+    assert len(data['sales_by_country']) == 6
+    assert {store for store, _, _ in calls} == {'UK'}
+    assert {month for _, month, name in calls if name != 'rfm'} == set(MONTHS[1:4])
+    # 快照表只讀取截至期間結束月份最新的一期
+    assert [(month, name) for _, month, name in calls if name == 'rfm'] == [('2011-03', 'rfm')]
+    assert data['rfm']['Monetary'].iloc[0] == 20.0
+
+
+def test_snapshot_falls_back_to_latest_before_window(dataset):
+    data = load_partitioned('UK', '2011-04', '2011-05', dataset)
+    assert data['rfm']['Monetary'].iloc[0] == 20.0
+    assert len(load_partitioned('UK', '2011-01', '2011-02', dataset)['rfm']) == 0
+
+
+def test_round_trip_keeps_values(dataset):
+    data = load_partitioned('DE', '2011-01', '2011-06', dataset)
+    expected = _tables(scale=3)
+    pd.testing.assert_series_equal(data['mom']['Revenue'], expected['mom']['Revenue'], check_names=False)
+    assert list(data['rfm']['CustomerID']) == ['12346', 'GUEST', '12347']
+    assert data['aov_arpu'].empty
+
+
+def test_reingest_replaces_table(dataset):
+    ingest_tables({'mom': pd.DataFrame({'YearMonth': ['2011-01'], 'Revenue': [1.0]})}, 'UK', '2011-06', dataset)
+    data = load_partitioned('UK', '2011-01', '2011-01', dataset)
+    assert list(data['mom']['Revenue']) == [1.0]
+
+
+def test_invalid_store_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ingest_tables(_tables(), 'UK/1', '2011-06', tmp_path)
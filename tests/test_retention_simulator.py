@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import retention_simulator
+from retention_simulator import parse_segment, prepare_segments, simulate_campaign
+
+CAMPAIGN = {
+    'At Risk': {'reactivation': 0.25, 'uplift': 0.3},
+    'Lost': {'reactivation': 0.1, 'uplift': 0.2}
+}
+
+
+def _segments(seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        'At Risk': rng.gamma(2.0, 300.0, size=400),
+        'Lost': rng.gamma(2.0, 100.0, size=900),
+        'Champions': rng.gamma(2.0, 2000.0, size=50)
+    }
+
+
+def test_prepare_segments():
+    rfm = pd.DataFrame({
+        'CustomerID': ['12346', 'GUEST', ' guest ', '12347', '12348'],
+        'Category': ['Lost', 'Lost', 'At Risk', 'At Risk', 'Lost'],
+        'Monetary': [100.0, 999.0, 999.0, -5.0, None]
+    })
+    segments = prepare_segments(rfm, customer_col='CustomerID')
+    np.testing.assert_array_equal(segments['Lost'], [100.0, 0.0])
+    np.testing.assert_array_equal(segments['At Risk'], [0.0])
+
+
+def test_means_match_expectation():
+    segments = _segments()
+    result = simulate_campaign(segments, CAMPAIGN, n_draws=4000, seed=1)
+    summary = result['summary'].set_index('Segment')
+    assert list(summary.index) == ['At Risk', 'Lost', 'Total']
+    for name, settings in CAMPAIGN.items():
+        expected = settings['reactivation'] * settings['uplift'] * segments[name].sum()
+        standard_error = result['draws'][name].std() / np.sqrt(4000)
+        assert abs(summary.loc[name, 'Revenue_Mean'] - expected) < 5 * standard_error
+        assert summary.loc[name, 'Reactivated_Mean'] == pytest.approx(
+            settings['reactivation'] * len(segments[name]), rel=0.02
+        )
+    np.testing.assert_allclose(result['draws']['Total'], result['draws'][['At Risk', 'Lost']].sum(axis=1))
+
+
+def test_without_spend_noise_revenue_is_exact_subset_sum():
+    segments = {'Lost': np.array([10.0, 20.0, 40.0])}
+    result = simulate_campaign(segments, {'Lost': {'reactivation': 0.5, 'uplift': 0.5}},
+                               n_draws=200, seed=2, spend_sigma=0)
+    # 每次抽樣的收入只能是某個客戶子集的 Monetary 之和 × 提升
+    possible = {0.5 * total for total in [0, 10, 20, 40, 30, 50, 60, 70]}
+    assert set(result['draws']['Lost'].round(4)) <= possible
+
+
+def test_same_seed_is_reproducible_and_pool_matches_serial(monkeypatch):
+    monkeypatch.setattr(retention_simulator, 'DRAW_CHUNK', 64)
+    segments = _segments()
+    serial = simulate_campaign(segments, CAMPAIGN, n_draws=300, seed=7, max_workers=1)
+    again = simulate_campaign(segments, CAMPAIGN, n_draws=300, seed=7, max_workers=1)
+    pd.testing.assert_frame_equal(serial['draws'], again['draws'])
+
+    monkeypatch.setattr(retention_simulator, 'PARALLEL_MIN_CELLS', 0)
+    pooled = simulate_campaign(segments, CAMPAIGN, n_draws=300, seed=7, max_workers=2)
+    pd.testing.assert_frame_equal(pooled['draws'], serial['draws'])
+    pd.testing.assert_frame_equal(pooled['summary'], serial['summary'])
+
+    other = simulate_campaign(segments, CAMPAIGN, n_draws=300, seed=8, max_workers=1)
+    assert not other['draws'].equals(serial['draws'])
+
+
+def test_cost_and_missing_segments():
+    segments = _segments()
+    result = simulate_campaign(segments, {**CAMPAIGN, 'Hibernating': {'reactivation': 0.5, 'uplift': 1.0}},
+                               n_draws=500, cost_per_customer=2.0)
+    summary = result['summary'].set_index('Segment')
+    assert 'Hibernating' not in summary.index
+    assert summary.loc['Total', 'Customers'] == 1300
+    assert summary.loc['Total', 'Cost'] == pytest.approx(2600.0)
+    np.testing.assert_allclose(summary['Net_Mean'], summary['Revenue_Mean'] - summary['Cost'])
+
+    empty = simulate_campaign(segments, {'Hibernating': {'reactivation': 0.5, 'uplift': 1.0}})
+    assert len(empty['draws']) == 0 and len(empty['summary']) == 0
+
+
+def test_parse_segment():
+    assert parse_segment(' At Risk =0.25,0.3') == ('At Risk', {'reactivation': 0.25, 'uplift': 0.3})
+    assert parse_segment('Lost=0.1') == ('Lost', {'reactivation': 0.1, 'uplift': 0.0})
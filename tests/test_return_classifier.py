@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from return_classifier import (
+    RETURN_CATEGORY_LABELS, classify_returns, compute_return_analysis, write_return_sheets
+)
+
+
+def _lines(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    is_return = rng.random(n) < 0.2
+    quantity = rng.integers(1, 12, size=n)
+    return pd.DataFrame({
+        'InvoiceNo': [f'C{536365 + i}' if flag else f'{536365 + i}' for i, flag in enumerate(is_return)],
+        'StockCode': rng.choice(['85123A', '71053', '84406B', '22752', '21730', 'POST'], size=n),
+        'Quantity': np.where(is_return, -quantity, quantity),
+        'UnitPrice': rng.choice([0.85, 2.55, 3.39, 7.65], size=n),
+        'CustomerID': rng.choice([17850.0, 13047.0, 12583.0, np.nan], size=n)
+    })
+
+
+def _write_csv(tmp_path, lines):
+    path = tmp_path / 'lines.csv'
+    lines.to_csv(path, index=False)
+    return str(path)
+
+
+def test_chunked_matches_unchunked(tmp_path):
+    path = _write_csv(tmp_path, _lines())
+    single = compute_return_analysis(path, chunk_rows=10_000)
+    chunked = compute_return_analysis(path, chunk_rows=37)
+    for kind, key_col in [('product', 'StockCode'), ('customer', 'CustomerID')]:
+        expected = single[kind].sort_values(key_col, ignore_index=True)
+        result = chunked[kind].sort_values(key_col, ignore_index=True)
+        pd.testing.assert_frame_equal(result, expected, check_exact=False)
+
+
+def test_product_totals_match_pandas(tmp_path):
+    lines = _lines()
+    result = compute_return_analysis(_write_csv(tmp_path, lines), chunk_rows=50)['product'].set_index('StockCode')
+
+    returns = lines[lines['Quantity'] < 0]
+    sales = lines[lines['Quantity'] > 0]
+    for stock_code, group in returns.groupby('StockCode'):
+        row = result.loc[stock_code]
+        assert row['Return_Count'] == len(group)
+        assert row['Return_Amount'] == pytest.approx((-group['Quantity'] * group['UnitPrice']).sum())
+        sold = sales.loc[sales['StockCode'] == stock_code, 'Quantity'].sum()
+        assert row['Return_Rate'] == pytest.approx(min(-group['Quantity'].sum() / sold, 1.0))
+
+
+def test_customers_without_id_are_guest(tmp_path):
+    lines = _lines()
+    result = compute_return_analysis(_write_csv(tmp_path, lines), chunk_rows=50)['customer']
+    assert set(result['CustomerID']) <= {'17850', '13047', '12583', 'GUEST'}
+    guest_returns = lines['CustomerID'].isna() & (lines['Quantity'] < 0)
+    assert result.set_index('CustomerID').loc['GUEST', 'Return_Count'] == guest_returns.sum()
+
+
+def test_classify_returns_thresholds():
+    labels = RETURN_CATEGORY_LABELS['product']
+    assert list(classify_returns([1.0, 0.2, 0.05, 0.0, np.nan])) == [
+        labels['outlier'], labels['high'], labels['medium'], labels['low'], 'Unknown'
+    ]
+    # 大於 1 的退貨率視為百分比
+    assert list(classify_returns([100, 20, 4], 'customer')) == [
+        RETURN_CATEGORY_LABELS['customer'][level] for level in ('outlier', 'high', 'low')
+    ]
+
+
+def test_write_keeps_other_sheets(tmp_path):
+    output = tmp_path / 'Return and Abnormal.xlsx'
+    pd.DataFrame({'StockCode': ['85123A']}).to_excel(output, sheet_name='Abnormal analysis product', index=False)
+    results = compute_return_analysis(_write_csv(tmp_path, _lines()))
+    write_return_sheets(results, output)
+    sheets = pd.read_excel(output, sheet_name=None)
+    assert set(sheets) == {'Abnormal analysis product', 'Return analysis product', 'Return analysis customer'}
+    assert len(sheets['Return analysis product']) == len(results['product'])
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from streaming_export import iter_csv, iter_parquet, iter_xlsx
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def _frame():
+    return pd.DataFrame({
+        'StockCode': pd.Series(['85123A', 71053, 'POST', None, 22423], dtype=object),
+        'Description': pd.Series(['HEART', 'LANTERN', None, 'MUG', 'CAKE'], dtype=object),
+        'Country': ['United Kingdom', 'France', 'EIRE', 'Germany', 'Spain'],
+        'Quantity': [6, 8, 1, 12, 3],
+        'Revenue': [15.3, 20.34, 18.0, np.nan, 38.25]
+    })
+
+
+def test_parquet_round_trip_with_object_columns():
+    df = _frame()
+    table = pq.read_table(io.BytesIO(b''.join(iter_parquet(df, chunk_rows=2))))
+    result = table.to_pandas()
+
+    assert table.num_rows == len(df)
+    assert table.column('StockCode').to_pylist() == ['85123A', '71053', 'POST', None, '22423']
+    assert table.column('Description').to_pylist() == ['HEART', 'LANTERN', None, 'MUG', 'CAKE']
+    assert list(result['Country']) == list(df['Country'])
+    np.testing.assert_array_equal(result['Quantity'], df['Quantity'])
+    np.testing.assert_array_equal(result['Revenue'], df['Revenue'])
+
+
+def test_parquet_applies_mask_per_chunk():
+    df = _frame()
+    mask = np.array([True, False, True, False, True])
+    result = pq.read_table(io.BytesIO(b''.join(iter_parquet(df, chunk_rows=2, mask=mask)))).to_pandas()
+    assert list(result['Country']) == ['United Kingdom', 'EIRE', 'Spain']
+
+
+def test_parquet_all_null_object_column():
+    df = pd.DataFrame({'Note': pd.Series([None, None], dtype=object), 'Value': [1, 2]})
+    result = pq.read_table(io.BytesIO(b''.join(iter_parquet(df)))).to_pandas()
+    assert result['Note'].isna().all()
+    assert list(result['Value']) == [1, 2]
+
+
+def test_csv_round_trip():
+    df = _frame()
+    result = pd.read_csv(io.BytesIO(b''.join(iter_csv(df, chunk_rows=2))), encoding='utf-8-sig', dtype={'StockCode': str})
+    assert list(result.columns) == list(df.columns)
+    assert list(result['Country']) == list(df['Country'])
+    np.testing.assert_allclose(result['Revenue'], df['Revenue'])
+
+
+def test_xlsx_round_trip():
+    pytest.importorskip('xlsxwriter')
+    df = _frame()
+    result = pd.read_excel(io.BytesIO(b''.join(iter_xlsx(df, chunk_rows=2))))
+    assert len(result) == len(df)
+    assert list(result['Country']) == list(df['Country'])
@@ -1,3 +1,5 @@
+import hmac
+import os
 import pandas as pd
 import numpy as np
 import warnings
@@ -6,6 +8,19 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime
+from functools import partial
+from anomaly_engine import ANOMALY_Z_THRESHOLD, build_series_matrix, score_products, score_series
+from affinity_engine import AFFINITY_INDEX_FILE, load_affinity_index, query_affinity, top_skus_from_sheet
+from cache_budget import budgeted_cache, cache_stats, clear_cache
+from drilldown_index import DRILLDOWN_DIR, drilldown_index_mtime, lookup, open_drilldown_index
+from figure_transport import compact_figure
+from forecast_engine import FORECAST_HORIZON, cached_forecast, future_months
+from insight_rules import evaluate_rules, load_rules
+from partitioned_dataset import DATASET_DIR, list_months, list_stores, load_partitioned, normalize_month, read_manifest
+from retention_simulator import DEFAULT_CAMPAIGN, N_DRAWS, prepare_segments, simulate_campaign
+from return_classifier import classify_returns
+from streaming_export import EXPORT_MIME_TYPES, available_formats, spooled_export
+from bitmap_index import CROSS_FILTER_DIMENSIONS, build_bitmap_index, dimension_values, filter_mask, masked_group_sum
 
 # 抑制 Streamlit 的 ScriptRunContext 警告（在 bare mode 下可以安全忽略）
 warnings.filterwarnings("ignore", message=".*missing ScriptRunContext.*")
@@ -57,50 +72,52 @@ def find_column(df, keywords):
                 return col
     return None
 
-# 加載數據
-@st.cache_data
-def load_data():
-    """加載並處理數據"""
+# 讀取數據文件
+@budgeted_cache
+def read_data_files():
+    """讀取彙總表和 Return and Abnormal 文件，返回 (數據字典, 加載狀態消息列表)。
+    緩存不會重放函數內的 st 元素，因此加載狀態以 (級別, 文本) 記錄，由 load_data() 顯示"""
+    messages = []
     try:
         # 從彙總表.xlsx讀取數據
         # 讀取MOM數據
         try:
             mom_df = pd.read_excel('彙總表.xlsx', sheet_name='MOM')
-            st.success(f"✓ 成功加載 MOM 數據: {len(mom_df)} 行")
+            messages.append(('success', f"✓ 成功加載 MOM 數據: {len(mom_df)} 行"))
         except Exception as e:
-            st.error(f"✗ 無法加載 MOM 數據: {e}")
+            messages.append(('error', f"✗ 無法加載 MOM 數據: {e}"))
             mom_df = pd.DataFrame()
         
         # 讀取AOV_ARPU數據
         try:
             aov_arpu_df = pd.read_excel('彙總表.xlsx', sheet_name='AOV_ARPU')
-            st.success(f"✓ 成功加載 AOV_ARPU 數據: {len(aov_arpu_df)} 行")
+            messages.append(('success', f"✓ 成功加載 AOV_ARPU 數據: {len(aov_arpu_df)} 行"))
         except Exception as e:
-            st.warning(f"⚠ 無法加載 AOV_ARPU 數據: {e}")
+            messages.append(('warning', f"⚠ 無法加載 AOV_ARPU 數據: {e}"))
             aov_arpu_df = pd.DataFrame()
         
         # 讀取RFM數據
         try:
             rfm_df = pd.read_excel('彙總表.xlsx', sheet_name='RFM')
-            st.success(f"✓ 成功加載 RFM 數據: {len(rfm_df)} 行")
+            messages.append(('success', f"✓ 成功加載 RFM 數據: {len(rfm_df)} 行"))
         except Exception as e:
-            st.warning(f"⚠ 無法加載 RFM 數據: {e}")
+            messages.append(('warning', f"⚠ 無法加載 RFM 數據: {e}"))
             rfm_df = pd.DataFrame()
         
         # 讀取SKU數據
         try:
             sku_df = pd.read_excel('彙總表.xlsx', sheet_name='SKU')
-            st.success(f"✓ 成功加載 SKU 數據: {len(sku_df)} 行")
+            messages.append(('success', f"✓ 成功加載 SKU 數據: {len(sku_df)} 行"))
         except Exception as e:
-            st.warning(f"⚠ 無法加載 SKU 數據: {e}")
+            messages.append(('warning', f"⚠ 無法加載 SKU 數據: {e}"))
             sku_df = pd.DataFrame()
         
         # 讀取Sales by Country數據
         try:
             sales_by_country_df = pd.read_excel('彙總表.xlsx', sheet_name='Sales by Country')
-            st.success(f"✓ 成功加載 Sales by Country 數據: {len(sales_by_country_df)} 行")
+            messages.append(('success', f"✓ 成功加載 Sales by Country 數據: {len(sales_by_country_df)} 行"))
         except Exception as e:
-            st.warning(f"⚠ 無法加載 Sales by Country 數據: {e}")
+            messages.append(('warning', f"⚠ 無法加載 Sales by Country 數據: {e}"))
             sales_by_country_df = pd.DataFrame()
         
         # 讀取Return and Abnormal數據（如果存在）
@@ -110,16 +127,25 @@ def load_data():
             return_abnormal_file = 'Return and Abnormal_2011_11.xlsx'
             return_product_df = pd.read_excel(return_abnormal_file, sheet_name='Return analysis product')
             abnormal_product_df = pd.read_excel(return_abnormal_file, sheet_name='Abnormal analysis product')
-            st.success(f"✓ 成功加載 Return and Abnormal 數據")
+            messages.append(('success', f"✓ 成功加載 Return and Abnormal 數據"))
         except:
             # 嘗試其他可能的文件名
             try:
                 return_abnormal_file = 'Return and Abnormal.xlsx'
                 return_product_df = pd.read_excel(return_abnormal_file, sheet_name='Return analysis product')
                 abnormal_product_df = pd.read_excel(return_abnormal_file, sheet_name='Abnormal analysis product')
-                st.success(f"✓ 成功加載 Return and Abnormal 數據")
+                messages.append(('success', f"✓ 成功加載 Return and Abnormal 數據"))
+            except:
+                messages.append(('info', "ℹ 未找到 Return and Abnormal 數據文件（可選）"))
+        
+        # 讀取客戶退貨數據（如果存在）
+        return_customer_df = pd.DataFrame()
+        for return_abnormal_file in ['Return and Abnormal_2011_11.xlsx', 'Return and Abnormal.xlsx']:
+            try:
+                return_customer_df = pd.read_excel(return_abnormal_file, sheet_name='Return analysis customer')
+                break
             except:
-                st.info("ℹ 未找到 Return and Abnormal 數據文件（可選）")
+                continue
         
         return {
             'mom': mom_df,
@@ -128,44 +154,264 @@ def load_data():
             'sku': sku_df,
             'sales_by_country': sales_by_country_df,
             'return_product': return_product_df,
+            'return_customer': return_customer_df,
             'abnormal_product': abnormal_product_df
-        }
+        }, messages
+    except Exception as e:
+        messages.append(('error', f"加載數據時發生嚴重錯誤: {e}"))
+        import traceback
+        messages.append(('code', traceback.format_exc()))
+        return None, messages
+
+# 加載數據
+def load_data():
+    """加載並處理數據（讀取結果已緩存，每次 rerun 都顯示加載狀態）"""
+    data, messages = read_data_files()
+    for level, text in messages:
+        getattr(st, level)(text)
+    return data
+
+# 讀取分區數據文件（按文件路徑和修改時間緩存，切換門店或期間時只讀取未緩存的分區）
+@budgeted_cache
+def read_dataset_file(path, mtime):
+    """讀取分區中的一個 parquet 文件"""
+    return pd.read_parquet(path)
+
+def read_cached_partition(dataset_dir, partition, name):
+    """load_partitioned 的讀取函數"""
+    path = os.path.join(dataset_dir, partition['path'], partition['tables'][name]['file'])
+    return read_dataset_file(path, os.path.getmtime(path))
+
+# 從分區數據集加載
+def load_partitioned_data(manifest, store, window):
+    """只讀取所選門店和期間內的分區，返回與 load_data() 相同結構的字典"""
+    try:
+        return load_partitioned(store, window[0], window[1], DATASET_DIR, manifest, read_cached_partition)
     except Exception as e:
-        st.error(f"加載數據時發生嚴重錯誤: {e}")
+        st.error(f"加載分區數據時發生錯誤: {e}")
         import traceback
         st.code(traceback.format_exc())
         return None
 
-# 篩選2011/01 - 2011/11的數據
-def filter_2011_data(df, date_column='YearMonth'):
-    """篩選2011年1月到11月的數據"""
+# 門店和期間選擇
+def render_dataset_selector(manifest):
+    """在側邊欄選擇門店和分析期間，返回 (門店, (開始月份, 結束月份))；門店沒有分區時返回 None"""
+    stores = list_stores(manifest)
+    if len(stores) == 0:
+        return None
+    
+    st.sidebar.markdown("## 🏬 Store & Period")
+    store = st.sidebar.selectbox("門店", stores, key='dataset_store')
+    months = list_months(manifest, store)
+    # 切換門店後原期間不在選項中時，重置為該門店的全部月份
+    if st.session_state.get('dataset_window') is not None:
+        start, end = st.session_state['dataset_window']
+        if start not in months or end not in months:
+            del st.session_state['dataset_window']
+    if len(months) > 1:
+        window = st.sidebar.select_slider(
+            "分析期間", options=months, value=(months[0], months[-1]), key='dataset_window'
+        )
+    else:
+        window = (months[0], months[0])
+    st.sidebar.caption(f"共 {len(months)} 個月份分區，只讀取所選期間的分區")
+    return store, tuple(window)
+
+# 分析期間顯示文字
+def format_window(window):
+    """('2011-01', '2011-11') -> '2011年1月 - 2011年11月'"""
+    return ' - '.join(f"{month[:4]}年{int(month[5:])}月" for month in window)
+
+# 預設分析期間（單一彙總表模式）
+DEFAULT_DATA_WINDOW = ('2011-01', '2011-11')
+
+# 當前分析期間
+def current_window():
+    """側邊欄選擇的分析期間，未選擇時為2011年1月到11月。只在緩存函數外讀取，再作為參數傳入緩存函數"""
+    return tuple(st.session_state.get('data_window', DEFAULT_DATA_WINDOW))
+
+# 篩選分析期間的數據
+def filter_period_data(df, window, date_column='YearMonth'):
+    """篩選分析期間 window =（開始月份, 結束月份）內（含首尾月份）的數據，月份列統一為 YYYY-MM"""
     if df is None or len(df) == 0:
         return df
     
     if date_column in df.columns:
-        # 轉換YearMonth為字符串格式以便篩選
-        df[date_column] = df[date_column].astype(str)
-        # 篩選2011年的數據
-        filtered = df[df[date_column].str.startswith('2011')].copy()
-        # 排除2011年12月
-        filtered = filtered[~filtered[date_column].str.contains('2011-12')]
+        start, end = window
+        # 統一為 YYYY-MM（兼容 "2011/11"、日期等格式），各區塊和篩選器使用相同的月份標籤
+        months = df[date_column].map(normalize_month)
+        df[date_column] = months.fillna(df[date_column].astype(str))
+        filtered = df[months.notna() & (months >= start) & (months <= end)].copy()
         return filtered
     return df
 
+# 分析期間內的國家銷售表
+def period_sales_by_country(sales_by_country_df, window):
+    """按分析期間篩選國家銷售表，行序與交叉篩選索引一致；沒有月份列時返回原表"""
+    month_col = find_column(sales_by_country_df, ['YearMonth', 'Month'])
+    if month_col is None:
+        return sales_by_country_df
+    return filter_period_data(sales_by_country_df.copy(), window, month_col)
+
+# RFM Category 和 GUEST 標籤
+def rfm_segment_labels(rfm_df):
+    """返回 (CustomerID -> Category 映射, 每行的 GUEST/Others 標籤)"""
+    customer_id_col = find_column(rfm_df, ['CustomerID', 'Customer ID', 'Customer', 'customer'])
+    if not customer_id_col:
+        return None, None
+    customer_ids = rfm_df[customer_id_col].astype(str).str.strip()
+    guest_labels = np.where(customer_ids.str.upper() == 'GUEST', 'GUEST', 'Others')
+    category_map = None
+    if 'Category' in rfm_df.columns:
+        category_map = pd.Series(rfm_df['Category'].to_numpy(), index=customer_ids)
+        category_map = category_map[~category_map.index.duplicated()]
+    return category_map, guest_labels
+
+# 構建交叉篩選位圖索引（數據不變時只構建一次）
+@budgeted_cache
+def build_cross_filter_indexes(mom_df, aov_arpu_df, rfm_df, sales_by_country_df, return_customer_df, window):
+    """為每個數據表中存在的篩選維度構建位圖索引"""
+    indexes = {}
+    
+    # 月度表：YearMonth（與各區塊使用的期間篩選結果行序一致）
+    for name, df in [('mom', mom_df), ('aov_arpu', aov_arpu_df)]:
+        df = filter_period_data(df.copy(), window)
+        if len(df) > 0 and 'YearMonth' in df.columns:
+            indexes[name] = build_bitmap_index(df[['YearMonth']])
+    
+    # 國家銷售表：Country、YearMonth（與 period_sales_by_country 的結果行序一致）
+    sales_by_country_df = period_sales_by_country(sales_by_country_df, window)
+    country_col = find_column(sales_by_country_df, ['Country'])
+    month_col = find_column(sales_by_country_df, ['YearMonth', 'Month'])
+    if country_col and len(sales_by_country_df) > 0:
+        dims = {'Country': sales_by_country_df[country_col]}
+        if month_col:
+            dims['YearMonth'] = sales_by_country_df[month_col]
+        indexes['sales_by_country'] = build_bitmap_index(pd.DataFrame(dims))
+    
+    # RFM 表：Category、IsGuest
+    category_map, guest_labels = rfm_segment_labels(rfm_df)
+    if guest_labels is not None:
+        dims = {'IsGuest': guest_labels}
+        if 'Category' in rfm_df.columns:
+            dims['Category'] = rfm_df['Category'].fillna('Unknown').to_numpy()
+        indexes['rfm'] = build_bitmap_index(pd.DataFrame(dims))
+    
+    # 客戶退貨表：通過 CustomerID 關聯 RFM Category
+    customer_id_col = find_column(return_customer_df, ['customer', 'id'])
+    if customer_id_col and category_map is not None:
+        customer_ids = return_customer_df[customer_id_col].astype(str).str.strip()
+        indexes['return_customer'] = build_bitmap_index(pd.DataFrame({
+            'Category': customer_ids.map(category_map).fillna('Unknown').to_numpy(),
+            'IsGuest': np.where(customer_ids.str.upper() == 'GUEST', 'GUEST', 'Others')
+        }))
+    
+    return indexes
+
+# 獲取某個數據表的交叉篩選掩碼
+def cross_filter_mask(cross_filter, frame_name):
+    """沒有生效的篩選（或該表沒有相關維度）時返回 None"""
+    if not cross_filter:
+        return None
+    return filter_mask(cross_filter['indexes'].get(frame_name), cross_filter['selections'])
+
+# 清除交叉篩選
+def clear_cross_filters():
+    for dim in CROSS_FILTER_DIMENSIONS:
+        st.session_state[f'cf_{dim}'] = []
+
+# 將圖表點擊轉為交叉篩選
+def apply_chart_selection(chart_key, dimension):
+    """讀取圖表選中的點（customdata 優先，其次 x / label），寫入對應維度的篩選"""
+    event = st.session_state.get(chart_key)
+    if not event:
+        return
+    values = []
+    for point in event['selection']['points']:
+        value = point.get('customdata', point.get('x', point.get('label')))
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        if value is not None:
+            values.append(str(value))
+    st.session_state[f'cf_{dimension}'] = sorted(set(values))
+
+# 生成交叉篩選側邊欄
+def render_cross_filters(data):
+    """在側邊欄顯示各維度的篩選器，返回 {'indexes', 'selections'}"""
+    indexes = build_cross_filter_indexes(
+        data.get('mom', pd.DataFrame()),
+        data.get('aov_arpu', pd.DataFrame()),
+        data.get('rfm', pd.DataFrame()),
+        data.get('sales_by_country', pd.DataFrame()),
+        data.get('return_customer', pd.DataFrame()),
+        current_window()
+    )
+    
+    st.sidebar.markdown("## 🎯 Cross Filters")
+    st.sidebar.caption("點擊圖表中的月份、國家、RFM 類別或 GUEST 柱也可以篩選")
+    selections = {}
+    for dim in CROSS_FILTER_DIMENSIONS:
+        options = dimension_values(indexes.values(), dim)
+        if len(options) == 0:
+            continue
+        # 已選取值不在選項中時（例如數據更新後）丟棄
+        key = f'cf_{dim}'
+        if key in st.session_state:
+            st.session_state[key] = [value for value in st.session_state[key] if value in options]
+        selections[dim] = st.sidebar.multiselect(dim, options, key=key)
+    st.sidebar.button("清除篩選", on_click=clear_cross_filters)
+    
+    return {'indexes': indexes, 'selections': selections}
+
+# 生成導出按鈕
+def render_export_buttons(df, name, key, mask=None):
+    """為當前篩選視圖生成 CSV / Parquet / xlsx 下載按鈕；點擊時才流式生成文件，不會在每次 rerun 時序列化"""
+    if df is None or len(df) == 0:
+        return
+    row_count = len(df) if mask is None else int(mask.sum())
+    formats = available_formats()
+    cols = st.columns(len(formats) + 1)
+    with cols[0]:
+        st.caption(f"導出 {name}（{row_count:,} 行）")
+    for col, fmt in zip(cols[1:], formats):
+        with col:
+            st.download_button(
+                label=f"⬇ {fmt.upper()}",
+                data=partial(spooled_export, df, fmt, mask),
+                file_name=f"{name}.{fmt}",
+                mime=EXPORT_MIME_TYPES[fmt],
+                on_click='ignore',
+                key=f'export_{key}_{fmt}'
+            )
+
+# 以緊湊格式顯示圖表
+def show_chart(fig, **kwargs):
+    """壓縮數值數組和模板後交給 st.plotly_chart，參數與 st.plotly_chart 相同"""
+    return st.plotly_chart(compact_figure(fig), **kwargs)
+
 # 生成KPI卡片
-def generate_kpi(data):
+def generate_kpi(data, cross_filter=None):
     """生成KPI概覽卡片（只顯示最後一個月的數據）"""
     if data is None:
         st.error("無法加載數據")
         return
     
-    mom_df = filter_2011_data(data['mom'])
-    aov_arpu_df = filter_2011_data(data['aov_arpu'])
+    mom_df = filter_period_data(data['mom'], current_window())
+    aov_arpu_df = filter_period_data(data['aov_arpu'], current_window())
     
     if len(mom_df) == 0:
-        st.warning("沒有2011年的數據")
+        st.warning("所選期間沒有數據")
         return
     
+    # 月份篩選：以選中的最後一個月作為展示月份，前一個月仍取自完整序列
+    month_mask = cross_filter_mask(cross_filter, 'mom')
+    if month_mask is not None:
+        selected_positions = np.flatnonzero(month_mask)
+        if len(selected_positions) == 0:
+            st.warning("篩選條件下沒有月度數據")
+            return
+        mom_df = mom_df.iloc[:selected_positions[-1] + 1]
+    
     # 獲取最後一個月的數據
     last_month_data = mom_df.iloc[-1]
     last_month = last_month_data['YearMonth'] if 'YearMonth' in last_month_data.index else 'N/A'
@@ -285,22 +531,146 @@ def generate_kpi(data):
             value=f"{return_rate:.2f}%",
             delta=None
         )
+    
+    # 第四行KPI卡片：交叉篩選下的國家收入和客戶細分
+    if cross_filter:
+        selections = cross_filter['selections']
+        indexes = cross_filter['indexes']
+        filtered_metrics = []
+        
+        sales_by_country_df = period_sales_by_country(data.get('sales_by_country', pd.DataFrame()), current_window())
+        revenue_col = find_column(sales_by_country_df, ['Revenue', 'Sales', 'Amount'])
+        if selections.get('Country') and revenue_col and 'sales_by_country' in indexes:
+            country_mask = filter_mask(indexes['sales_by_country'], {
+                'Country': selections['Country'],
+                'YearMonth': [str(last_month)]
+            })
+            country_revenue = pd.to_numeric(sales_by_country_df[revenue_col], errors='coerce').to_numpy()[country_mask]
+            filtered_metrics.append(("Revenue (Selected Countries)", f"${np.nansum(country_revenue):,.0f}"))
+        
+        rfm_mask = cross_filter_mask(cross_filter, 'rfm')
+        rfm_df = data.get('rfm', pd.DataFrame())
+        if rfm_mask is not None and 'Monetary' in rfm_df.columns:
+            segment_monetary = pd.to_numeric(rfm_df['Monetary'], errors='coerce').to_numpy()[rfm_mask]
+            filtered_metrics.append(("Selected Customers", f"{int(rfm_mask.sum()):,}"))
+            filtered_metrics.append(("Selected Monetary", f"${np.nansum(segment_monetary):,.0f}"))
+        
+        if filtered_metrics:
+            for col, (label, value) in zip(st.columns(len(filtered_metrics)), filtered_metrics):
+                with col:
+                    st.metric(label=label, value=value, delta=None)
+
+# 計算預測（數據版本不變時讀取緩存）
+@budgeted_cache
+def compute_forecasts(mom_df, aov_arpu_df, sales_by_country_df, window, include_countries=False):
+    """把各指標（及各國家收入）組成一個矩陣批量擬合，返回預測長表和未來月份"""
+    mom_df = filter_period_data(mom_df.copy(), window)
+    if len(mom_df) < 3 or 'YearMonth' not in mom_df.columns:
+        return None
+    
+    history = mom_df.set_index(mom_df['YearMonth'].astype(str))
+    aov_arpu_df = filter_period_data(aov_arpu_df.copy(), window)
+    if len(aov_arpu_df) > 0 and 'YearMonth' in aov_arpu_df.columns:
+        aov_arpu_cols = [col for col in ['AOV', 'ARPU'] if col in aov_arpu_df.columns]
+        history = history.join(aov_arpu_df.set_index(aov_arpu_df['YearMonth'].astype(str))[aov_arpu_cols])
+    
+    metric_cols = [col for col in ['Revenue', 'Normal_Orders', 'Customer', 'AOV', 'ARPU'] if col in history.columns]
+    series = history[metric_cols].apply(pd.to_numeric, errors='coerce').T
+    
+    # 各國家月度收入，對齊到 MOM 的月份
+    country_col = find_column(sales_by_country_df, ['Country'])
+    month_col = find_column(sales_by_country_df, ['YearMonth', 'Month'])
+    revenue_col = find_column(sales_by_country_df, ['Revenue', 'Sales', 'Amount'])
+    if include_countries and country_col and month_col and revenue_col:
+        keys, periods, matrix = build_series_matrix(sales_by_country_df, country_col, month_col, revenue_col)
+        country_series = pd.DataFrame(matrix, index='Country:' + keys[country_col].astype(str), columns=periods)
+        series = pd.concat([series, country_series.reindex(columns=series.columns)])
+    
+    forecast_df = cached_forecast(series.index.tolist(), series.to_numpy(dtype=float), FORECAST_HORIZON)
+    last_month = series.columns[-1]
+    forecast_df['YearMonth'] = np.tile(future_months(last_month, FORECAST_HORIZON), len(series))
+    return {
+        'forecast': forecast_df,
+        'last_month': last_month,
+        'last_values': series[last_month].to_dict()
+    }
+
+# 添加預測疊加層
+def add_forecast_overlay(fig, forecasts, series, color, **trace_kwargs):
+    """在圖表上添加預測線（從最後一個實際值接出）和 95% 預測區間"""
+    if forecasts is None:
+        return
+    series_df = forecasts['forecast'][forecasts['forecast']['Series'] == series]
+    if len(series_df) == 0:
+        return
+    
+    months = series_df['YearMonth'].tolist()
+    fill_color = f"rgba({int(color[1:3], 16)}, {int(color[3:5], 16)}, {int(color[5:7], 16)}, 0.2)"
+    fig.add_trace(
+        go.Scatter(
+            x=months + months[::-1],
+            y=series_df['Upper'].tolist() + series_df['Lower'].tolist()[::-1],
+            fill='toself',
+            fillcolor=fill_color,
+            line=dict(width=0),
+            hoverinfo='skip',
+            name=f'{series} 95% PI',
+            showlegend=False
+        ),
+        **trace_kwargs
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=[forecasts['last_month']] + months,
+            y=[forecasts['last_values'].get(series)] + series_df['Forecast'].tolist(),
+            name=f'{series} Forecast',
+            line=dict(color=color, width=2, dash='dot'),
+            mode='lines+markers'
+        ),
+        **trace_kwargs
+    )
 
 # 生成月度趨勢圖表
-def generate_mom_charts(data):
+def generate_mom_charts(data, cross_filter=None):
     """生成月度趨勢圖表（包含 Revenue, Orders, Customer, AOV, ARPU）"""
     st.markdown("## 📈 Monthly Trends (MOM)")
     
     if data is None:
         return
     
-    mom_df = filter_2011_data(data['mom'])
-    aov_arpu_df = filter_2011_data(data['aov_arpu'])
+    mom_df = filter_period_data(data['mom'], current_window())
+    aov_arpu_df = filter_period_data(data['aov_arpu'], current_window())
     
     if len(mom_df) == 0:
-        st.warning("沒有2011年的數據")
+        st.warning("所選期間沒有數據")
         return
     
+    # 月份篩選
+    month_mask = cross_filter_mask(cross_filter, 'mom')
+    if month_mask is not None:
+        mom_df = mom_df[month_mask]
+        if len(mom_df) == 0:
+            st.warning("篩選條件下沒有月度數據")
+            return
+    
+    # 預測疊加層（基於所選期間的完整歷史）
+    col_forecast, col_country_forecast = st.columns(2)
+    with col_forecast:
+        show_forecast = st.checkbox(f"顯示預測（未來 {FORECAST_HORIZON} 個月，95% 預測區間）", key='show_forecast')
+    with col_country_forecast:
+        include_countries = st.checkbox("包含各國家收入預測", key='forecast_countries', disabled=not show_forecast)
+    forecasts = None
+    if show_forecast:
+        forecasts = compute_forecasts(
+            data['mom'], data.get('aov_arpu', pd.DataFrame()), data.get('sales_by_country', pd.DataFrame()),
+            current_window(), include_countries
+        )
+    
+    # 國家篩選：從國家銷售表按月份做掩碼聚合（行序與交叉篩選索引一致）
+    sales_by_country_df = period_sales_by_country(data.get('sales_by_country', pd.DataFrame()), current_window())
+    revenue_col = find_column(sales_by_country_df, ['Revenue', 'Sales', 'Amount'])
+    country_index = cross_filter['indexes'].get('sales_by_country') if cross_filter else None
+    
     # 第一張圖：Revenue 和 Orders 線圖（使用雙Y軸）
     fig1 = make_subplots(specs=[[{"secondary_y": True}]])
     
@@ -316,6 +686,27 @@ def generate_mom_charts(data):
             row=1, col=1, secondary_y=False
         )
     
+    if cross_filter and cross_filter['selections'].get('Country') and revenue_col and country_index and 'YearMonth' in country_index['dims']:
+        month_entry = country_index['dims']['YearMonth']
+        country_mask = filter_mask(country_index, cross_filter['selections'])
+        country_revenue = masked_group_sum(
+            month_entry['codes'],
+            pd.to_numeric(sales_by_country_df[revenue_col], errors='coerce').to_numpy(),
+            country_mask,
+            len(month_entry['values'])
+        )
+        country_revenue = pd.Series(country_revenue, index=month_entry['values']).reindex(mom_df['YearMonth'].astype(str))
+        fig1.add_trace(
+            go.Scatter(
+                x=mom_df['YearMonth'],
+                y=country_revenue.to_numpy(),
+                name='Revenue (Selected Countries)',
+                line=dict(color='#1f77b4', width=2, dash='dash'),
+                mode='lines+markers'
+            ),
+            row=1, col=1, secondary_y=False
+        )
+    
     if 'Normal_Orders' in mom_df.columns:
         fig1.add_trace(
             go.Scatter(
@@ -349,6 +740,9 @@ def generate_mom_charts(data):
                 row=1, col=1, secondary_y=False
             )
     
+    add_forecast_overlay(fig1, forecasts, 'Revenue', '#1f77b4', row=1, col=1, secondary_y=False)
+    add_forecast_overlay(fig1, forecasts, 'Normal_Orders', '#ff7f0e', row=1, col=1, secondary_y=True)
+    
     fig1.update_xaxes(title_text="Month", row=1, col=1)
     fig1.update_yaxes(title_text="Revenue ($)", row=1, col=1, secondary_y=False)
     fig1.update_yaxes(title_text="Orders", row=1, col=1, secondary_y=True)
@@ -358,7 +752,10 @@ def generate_mom_charts(data):
         showlegend=True,
         hovermode='x unified'
     )
-    st.plotly_chart(fig1, use_container_width=True)
+    show_chart(
+        fig1, use_container_width=True, key='cf_chart_trend',
+        on_select=partial(apply_chart_selection, 'cf_chart_trend', 'YearMonth'), selection_mode='points'
+    )
     
     # 第二張圖：Customers 柱狀圖
     if 'Customer' in mom_df.columns:
@@ -371,14 +768,67 @@ def generate_mom_charts(data):
                 marker=dict(color='#2ca02c')
             )
         )
+        add_forecast_overlay(fig2, forecasts, 'Customer', '#2ca02c')
         fig2.update_xaxes(title_text="Month")
         fig2.update_yaxes(title_text="Customers")
         fig2.update_layout(
             title="Customers Trend",
             height=400,
+            showlegend=forecasts is not None
+        )
+        show_chart(
+            fig2, use_container_width=True, key='cf_chart_customers',
+            on_select=partial(apply_chart_selection, 'cf_chart_customers', 'YearMonth'), selection_mode='points'
+        )
+    
+    # 國家收入柱狀圖（受月份篩選影響，點擊柱可篩選國家）
+    if revenue_col and country_index:
+        country_entry = country_index['dims']['Country']
+        month_only = {'YearMonth': cross_filter['selections'].get('YearMonth', [])}
+        revenue_by_country = masked_group_sum(
+            country_entry['codes'],
+            pd.to_numeric(sales_by_country_df[revenue_col], errors='coerce').to_numpy(),
+            filter_mask(country_index, month_only),
+            len(country_entry['values'])
+        )
+        country_stats = pd.DataFrame({'Country': country_entry['values'], 'Revenue': revenue_by_country})
+        country_stats = country_stats.nlargest(15, 'Revenue')
+        selected_countries = set(cross_filter['selections'].get('Country', []))
+        fig_country = go.Figure()
+        fig_country.add_trace(
+            go.Bar(
+                x=country_stats['Country'],
+                y=country_stats['Revenue'],
+                customdata=country_stats['Country'],
+                name='Revenue',
+                marker=dict(color=['#1f77b4' if not selected_countries or country in selected_countries else '#c7d9ea'
+                                   for country in country_stats['Country']])
+            )
+        )
+        fig_country.update_xaxes(title_text="Country")
+        fig_country.update_yaxes(title_text="Revenue ($)")
+        fig_country.update_layout(
+            title="Revenue by Country (Top 15)",
+            height=400,
             showlegend=False
         )
-        st.plotly_chart(fig2, use_container_width=True)
+        show_chart(
+            fig_country, use_container_width=True, key='cf_chart_country',
+            on_select=partial(apply_chart_selection, 'cf_chart_country', 'Country'), selection_mode='points'
+        )
+    
+    # 各國家收入預測（有國家篩選時只顯示所選國家）
+    if forecasts is not None and include_countries:
+        country_forecast = forecasts['forecast'][forecasts['forecast']['Series'].str.startswith('Country:')].copy()
+        country_forecast['Country'] = country_forecast['Series'].str.slice(len('Country:'))
+        selected_countries = cross_filter['selections'].get('Country', []) if cross_filter else []
+        if selected_countries:
+            country_forecast = country_forecast[country_forecast['Country'].isin(selected_countries)]
+        with st.expander("各國家收入預測"):
+            st.dataframe(
+                country_forecast[['Country', 'YearMonth', 'Forecast', 'Lower', 'Upper']],
+                use_container_width=True, hide_index=True
+            )
     
     # 第三部分：AOV 和 ARPU 分開顯示（左右並排）
     col1, col2 = st.columns(2)
@@ -400,6 +850,7 @@ def generate_mom_charts(data):
                         mode='lines+markers'
                     )
                 )
+                add_forecast_overlay(fig_aov, forecasts, 'AOV', '#9467bd')
                 fig_aov.update_xaxes(title_text="Month")
                 fig_aov.update_yaxes(title_text="AOV ($)")
                 fig_aov.update_layout(
@@ -407,7 +858,7 @@ def generate_mom_charts(data):
                     height=400,
                     showlegend=False
                 )
-                st.plotly_chart(fig_aov, use_container_width=True)
+                show_chart(fig_aov, use_container_width=True)
         
         with col2:
             # 右邊：ARPU 線圖
@@ -422,6 +873,7 @@ def generate_mom_charts(data):
                         mode='lines+markers'
                     )
                 )
+                add_forecast_overlay(fig_arpu, forecasts, 'ARPU', '#8c564b')
                 fig_arpu.update_xaxes(title_text="Month")
                 fig_arpu.update_yaxes(title_text="ARPU ($)")
                 fig_arpu.update_layout(
@@ -429,10 +881,14 @@ def generate_mom_charts(data):
                     height=400,
                     showlegend=False
                 )
-                st.plotly_chart(fig_arpu, use_container_width=True)
+                show_chart(fig_arpu, use_container_width=True)
+
+# RFM 客戶類別的展示順序和顏色（從Champions到Lost：深藍色到深紅色）
+RFM_CATEGORY_ORDER = ['Champions', 'Loyal', 'Potential Loyalist', 'At Risk', 'Lost', 'Unknown']
+RFM_CATEGORY_COLORS = dict(zip(RFM_CATEGORY_ORDER, ['#1a237e', '#3949ab', '#5c6bc0', '#e64a19', '#c62828', '#95a5a6']))
 
 # 生成RFM可視化
-def generate_rfm_visualization(data):
+def generate_rfm_visualization(data, cross_filter=None):
     """生成RFM客戶細分可視化"""
     st.markdown("## 👥 RFM Customer Segmentation")
     
@@ -448,6 +904,11 @@ def generate_rfm_visualization(data):
     # 查找CustomerID列
     customer_id_col = find_column(rfm_df, ['CustomerID', 'Customer ID', 'Customer', 'customer'])
     
+    # 交叉篩選掩碼（Category、IsGuest），與 rfm_df 行序一致
+    rfm_mask = cross_filter_mask(cross_filter, 'rfm')
+    if rfm_mask is None:
+        rfm_mask = np.ones(len(rfm_df), dtype=bool)
+    
     # GUEST vs Others 比較
     if customer_id_col and 'Monetary' in rfm_df.columns:
         # 標識GUEST客戶
@@ -476,7 +937,10 @@ def generate_rfm_visualization(data):
                 color_discrete_map={'GUEST': '#e74c3c', 'Others': '#3498db'}
             )
             fig_guest_monetary.update_layout(height=400, showlegend=False)
-            st.plotly_chart(fig_guest_monetary, use_container_width=True)
+            show_chart(
+                fig_guest_monetary, use_container_width=True, key='cf_chart_guest_monetary',
+                on_select=partial(apply_chart_selection, 'cf_chart_guest_monetary', 'IsGuest'), selection_mode='points'
+            )
         
         with col2:
             # Count比較
@@ -489,31 +953,31 @@ def generate_rfm_visualization(data):
                 color_discrete_map={'GUEST': '#e74c3c', 'Others': '#3498db'}
             )
             fig_guest_count.update_layout(height=400, showlegend=False)
-            st.plotly_chart(fig_guest_count, use_container_width=True)
+            show_chart(
+                fig_guest_count, use_container_width=True, key='cf_chart_guest_count',
+                on_select=partial(apply_chart_selection, 'cf_chart_guest_count', 'IsGuest'), selection_mode='points'
+            )
         
         # 去掉GUEST進行後續分析
         rfm_df_no_guest = rfm_df[~rfm_df['IsGuest']].copy()
+        rfm_mask_no_guest = rfm_mask[~rfm_df['IsGuest'].to_numpy()]
         guest_count = len(rfm_df) - len(rfm_df_no_guest)
         st.info(f"ℹ️ 已排除 {guest_count} 個GUEST客戶，以下分析僅包含註冊客戶")
     else:
         rfm_df_no_guest = rfm_df.copy()
+        rfm_mask_no_guest = rfm_mask
         st.warning("⚠️ 無法識別GUEST客戶，將使用全部數據")
     
     # RFM Scatter Plot (Total Score vs Revenue, color = Category)
     if 'Total_Score' in rfm_df_no_guest.columns and 'Monetary' in rfm_df_no_guest.columns and 'Category' in rfm_df_no_guest.columns:
         st.markdown("### RFM Scatter Plot (Total Score vs Revenue)")
         # 確保Total_Score和Monetary是數值類型
-        rfm_scatter_df = rfm_df_no_guest.copy()
+        rfm_scatter_df = rfm_df_no_guest[rfm_mask_no_guest].copy()
         rfm_scatter_df['Total_Score'] = pd.to_numeric(rfm_scatter_df['Total_Score'], errors='coerce')
         rfm_scatter_df['Monetary'] = pd.to_numeric(rfm_scatter_df['Monetary'], errors='coerce')
         rfm_scatter_df = rfm_scatter_df.dropna(subset=['Total_Score', 'Monetary', 'Category'])
         
         if len(rfm_scatter_df) > 0:
-            # 定義顏色映射（從Champions到Lost：深藍色到深紅色）
-            category_order = ['Champions', 'Loyal', 'Potential Loyalist', 'At Risk', 'Lost', 'Unknown']
-            colors_blue_to_red = ['#1a237e', '#3949ab', '#5c6bc0', '#e64a19', '#c62828', '#95a5a6']
-            color_map = dict(zip(category_order, colors_blue_to_red))
-            
             # 創建散點圖
             # 準備hover_data
             hover_data_list = []
@@ -535,7 +999,7 @@ def generate_rfm_visualization(data):
                     'Monetary': 'Revenue (Monetary)',
                     'Category': 'Category'
                 },
-                color_discrete_map=color_map,
+                color_discrete_map=RFM_CATEGORY_COLORS,
                 hover_data=hover_data_list if hover_data_list else None
             )
             fig_scatter.update_layout(
@@ -544,17 +1008,17 @@ def generate_rfm_visualization(data):
                 yaxis_title='Revenue (Monetary)',
                 showlegend=True
             )
-            st.plotly_chart(fig_scatter, use_container_width=True)
+            show_chart(fig_scatter, use_container_width=True)
+        elif not rfm_mask_no_guest.any():
+            st.info("ℹ️ 沒有符合當前篩選條件的客戶")
         else:
             st.warning("無法創建散點圖：Total_Score和Monetary必須是數值類型")
     
+    # 導出當前篩選的 RFM 客戶（不含GUEST）
+    render_export_buttons(rfm_df_no_guest, 'rfm_customers', 'rfm', rfm_mask_no_guest)
+    
     # Revenue Contribution和Customer Contribution (Pie Charts)
     if 'Category' in rfm_df_no_guest.columns and 'Monetary' in rfm_df_no_guest.columns:
-        # 定義顏色映射（從Champions到Lost：深藍色到深紅色）
-        category_order = ['Champions', 'Loyal', 'Potential Loyalist', 'At Risk', 'Lost', 'Unknown']
-        colors_blue_to_red = ['#1a237e', '#3949ab', '#5c6bc0', '#e64a19', '#c62828', '#95a5a6']
-        color_map = dict(zip(category_order, colors_blue_to_red))
-        
         # 計算各組的Revenue和Count
         # 使用第一列作為計數列（通常是CustomerID或索引）
         count_col = customer_id_col if customer_id_col else rfm_df_no_guest.columns[0]
@@ -565,7 +1029,7 @@ def generate_rfm_visualization(data):
         category_stats.columns = ['Category', 'Revenue', 'Count']
         
         # 確保Category按照定義的順序
-        category_stats['Category'] = pd.Categorical(category_stats['Category'], categories=category_order, ordered=True)
+        category_stats['Category'] = pd.Categorical(category_stats['Category'], categories=RFM_CATEGORY_ORDER, ordered=True)
         category_stats = category_stats.sort_values('Category')
         
         # 計算占比
@@ -574,6 +1038,10 @@ def generate_rfm_visualization(data):
         category_stats['Revenue_Pct'] = (category_stats['Revenue'] / total_revenue * 100).round(2)
         category_stats['Count_Pct'] = (category_stats['Count'] / total_count * 100).round(2)
         
+        # 餅圖作為 Category 篩選器：保留全部類別，突出顯示已選中的類別
+        selected_categories = set(cross_filter['selections'].get('Category', [])) if cross_filter else set()
+        pull = [0.1 if str(cat) in selected_categories else 0 for cat in category_stats['Category']]
+        
         col1, col2 = st.columns(2)
         
         with col1:
@@ -581,8 +1049,10 @@ def generate_rfm_visualization(data):
             fig_revenue_pie = go.Figure(data=[go.Pie(
                 labels=category_stats['Category'],
                 values=category_stats['Revenue'],
+                customdata=category_stats['Category'].astype(str),
+                pull=pull,
                 hole=0.3,
-                marker=dict(colors=[color_map.get(cat, '#95a5a6') for cat in category_stats['Category']]),
+                marker=dict(colors=[RFM_CATEGORY_COLORS.get(cat, RFM_CATEGORY_COLORS['Unknown']) for cat in category_stats['Category']]),
                 textinfo='label+percent',
                 hovertemplate='<b>%{label}</b><br>Revenue: $%{value:,.0f}<br>Percentage: %{percent}<extra></extra>'
             )])
@@ -590,7 +1060,10 @@ def generate_rfm_visualization(data):
                 title='Revenue Contribution by RFM Category',
                 height=500
             )
-            st.plotly_chart(fig_revenue_pie, use_container_width=True)
+            show_chart(
+                fig_revenue_pie, use_container_width=True, key='cf_chart_revenue_pie',
+                on_select=partial(apply_chart_selection, 'cf_chart_revenue_pie', 'Category'), selection_mode='points'
+            )
             
             # 顯示詳細占比
             st.markdown("**Revenue占比：**")
@@ -602,8 +1075,10 @@ def generate_rfm_visualization(data):
             fig_count_pie = go.Figure(data=[go.Pie(
                 labels=category_stats['Category'],
                 values=category_stats['Count'],
+                customdata=category_stats['Category'].astype(str),
+                pull=pull,
                 hole=0.3,
-                marker=dict(colors=[color_map.get(cat, '#95a5a6') for cat in category_stats['Category']]),
+                marker=dict(colors=[RFM_CATEGORY_COLORS.get(cat, RFM_CATEGORY_COLORS['Unknown']) for cat in category_stats['Category']]),
                 textinfo='label+percent',
                 hovertemplate='<b>%{label}</b><br>Count: %{value:,.0f}<br>Percentage: %{percent}<extra></extra>'
             )])
@@ -611,15 +1086,139 @@ def generate_rfm_visualization(data):
                 title='Customer Contribution by RFM Category',
                 height=500
             )
-            st.plotly_chart(fig_count_pie, use_container_width=True)
+            show_chart(
+                fig_count_pie, use_container_width=True, key='cf_chart_count_pie',
+                on_select=partial(apply_chart_selection, 'cf_chart_count_pie', 'Category'), selection_mode='points'
+            )
             
             # 顯示詳細占比
             st.markdown("**Customer占比：**")
             for _, row in category_stats.iterrows():
                 st.write(f"- {row['Category']}: {row['Count']:,.0f} ({row['Count_Pct']:.2f}%)")
 
+# 運行挽留活動模擬（按參數緩存）
+@budgeted_cache
+def run_retention_simulation(rfm_df, campaign, n_draws, seed, cost_per_customer):
+    """按類別整理客戶 Monetary 後運行蒙特卡羅模擬，邏輯位於 retention_simulator.py"""
+    customer_id_col = find_column(rfm_df, ['CustomerID', 'Customer ID', 'Customer', 'customer'])
+    segments = prepare_segments(rfm_df, customer_col=customer_id_col)
+    return simulate_campaign(segments, campaign, n_draws, seed, cost_per_customer=cost_per_customer)
+
+# 生成挽留活動模擬
+def generate_retention_simulator(data):
+    """按 RFM 類別設定喚回概率和消費提升，模擬挽留活動的增量收入分佈"""
+    st.markdown("## 🎯 Retention Campaign Simulator")
+    
+    if data is None:
+        return
+    
+    rfm_df = data['rfm']
+    if len(rfm_df) == 0 or 'Category' not in rfm_df.columns or 'Monetary' not in rfm_df.columns:
+        st.warning("沒有RFM數據（需要 Category 和 Monetary 列），無法模擬挽留活動")
+        return
+    
+    st.caption("被喚回客戶的增量收入 = 歷史 Monetary × 消費提升 × 隨機波動；每次抽樣對每位目標客戶獨立判定是否被喚回（不含GUEST）")
+    
+    categories = sorted(
+        rfm_df['Category'].dropna().astype(str).unique(),
+        key=lambda cat: (RFM_CATEGORY_ORDER.index(cat) if cat in RFM_CATEGORY_ORDER else len(RFM_CATEGORY_ORDER), cat)
+    )
+    defaults = pd.DataFrame({
+        'Category': categories,
+        'Target': [cat in DEFAULT_CAMPAIGN for cat in categories],
+        'Reactivation (%)': [DEFAULT_CAMPAIGN.get(cat, {}).get('reactivation', 0.1) * 100 for cat in categories],
+        'Uplift (%)': [DEFAULT_CAMPAIGN.get(cat, {}).get('uplift', 0.2) * 100 for cat in categories]
+    })
+    
+    # 表單提交後才重新模擬，編輯參數時不觸發 rerun
+    with st.form('retention_form'):
+        params = st.data_editor(
+            defaults,
+            hide_index=True,
+            disabled=['Category'],
+            use_container_width=True,
+            column_config={
+                'Target': st.column_config.CheckboxColumn('Target', help="是否向該類別發起挽留活動"),
+                'Reactivation (%)': st.column_config.NumberColumn(min_value=0.0, max_value=100.0, step=1.0, format='%.1f'),
+                'Uplift (%)': st.column_config.NumberColumn(min_value=0.0, max_value=500.0, step=5.0, format='%.1f')
+            },
+            key='retention_params'
+        )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            n_draws = st.select_slider("抽樣次數", options=[500, 1000, 2000, 5000, 10000], value=N_DRAWS)
+        with col2:
+            cost_per_customer = st.number_input("每位目標客戶成本 ($)", min_value=0.0, value=0.0, step=0.5)
+        with col3:
+            seed = st.number_input("隨機種子", min_value=0, value=0, step=1)
+        st.form_submit_button("運行模擬")
+    
+    targets = params[params['Target']]
+    if len(targets) == 0:
+        st.info("請至少選擇一個目標類別")
+        return
+    campaign = {
+        row['Category']: {'reactivation': row['Reactivation (%)'] / 100, 'uplift': row['Uplift (%)'] / 100}
+        for _, row in targets.iterrows()
+    }
+    
+    result = run_retention_simulation(rfm_df, campaign, int(n_draws), int(seed), float(cost_per_customer))
+    summary = result['summary']
+    if len(summary) == 0:
+        st.warning("所選類別沒有客戶")
+        return
+    
+    total = summary[summary['Segment'] == 'Total'].iloc[0]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Expected Incremental Revenue", f"${total['Revenue_Mean']:,.0f}")
+    with col2:
+        st.metric("90% Interval", f"${total['Revenue_P5']:,.0f} – ${total['Revenue_P95']:,.0f}")
+    with col3:
+        st.metric("Expected Reactivated", f"{total['Reactivated_Mean']:,.0f} / {int(total['Customers']):,}")
+    with col4:
+        st.metric(
+            "Expected Net", f"${total['Net_Mean']:,.0f}",
+            delta=f"P(net > 0) = {total['Prob_Positive_Net']:.0%}", delta_color='off'
+        )
+    
+    draws = result['draws']
+    col1, col2 = st.columns(2)
+    with col1:
+        fig_total = px.histogram(draws, x='Total', nbins=60, title='Total Incremental Revenue Distribution')
+        for quantile_col, dash in [('Revenue_P5', 'dot'), ('Revenue_P50', 'dash'), ('Revenue_P95', 'dot')]:
+            fig_total.add_vline(x=total[quantile_col], line_dash=dash, line_color='#2c3e50')
+        fig_total.update_layout(height=400, xaxis_title='Revenue ($)', yaxis_title='Draws', showlegend=False)
+        show_chart(fig_total, use_container_width=True)
+    with col2:
+        segment_draws = draws.drop(columns='Total').melt(var_name='Segment', value_name='Revenue')
+        fig_segments = px.histogram(
+            segment_draws, x='Revenue', color='Segment', nbins=60, barmode='overlay', opacity=0.6,
+            title='Incremental Revenue by Segment', color_discrete_map=RFM_CATEGORY_COLORS
+        )
+        fig_segments.update_layout(height=400, xaxis_title='Revenue ($)', yaxis_title='Draws')
+        show_chart(fig_segments, use_container_width=True)
+    
+    st.dataframe(
+        summary.style.format({
+            'Customers': '{:,.0f}',
+            'Reactivation': '{:.1%}',
+            'Uplift': '{:.1%}',
+            'Reactivated_Mean': '{:,.0f}',
+            'Revenue_Mean': '${:,.0f}',
+            'Revenue_P5': '${:,.0f}',
+            'Revenue_P50': '${:,.0f}',
+            'Revenue_P95': '${:,.0f}',
+            'Cost': '${:,.0f}',
+            'Net_Mean': '${:,.0f}',
+            'Prob_Positive_Net': '{:.0%}'
+        }, na_rep='–'),
+        use_container_width=True,
+        hide_index=True
+    )
+
 # 生成退貨分析
-def generate_return_analysis(data):
+def generate_return_analysis(data, cross_filter=None):
     """生成退貨分析可視化（使用散點圖）"""
     st.markdown("## 🔄 Return Analysis")
     
@@ -627,7 +1226,10 @@ def generate_return_analysis(data):
         return
     
     # 從MOM數據獲取Return rate和Return amount的月度數據
-    mom_df = filter_2011_data(data.get('mom', pd.DataFrame()))
+    mom_df = filter_period_data(data.get('mom', pd.DataFrame()), current_window())
+    month_mask = cross_filter_mask(cross_filter, 'mom')
+    if month_mask is not None:
+        mom_df = mom_df[month_mask].copy()
     
     # 顯示Return rate線圖和Return amount柱狀圖（同一張圖，雙Y軸）
     if len(mom_df) > 0 and 'Return_Orders' in mom_df.columns and 'Normal_Orders' in mom_df.columns and 'Return' in mom_df.columns:
@@ -673,7 +1275,9 @@ def generate_return_analysis(data):
             showlegend=True,
             hovermode='x unified'
         )
-        st.plotly_chart(fig_return_trend, use_container_width=True)
+        show_chart(fig_return_trend, use_container_width=True)
+    elif month_mask is not None and not month_mask.any():
+        st.info("ℹ️ 沒有符合當前篩選條件的月份")
     else:
         st.info("ℹ️ 無法顯示Return Rate和Return Amount趨勢：缺少MOM數據或必要列")
     
@@ -682,25 +1286,20 @@ def generate_return_analysis(data):
     
     return_product_df = data.get('return_product', pd.DataFrame())
     
-    # 讀取客戶退貨數據（如果存在）
-    try:
-        return_abnormal_file = 'Return and Abnormal_2011_11.xlsx'
-        return_customer_df = pd.read_excel(return_abnormal_file, sheet_name='Return analysis customer')
-    except:
-        try:
-            return_abnormal_file = 'Return and Abnormal.xlsx'
-            return_customer_df = pd.read_excel(return_abnormal_file, sheet_name='Return analysis customer')
-        except:
-            return_customer_df = pd.DataFrame()
+    return_customer_df = data.get('return_customer', pd.DataFrame())
+    # 客戶退貨表按 RFM Category / GUEST 篩選
+    customer_mask = cross_filter_mask(cross_filter, 'return_customer')
+    if customer_mask is not None:
+        return_customer_df = return_customer_df[customer_mask].copy()
     
     col1, col2 = st.columns(2)
     
     # 左邊：產品退貨分析散點圖
     with col1:
         if len(return_product_df) > 0 and 'Return_Amount' in return_product_df.columns and 'Return_Rate' in return_product_df.columns:
-            # 確保有 Category 列，如果沒有則創建
+            # 沒有 Category 列時按 Return_Rate 重新分類
             if 'Category' not in return_product_df.columns:
-                return_product_df['Category'] = 'Unknown'
+                return_product_df['Category'] = classify_returns(return_product_df['Return_Rate'], 'product')
             
             fig_product = px.scatter(
                 return_product_df,
@@ -724,23 +1323,20 @@ def generate_return_analysis(data):
                 }
             )
             fig_product.update_layout(height=500)
-            st.plotly_chart(fig_product, use_container_width=True)
+            show_chart(fig_product, use_container_width=True)
+            render_export_buttons(return_product_df, 'return_products', 'return_product')
         else:
             st.warning("沒有產品退貨數據或缺少必要列")
     
     # 右邊：客戶退貨分析散點圖
     with col2:
         if len(return_customer_df) > 0 and 'Return_Amount' in return_customer_df.columns and 'Return_Rate' in return_customer_df.columns:
-            # 確保有 Category 列，如果沒有則創建
+            # 沒有 Category 列時按 Return_Rate 重新分類
             if 'Category' not in return_customer_df.columns:
-                return_customer_df['Category'] = 'Unknown'
+                return_customer_df['Category'] = classify_returns(return_customer_df['Return_Rate'], 'customer')
             
             # 獲取 CustomerID 列名
-            customer_id_col = None
-            for col in return_customer_df.columns:
-                if 'customer' in col.lower() or 'id' in col.lower():
-                    customer_id_col = col
-                    break
+            customer_id_col = find_column(return_customer_df, ['customer', 'id'])
             
             hover_data = [customer_id_col, 'Return_Count'] if customer_id_col else ['Return_Count']
             
@@ -766,53 +1362,302 @@ def generate_return_analysis(data):
                 }
             )
             fig_customer.update_layout(height=500)
-            st.plotly_chart(fig_customer, use_container_width=True)
+            show_chart(fig_customer, use_container_width=True)
+            render_export_buttons(return_customer_df, 'return_customers', 'return_customer')
+        elif customer_mask is not None and not customer_mask.any():
+            st.info("ℹ️ 沒有符合當前篩選條件的客戶")
         else:
             st.info("沒有客戶退貨數據（可選）")
 
-# 生成可執行洞察
-def generate_insights(data):
-    """自動生成可執行洞察"""
-    st.markdown("## 💡 Actionable Insights - 2011/11")
+# 打開明細查詢索引（只讀快照，整個進程共用；按文件修改時間緩存，重新構建後自動重新打開）
+@st.cache_resource(max_entries=4)
+def open_cached_drilldown_index(name, mtime):
+    """打開由 drilldown_index.py 預先構建的快照和偏移量索引"""
+    return open_drilldown_index(name, DRILLDOWN_DIR)
+
+# 獲取明細查詢索引
+def get_drilldown_index(name):
+    """索引文件不存在時返回 None（不緩存），之後構建的索引在下次 rerun 即可使用"""
+    mtime = drilldown_index_mtime(name, DRILLDOWN_DIR)
+    if mtime is None:
+        return None
+    return open_cached_drilldown_index(name, mtime)
+
+# 生成客戶/產品明細查詢
+def generate_drilldown(data):
+    """按 CustomerID 或 StockCode 查詢完整交易明細"""
+    st.markdown("## 🔍 Customer & Product Drill-down")
+    
+    if data is None:
+        return
+    
+    customer_index = get_drilldown_index('customer')
+    product_index = get_drilldown_index('product')
+    if customer_index is None and product_index is None:
+        st.info(f"ℹ️ 未找到明細查詢索引目錄 {DRILLDOWN_DIR}（可選）")
+        st.code('python drilldown_index.py "Online Retail.xlsx"')
+        return
+    
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        options = []
+        if customer_index is not None:
+            options.append('CustomerID')
+        if product_index is not None:
+            options.append('StockCode')
+        key_type = st.radio("查詢維度", options, key='drilldown_key_type')
+    with col2:
+        key = st.text_input(f"輸入 {key_type}", key='drilldown_key', placeholder='例如 17850 或 85123A')
+    
+    if not key:
+        return
     
-    insights = []
+    index = customer_index if key_type == 'CustomerID' else product_index
+    detail_df = lookup(index, key)
+    
+    if len(detail_df) == 0:
+        st.warning(f"找不到 {key_type} = {key} 的交易記錄")
+        return
+    
+    # 摘要指標
+    metric_cols = st.columns(3)
+    with metric_cols[0]:
+        st.metric(label="Lines", value=f"{len(detail_df):,}")
+    if 'InvoiceNo' in detail_df.columns:
+        with metric_cols[1]:
+            st.metric(label="Invoices", value=f"{detail_df['InvoiceNo'].nunique():,}")
+    if 'Quantity' in detail_df.columns and 'UnitPrice' in detail_df.columns:
+        amount = (pd.to_numeric(detail_df['Quantity'], errors='coerce') * pd.to_numeric(detail_df['UnitPrice'], errors='coerce')).sum()
+        with metric_cols[2]:
+            st.metric(label="Net Amount", value=f"${amount:,.0f}")
+    
+    st.dataframe(detail_df, use_container_width=True, hide_index=True)
+
+# 加載商品關聯索引（只讀索引，整個進程共用；按文件修改時間緩存，重新構建後自動重新加載）
+@st.cache_resource(max_entries=2)
+def read_affinity_index(mtime):
+    """加載由 affinity_engine.py 預先構建的關聯索引"""
+    return load_affinity_index(AFFINITY_INDEX_FILE)
+
+# 獲取商品關聯索引
+def get_affinity_index():
+    """索引文件不存在時返回 None（不緩存），之後構建的索引在下次 rerun 即可使用"""
+    if not os.path.exists(AFFINITY_INDEX_FILE):
+        return None
+    return read_affinity_index(os.path.getmtime(AFFINITY_INDEX_FILE))
+
+# 生成商品關聯分析
+def generate_affinity_analysis(data):
+    """生成熱門 SKU 的「經常一起購買」分析"""
+    st.markdown("## 🛒 Frequently Bought Together")
     
     if data is None:
         return
     
-    mom_df = filter_2011_data(data['mom'])
-    rfm_df = data['rfm']
-    return_product_df = data['return_product']
-    
-    # 洞察1：異常退貨高峰月份
-    if len(mom_df) > 0 and 'Return_Orders' in mom_df.columns:
-        # 計算每個月的退貨率
-        if 'Normal_Orders' in mom_df.columns:
-            mom_df['Monthly_Return_Rate'] = (mom_df['Return_Orders'] / 
-                                             (mom_df['Return_Orders'] + mom_df['Normal_Orders']) * 100)
-            avg_return_rate = mom_df['Monthly_Return_Rate'].mean()
-            high_return_months = mom_df[mom_df['Monthly_Return_Rate'] > avg_return_rate * 1.5]
-            
-            if len(high_return_months) > 0:
-                months_str = ', '.join(high_return_months['YearMonth'].astype(str).tolist())
-                insights.append(f"⚠️ **異常退貨高峰月份**: {months_str} 的退貨率明顯高於平均水平")
-    
-    # 洞察2：客戶活動下降的細分
-    if len(rfm_df) > 0 and 'Category' in rfm_df.columns:
-        at_risk_count = len(rfm_df[rfm_df['Category'] == 'At Risk'])
-        lost_count = len(rfm_df[rfm_df['Category'] == 'Lost'])
-        total_customers = len(rfm_df)
-        
-        if at_risk_count + lost_count > total_customers * 0.3:
-            insights.append(f"📉 **客戶流失風險**: {at_risk_count + lost_count} 個客戶（{((at_risk_count + lost_count)/total_customers*100):.1f}%）處於'At Risk'或'Lost'狀態，需要立即採取保留措施")
+    render_export_buttons(data.get('sku', pd.DataFrame()), 'sku', 'sku')
+    
+    index = get_affinity_index()
+    if index is None:
+        st.info(f"ℹ️ 未找到商品關聯索引 {AFFINITY_INDEX_FILE}（可選）")
+        st.code('python affinity_engine.py "Online Retail.xlsx" --sku-file 彙總表.xlsx --top-skus 500')
+        return
+    
+    # 候選 SKU：SKU 表中的熱門 SKU，沒有 SKU 表時使用索引中的全部 SKU
+    sku_df = data.get('sku', pd.DataFrame())
+    stock_code_col = find_column(sku_df, ['StockCode', 'Stock Code'])
+    top_skus = top_skus_from_sheet(sku_df, 100, stock_code_col) if stock_code_col else None
+    indexed_skus = pd.unique(index['StockCode'])
+    if top_skus:
+        indexed_set = set(indexed_skus)
+        candidate_skus = [sku for sku in top_skus if sku in indexed_set]
+    else:
+        candidate_skus = indexed_skus.tolist()
+    
+    if len(candidate_skus) == 0:
+        st.warning("關聯索引中沒有 SKU 表的熱門 SKU，請重新構建索引")
+        return
+    
+    selected_sku = st.selectbox("選擇 SKU", candidate_skus, key='affinity_sku')
+    neighbors = query_affinity(index, selected_sku)
+    
+    if len(neighbors) == 0:
+        st.info(f"SKU {selected_sku} 沒有滿足最低支持度的關聯商品")
+        return
+    
+    if 'N_Invoices' in index:
+        st.caption(f"支持度、置信度和提升度以全部 {int(index['N_Invoices']):,} 張銷售發票（包括單品發票）計算")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        fig_affinity = px.bar(
+            neighbors.iloc[::-1],
+            x='Lift',
+            y='Neighbor',
+            orientation='h',
+            color='Confidence',
+            color_continuous_scale='Blues',
+            hover_data=['Co_Count', 'Support', 'Confidence'],
+            title=f'Frequently Bought Together: {selected_sku}'
+        )
+        fig_affinity.update_layout(height=400)
+        show_chart(fig_affinity, use_container_width=True)
+    
+    with col2:
+        st.dataframe(neighbors, use_container_width=True, hide_index=True)
+        render_export_buttons(neighbors, f'bought_together_{selected_sku}', 'affinity')
+
+# 計算異常分數（緩存結果，避免每次 rerun 重新評分）
+@budgeted_cache
+def compute_abnormal_scores(abnormal_product_df, sales_by_country_df, window):
+    """對異常產品表和國家×月份序列批量評分"""
+    product_scores = pd.DataFrame()
+    country_scores = pd.DataFrame()
+    country_cells = pd.DataFrame()
+
+    # 產品評分：有月份列時按序列評分，否則對所有數值列做橫截面評分
+    stock_code_col = find_column(abnormal_product_df, ['StockCode', 'Stock Code', 'Product'])
+    if stock_code_col:
+        month_col = find_column(abnormal_product_df, ['YearMonth', 'Month'])
+        metric_cols = [
+            col for col in abnormal_product_df.select_dtypes(include='number').columns
+            if col != stock_code_col
+        ]
+        if month_col and metric_cols:
+            value_col = find_column(abnormal_product_df[metric_cols], ['Return', 'Quantity', 'Amount']) or metric_cols[0]
+            product_scores, _ = score_series(abnormal_product_df, stock_code_col, month_col, value_col)
+        else:
+            product_scores = score_products(abnormal_product_df, stock_code_col, metric_cols)
+
+    # 國家×月份評分
+    country_col = find_column(sales_by_country_df, ['Country'])
+    month_col = find_column(sales_by_country_df, ['YearMonth', 'Month'])
+    value_col = find_column(sales_by_country_df, ['Revenue', 'Sales', 'Amount'])
+    if country_col and month_col and value_col:
+        country_scores, country_cells = score_series(
+            filter_period_data(sales_by_country_df.copy(), window, month_col), country_col, month_col, value_col
+        )
+
+    return {
+        'product': product_scores,
+        'country': country_scores,
+        'country_cells': country_cells
+    }
+
+# 生成異常產品分析
+def generate_abnormal_analysis(data):
+    """生成異常產品與國家×月份異常排名"""
+    st.markdown("## 🚨 Abnormal Product Detection")
+
+    if data is None:
+        return
+
+    abnormal_product_df = data.get('abnormal_product', pd.DataFrame())
+    sales_by_country_df = data.get('sales_by_country', pd.DataFrame())
+
+    if len(abnormal_product_df) == 0 and len(sales_by_country_df) == 0:
+        st.info("ℹ️ 沒有異常產品或國家銷售數據（可選）")
+        return
+
+    scores = compute_abnormal_scores(abnormal_product_df, sales_by_country_df, current_window())
+    st.caption(f"異常分數 = 穩健 z-score（median/MAD）最大絕對值，超過 {ANOMALY_Z_THRESHOLD} 視為異常")
+
+    product_scores = scores['product']
+    col1, col2 = st.columns(2)
+
+    with col1:
+        if len(product_scores) > 0:
+            key_col = product_scores.columns[0]
+            top_products = product_scores.head(20).copy()
+            top_products[key_col] = top_products[key_col].astype(str)
+            fig_product_anomaly = px.bar(
+                top_products.iloc[::-1],
+                x='Anomaly_Score',
+                y=key_col,
+                orientation='h',
+                title='Top 20 Abnormal Products',
+                labels={'Anomaly_Score': 'Anomaly Score', key_col: key_col},
+                color='Anomaly_Score',
+                color_continuous_scale='Reds'
+            )
+            fig_product_anomaly.add_vline(x=ANOMALY_Z_THRESHOLD, line_dash='dash', line_color='#95a5a6')
+            fig_product_anomaly.update_layout(height=500, coloraxis_showscale=False)
+            show_chart(fig_product_anomaly, use_container_width=True)
+        else:
+            st.info("沒有可評分的異常產品數據（需要 StockCode 列和數值列）")
+
+    with col2:
+        country_cells = scores['country_cells']
+        if len(scores['country']) > 0:
+            st.markdown("**國家×月份異常**")
+            if len(country_cells) > 0:
+                st.dataframe(country_cells.head(20), use_container_width=True, hide_index=True)
+            else:
+                st.write("沒有超過門檻的國家×月份組合")
+        else:
+            st.info("沒有可評分的國家銷售數據（需要 Country、YearMonth 和 Revenue 列）")
+
+    if len(product_scores) > 0:
+        with st.expander("查看全部產品異常排名"):
+            st.dataframe(product_scores, use_container_width=True, hide_index=True)
+
+# 批量評估洞察規則
+@budgeted_cache
+def compute_insights(mom_df, rfm_df, return_product_df, return_customer_df, sales_by_country_df, abnormal_product_df, rules, window):
+    """整理規則使用的數據表（列名統一為規則中的名稱），一次批量評估所有洞察規則，返回 (洞察列表, 警告列表)"""
+    tables = {
+        'mom': filter_period_data(mom_df.copy(), window),
+        'rfm': rfm_df,
+        'return_product': return_product_df,
+        'return_customer': return_customer_df
+    }
+
+    country_col = find_column(sales_by_country_df, ['Country'])
+    month_col = find_column(sales_by_country_df, ['YearMonth', 'Month'])
+    value_col = find_column(sales_by_country_df, ['Revenue', 'Sales', 'Amount'])
+    if country_col and month_col and value_col:
+        sales_by_country = sales_by_country_df.rename(
+            columns={country_col: 'Country', month_col: 'YearMonth', value_col: 'Revenue'}
+        )
+        tables['sales_by_country'] = filter_period_data(sales_by_country.copy(), window)
+
+    # 異常評分結果：產品表第一列為產品鍵，國家×月份表前兩列為國家和月份
+    if len(abnormal_product_df) > 0 or len(sales_by_country_df) > 0:
+        scores = compute_abnormal_scores(abnormal_product_df, sales_by_country_df, window)
+        if len(scores['product']) > 0:
+            tables['product_scores'] = scores['product'].rename(columns={scores['product'].columns[0]: 'StockCode'})
+        if len(scores['country_cells']) > 0:
+            cell_columns = scores['country_cells'].columns
+            tables['country_cells'] = scores['country_cells'].rename(
+                columns={cell_columns[0]: 'Country', cell_columns[1]: 'YearMonth'}
+            )
+
+    return evaluate_rules(tables, rules)
+
+# 生成可執行洞察
+def generate_insights(data):
+    """自動生成可執行洞察（規則定義見 insight_rules.py，可用 insight_rules.json 添加或覆蓋規則）"""
+    st.markdown(f"## 💡 Actionable Insights - {current_window()[1].replace('-', '/')}")
+    
+    if data is None:
+        return
     
-    # 洞察3：造成最多收入損失的產品
-    if len(return_product_df) > 0 and 'Return_Amount' in return_product_df.columns:
-        top_loss_products = return_product_df.nlargest(5, 'Return_Amount')
-        if len(top_loss_products) > 0:
-            products_str = ', '.join(top_loss_products['StockCode'].astype(str).tolist())
-            total_loss = top_loss_products['Return_Amount'].sum()
-            insights.append(f"💰 **高損失產品**: 產品 {products_str} 造成了最多的退貨損失（總計 ${abs(total_loss):,.0f}），建議檢查產品質量或客戶服務流程")
+    rules, rule_errors = load_rules()
+    for error in rule_errors:
+        st.warning(f"⚠️ 洞察規則無效，已跳過: {error}")
+    
+    insights, rule_warnings = compute_insights(
+        data['mom'],
+        data['rfm'],
+        data['return_product'],
+        data.get('return_customer', pd.DataFrame()),
+        data.get('sales_by_country', pd.DataFrame()),
+        data.get('abnormal_product', pd.DataFrame()),
+        rules,
+        current_window()
+    )
+    for warning in rule_warnings:
+        st.warning(f"⚠️ 洞察規則無法評估，已跳過: {warning}")
     
     # 顯示洞察
     if len(insights) > 0:
@@ -820,21 +1665,86 @@ def generate_insights(data):
             st.markdown(f"""
             <div class="insight-box">
                 <strong>洞察 {i}:</strong><br>
-                {insight}
+                {insight['icon']} **{insight['title']}**: {insight['message']}
             </div>
             """, unsafe_allow_html=True)
     else:
         st.info("暫時沒有可用的洞察")
 
+# 格式化字節數
+def format_bytes(n_bytes):
+    """1536 -> '1.5 KB'"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n_bytes) < 1024 or unit == 'GB':
+            return f"{n_bytes:,.0f} {unit}" if unit == 'B' else f"{n_bytes:,.1f} {unit}"
+        n_bytes /= 1024
+
+# 管理員令牌的環境變量（服務器端設置；未設置時不顯示管理員視圖）
+ADMIN_TOKEN_ENV = 'DASHBOARD_ADMIN_TOKEN'
+
+# 檢查是否顯示管理員視圖
+def is_admin_request():
+    """服務器設置了 DASHBOARD_ADMIN_TOKEN，且 URL 參數 ?admin= 與之相同時返回 True"""
+    token = os.environ.get(ADMIN_TOKEN_ENV, '')
+    if not token:
+        return False
+    supplied = st.query_params.get('admin', '')
+    return hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8'))
+
+# 生成緩存監控（管理員視圖，見 is_admin_request）
+def generate_cache_admin():
+    """顯示緩存佔用的內存、命中率和淘汰次數（緩存邏輯位於 cache_budget.py）"""
+    st.markdown("## 🛠 Cache Monitor")
+    
+    stats = cache_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Bytes Held", format_bytes(stats['bytes']),
+                  f"{stats['bytes'] / stats['global_budget']:.0%} of {format_bytes(stats['global_budget'])}",
+                  delta_color="off")
+    with col2:
+        st.metric("Entries", f"{stats['entries']:,}")
+    with col3:
+        st.metric("Hit Rate", f"{stats['hit_rate']:.1%}" if stats['hits'] + stats['misses'] > 0 else "N/A",
+                  f"{stats['hits']:,} hits / {stats['misses']:,} misses", delta_color="off")
+    with col4:
+        st.metric("Evictions", f"{stats['evictions']:,}")
+    st.caption(f"每個會話的預算: {format_bytes(stats['session_budget'])}；淘汰順序為按重算成本加權的 LRU")
+    
+    if len(stats['functions']) > 0:
+        st.markdown("### By Function")
+        functions = stats['functions'].copy()
+        functions['Bytes'] = functions['Bytes'].map(format_bytes)
+        st.dataframe(functions.style.format({'Hit_Rate': '{:.1%}', 'Avg_Compute_Seconds': '{:.3f}'}, na_rep='-'),
+                     use_container_width=True, hide_index=True)
+    if len(stats['sessions']) > 0:
+        st.markdown("### By Session")
+        sessions = stats['sessions'].copy()
+        sessions['Bytes'] = sessions['Bytes'].map(format_bytes)
+        st.dataframe(sessions.style.format({'Idle_Seconds': '{:,.0f}'}),
+                     use_container_width=True, hide_index=True)
+    st.button("清空緩存", key='cache_clear', on_click=clear_cache)
+
 # 主函數
 def main():
     # 顯示標題
     st.title("📊 E-commerce Dashboard")
-    st.markdown("**數據分析時間範圍: 2011年1月 - 2011年11月**")
     
-    # 顯示加載狀態
-    with st.spinner("正在加載數據..."):
-        data = load_data()
+    # 有分區數據集（dataset/manifest.json）時按門店和期間加載，否則讀取單一彙總表
+    manifest = read_manifest(DATASET_DIR)
+    selection = render_dataset_selector(manifest) if manifest is not None else None
+    if selection is not None:
+        store, window = selection
+        st.session_state['data_window'] = window
+        st.markdown(f"**門店: {store} | 數據分析時間範圍: {format_window(window)}**")
+        with st.spinner("正在加載數據..."):
+            data = load_partitioned_data(manifest, store, window)
+    else:
+        st.session_state['data_window'] = DEFAULT_DATA_WINDOW
+        st.markdown(f"**數據分析時間範圍: {format_window(DEFAULT_DATA_WINDOW)}**")
+        # 顯示加載狀態
+        with st.spinner("正在加載數據..."):
+            data = load_data()
     
     if data is None:
         st.error("❌ 無法加載數據")
@@ -850,6 +1760,7 @@ def main():
         st.write("   - Abnormal analysis product")
         st.markdown("---")
         st.info("💡 提示: 請先運行 `execute_prompt.py` 生成 彙總表.xlsx")
+        st.info("💡 多門店 / 多期間: 運行 `python partitioned_dataset.py ingest --store <門店> 彙總表.xlsx \"Return and Abnormal_2011_11.xlsx\"` 生成 dataset/ 分區數據集")
         return
     
     # 檢查關鍵數據
@@ -858,9 +1769,16 @@ def main():
         st.info("請檢查 彙總表.xlsx 是否包含 MOM 工作表")
         return
     
+    # 交叉篩選（側邊欄 + 圖表點擊）
+    cross_filter = None
+    try:
+        cross_filter = render_cross_filters(data)
+    except Exception as e:
+        st.sidebar.error(f"構建交叉篩選時發生錯誤: {e}")
+    
     # 生成KPI
     try:
-        generate_kpi(data)
+        generate_kpi(data, cross_filter)
     except Exception as e:
         st.error(f"生成 KPI 時發生錯誤: {e}")
         import traceback
@@ -870,7 +1788,7 @@ def main():
     
     # 生成月度趨勢
     try:
-        generate_mom_charts(data)
+        generate_mom_charts(data, cross_filter)
     except Exception as e:
         st.error(f"生成月度趨勢圖表時發生錯誤: {e}")
         import traceback
@@ -880,7 +1798,7 @@ def main():
     
     # 生成RFM可視化
     try:
-        generate_rfm_visualization(data)
+        generate_rfm_visualization(data, cross_filter)
     except Exception as e:
         st.error(f"生成 RFM 可視化時發生錯誤: {e}")
         import traceback
@@ -888,9 +1806,19 @@ def main():
     
     st.divider()
     
+    # 生成挽留活動模擬
+    try:
+        generate_retention_simulator(data)
+    except Exception as e:
+        st.error(f"生成挽留活動模擬時發生錯誤: {e}")
+        import traceback
+        st.code(traceback.format_exc())
+    
+    st.divider()
+    
     # 生成退貨分析
     try:
-        generate_return_analysis(data)
+        generate_return_analysis(data, cross_filter)
     except Exception as e:
         st.error(f"生成退貨分析時發生錯誤: {e}")
         import traceback
@@ -898,6 +1826,36 @@ def main():
     
     st.divider()
     
+    # 生成明細查詢
+    try:
+        generate_drilldown(data)
+    except Exception as e:
+        st.error(f"生成明細查詢時發生錯誤: {e}")
+        import traceback
+        st.code(traceback.format_exc())
+    
+    st.divider()
+    
+    # 生成商品關聯分析
+    try:
+        generate_affinity_analysis(data)
+    except Exception as e:
+        st.error(f"生成商品關聯分析時發生錯誤: {e}")
+        import traceback
+        st.code(traceback.format_exc())
+    
+    st.divider()
+    
+    # 生成異常產品分析
+    try:
+        generate_abnormal_analysis(data)
+    except Exception as e:
+        st.error(f"生成異常產品分析時發生錯誤: {e}")
+        import traceback
+        st.code(traceback.format_exc())
+    
+    st.divider()
+    
     # 生成洞察
     try:
         generate_insights(data)
@@ -905,6 +1863,16 @@ def main():
         st.error(f"生成洞察時發生錯誤: {e}")
         import traceback
         st.code(traceback.format_exc())
+    
+    # 生成緩存監控（管理員視圖）
+    if is_admin_request():
+        st.divider()
+        try:
+            generate_cache_admin()
+        except Exception as e:
+            st.error(f"生成緩存監控時發生錯誤: {e}")
+            import traceback
+            st.code(traceback.format_exc())
 
 if __name__ == "__main__":
     main()